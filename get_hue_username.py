@@ -9,8 +9,17 @@ import http.client
 import time
 import sys
 
+from hue_discovery import find_bridges
+
 def get_bridge_ip():
-    """Ask the user for the Hue Bridge IP address."""
+    """Find the Hue Bridge on the network, or ask the user for its IP address."""
+    print("Searching the network for Hue Bridges...")
+    bridges = find_bridges()
+    if bridges:
+        print(f"Found Hue Bridge {bridges[0]['name']} at {bridges[0]['address']}")
+        return bridges[0]['address']
+    
+    print("No Hue Bridge found on the network.")
     print("To get your Hue Bridge IP address, you can:")
     print("1. Check the Philips Hue app (Settings > Hue Bridges > i)")
     print("2. Log into your router and look for the device")
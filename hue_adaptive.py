@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Adaptive frame rate - lowers the number of steps per color cycle when the Hue Bridge
+can't keep up with the light show, and raises it again when there's headroom. The
+bridge's own fading (a longer transition time) fills in the motion between steps.
+"""
+
+import math
+import time
+
+from hue_frame_table import TOTAL_STEPS
+
+# Steps per cycle to choose from, fastest first (all divide 360, so hue steps stay even)
+STEP_LEVELS = (TOTAL_STEPS, 180, 120, 90, 72, 60, 45, 40, 36, 30, 24, 20, 18, 15, 12, 10, 9, 8, 6)
+ADAPT_INTERVAL = 2.0  # Seconds between step rate decisions
+LOSS_THRESHOLD = 0.05  # Fraction of light commands that may miss their frame before slowing down
+HEADROOM = 0.7  # Only speed up if the faster rate would use at most this share of the bridge's capacity
+HEADROOM_EVALUATIONS = 3  # Calm evaluations in a row needed before speeding up
+
+
+class AdaptiveFrameRate:
+    """Chooses the steps per cycle from the bridge schedulers' throughput and latency.
+
+    With several bridges, the busiest one sets the pace.
+    """
+
+    def __init__(self, schedulers, levels=STEP_LEVELS, interval=ADAPT_INTERVAL, enabled=True):
+        self.schedulers = list(schedulers)
+        self.levels = levels
+        self.interval = interval
+        self.enabled = enabled
+        self.level = 0  # Index into levels
+
+        # Counted since the last evaluation
+        self.commands = [0] * len(self.schedulers)  # Per scheduler
+        self.frames = 0
+        self.calm_evaluations = 0
+        self.last_evaluation = time.monotonic()
+        self.last_missed = self._missed()
+
+    @property
+    def steps(self):
+        """Steps per cycle to use now."""
+        return self.levels[self.level] if self.enabled else self.levels[0]
+
+    def set_enabled(self, enabled):
+        """Turn adaptation on or off; turning it off goes back to the full step count."""
+        self.enabled = enabled
+        self.level = 0
+        self.calm_evaluations = 0
+
+    def _missed(self):
+        return sum(scheduler.missed for scheduler in self.schedulers)
+
+    def record_frame(self, commands):
+        """Count the light commands a frame sent to each scheduler (a sequence in scheduler order)."""
+        for index, count in enumerate(commands):
+            self.commands[index] += count
+        self.frames += 1
+
+    def update(self, cycle_time):
+        """Re-evaluate the step rate at most once per interval. Returns True if it changed."""
+        now = time.monotonic()
+        if now - self.last_evaluation < self.interval:
+            return False
+
+        missed = self._missed()
+        lost = missed - self.last_missed
+        commands, frames = self.commands, self.frames
+        self.last_missed = missed
+        self.last_evaluation = now
+        self.commands = [0] * len(self.schedulers)
+        self.frames = 0
+
+        if not self.enabled or not frames:
+            return False
+
+        # Light commands per second each step count would need, against what each bridge can take
+        capacities = [scheduler.light_capacity() for scheduler in self.schedulers]
+
+        def load(level):
+            return max(count / frames * self.levels[level] / cycle_time / capacity
+                       for count, capacity in zip(commands, capacities))
+
+        last_level = len(self.levels) - 1
+        if lost > LOSS_THRESHOLD * sum(commands) or load(self.level) > 1:
+            # Falling behind: drop to the fastest step rate the bridges can sustain
+            self.calm_evaluations = 0
+            level = min(self.level + 1, last_level)
+            while level < last_level and load(level) > 1:
+                level += 1
+        elif self.level > 0:
+            self.calm_evaluations += 1
+            level = self.level
+            if self.calm_evaluations >= HEADROOM_EVALUATIONS and load(self.level - 1) <= HEADROOM:
+                self.calm_evaluations = 0
+                level = self.level - 1
+        else:
+            return False
+
+        changed = level != self.level
+        self.level = level
+        return changed
+
+    def transition_time(self, transition_time, cycle_time):
+        """Stretch the transition time so the bridge's fade covers a whole step."""
+        if not self.enabled:
+            return transition_time
+        step_time = math.ceil(cycle_time / self.steps * 10) / 10  # Hue transitions are in 1/10 s
+        return max(transition_time, step_time)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Audio-reactive input - streams audio from a WAV file, raw PCM on stdin or an ALSA
+capture device, analyzes it in its own thread (FFT band energies, onsets, smoothing)
+and publishes the latest targets for the light show to pick up each frame.
+
+Usage (offline analysis of a WAV file, e.g. to check onsets and DSP cost):
+    python hue_audio.py song.wav
+"""
+
+import sys
+import time
+import wave
+import argparse
+import threading
+import subprocess
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+import hue_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+AUDIO_RATE = 44100  # Sample rate of stdin and ALSA input
+AUDIO_CHANNELS = 2
+CHUNK_FRAMES = 512  # Samples read (and analyzed) at a time: about 12 ms at 44.1 kHz
+FFT_SIZE = 2048  # Ring buffer length analyzed per chunk
+BANDS = ((20, 250), (250, 2000), (2000, 8000))  # Bass, mid and treble, in Hz
+ATTACK = 0.6  # Envelope weight of a rising value (fast)
+RELEASE = 0.08  # Envelope weight of a falling value (slow)
+PEAK_DECAY = 0.999  # Per chunk decay of the automatic gain's peak (a few seconds)
+ONSET_HISTORY = 43  # Chunks of spectral flux the onset threshold looks back over (about 0.5 s)
+ONSET_SENSITIVITY = 1.5  # Standard deviations above the mean flux that count as an onset
+ONSET_MIN_INTERVAL = 0.1  # Seconds between onsets
+
+AUDIO_DSP_SECONDS = metrics.histogram(
+    'hue_audio_dsp_seconds', "Time spent analyzing one audio chunk")
+
+# Per-frame targets: level and band energies are 0-1 (normalized to recent peaks), onsets counts
+# every onset so far, and captured is the time.monotonic() the newest analyzed audio was read
+AudioTargets = namedtuple('AudioTargets', ['level', 'bass', 'mid', 'treble', 'onsets', 'captured'])
+
+
+class AudioError(Exception):
+    """Raised when an audio source can't be opened or read."""
+
+
+class PCMSource:
+    """Signed 16-bit little-endian PCM from a binary stream."""
+
+    def __init__(self, stream, rate=AUDIO_RATE, channels=AUDIO_CHANNELS, name='pcm'):
+        self.stream = stream
+        self.rate = rate
+        self.channels = channels
+        self.name = name
+
+    def read(self, frames):
+        """Read up to frames samples per channel as an int16 array of shape (frames, channels); None at the end."""
+        size = frames * self.channels * 2
+        data = self.stream.read(size)
+        # A stream that ends part way through a frame leaves that frame incomplete; it's dropped
+        data = data[:len(data) - len(data) % (self.channels * 2)]
+        if not data:
+            return None
+        return np.frombuffer(data, dtype='<i2').reshape(-1, self.channels)
+
+    def close(self):
+        pass
+
+
+class WavSource(PCMSource):
+    """A 16-bit WAV file, read at playback speed (realtime) or as fast as possible (offline)."""
+
+    def __init__(self, path, realtime=True, loop=False):
+        try:
+            self.wav = wave.open(path, 'rb')
+        except (OSError, wave.Error) as e:
+            raise AudioError(f"Can't open {path}: {e}")
+        if self.wav.getsampwidth() != 2:
+            raise AudioError(f"{path} isn't 16-bit PCM")
+
+        super().__init__(None, self.wav.getframerate(), self.wav.getnchannels(), path)
+        self.realtime = realtime
+        self.loop = loop
+        self.started = None
+        self.frames_read = 0
+
+    def read(self, frames):
+        data = self.wav.readframes(frames)
+        if not data and self.loop:
+            self.wav.rewind()
+            data = self.wav.readframes(frames)
+        if not data:
+            return None
+
+        samples = np.frombuffer(data, dtype='<i2').reshape(-1, self.channels)
+        if self.realtime:
+            # Hand out audio no faster than it would play, like a capture device
+            if self.started is None:
+                self.started = time.monotonic()
+            self.frames_read += len(samples)
+            delay = self.started + self.frames_read / self.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return samples
+
+    def close(self):
+        self.wav.close()
+
+
+class AlsaSource(PCMSource):
+    """Capture from an ALSA device (e.g. a loopback) through arecord, so no Python audio package is needed."""
+
+    def __init__(self, device, rate=AUDIO_RATE, channels=AUDIO_CHANNELS):
+        command = ['arecord', '-q', '-D', device, '-f', 'S16_LE', '-r', str(rate), '-c', str(channels), '-t', 'raw',
+                   '--buffer-size', str(CHUNK_FRAMES * 2)]
+        try:
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        except OSError as e:
+            raise AudioError(f"Can't start arecord (is alsa-utils installed?): {e}")
+        super().__init__(self.process.stdout, rate, channels, f"alsa:{device}")
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def open_audio_source(spec, realtime=True):
+    """Open an audio source from a spec: "wav:PATH", "stdin" or "alsa:DEVICE" (e.g. "alsa:hw:Loopback,1,0").
+
+    stdin and ALSA input are 16-bit little-endian at AUDIO_RATE with AUDIO_CHANNELS.
+    WAV files loop when they're played in real time.
+    """
+    kind, _, argument = spec.partition(':')
+    if kind == 'wav' and argument:
+        return WavSource(argument, realtime=realtime, loop=realtime)
+    if kind == 'stdin':
+        return PCMSource(sys.stdin.buffer, name='stdin')
+    if kind == 'alsa' and argument:
+        return AlsaSource(argument)
+    raise AudioError(f"Unknown audio source: {spec}")
+
+
+class AudioAnalyzer:
+    """Streams an audio source through the analysis and keeps the latest AudioTargets.
+
+    Chunks go into a ring buffer of the last FFT_SIZE samples. Each chunk updates the band
+    energies of the windowed spectrum, the spectral flux used for onset detection and
+    the smoothed, auto-gained envelopes.
+    """
+
+    def __init__(self, source, chunk_frames=CHUNK_FRAMES, fft_size=FFT_SIZE):
+        self.source = source
+        self.chunk_frames = chunk_frames
+        self.ring = np.zeros(fft_size, dtype=np.float32)
+        self.window = np.hanning(fft_size).astype(np.float32)
+
+        # Spectrum bins of each band, as reduceat boundaries
+        freqs = np.fft.rfftfreq(fft_size, 1 / source.rate)
+        edges = [int(np.searchsorted(freqs, low)) for low, _ in BANDS] + [int(np.searchsorted(freqs, BANDS[-1][1]))]
+        self.band_starts = np.array(edges, dtype=np.intp)
+        self.band_sizes = np.maximum(np.diff(self.band_starts), 1)
+
+        # Level + one value per band
+        self.envelope = np.zeros(len(BANDS) + 1)
+        self.peak = np.full(len(BANDS) + 1, 1e-6)
+        self.previous_magnitude = None
+        self.flux_history = np.zeros(ONSET_HISTORY)
+        self.flux_index = 0
+        self.onsets = 0
+        self.last_onset = -ONSET_MIN_INTERVAL
+        self.audio_time = 0.0  # Seconds of audio analyzed
+
+        self.targets = AudioTargets(0.0, 0.0, 0.0, 0.0, 0, time.monotonic())
+        self.dsp_time_avg = 0.0
+        self.error = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start reading and analyzing in a background thread."""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='audio-analyzer')
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"Audio analyzer started on {self.source.name} ({self.source.rate} Hz)")
+
+    def stop(self):
+        """Stop the analysis and close the source."""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+        self.source.close()
+        logger.info("Audio analyzer stopped")
+
+    @property
+    def alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _run(self):
+        try:
+            while self.running:
+                samples = self.source.read(self.chunk_frames)
+                if samples is None:
+                    logger.info(f"Audio source {self.source.name} ended")
+                    break
+                self.process(samples, time.monotonic())
+        except Exception as e:
+            logger.error(f"Error in audio analyzer: {e}")
+            self.error = str(e)
+        self.running = False
+
+    def process(self, samples, captured):
+        """Analyze one chunk of int16 samples (shape (frames, channels)) read at captured. Returns the new targets."""
+        if not len(samples):
+            return self.targets
+        started = time.perf_counter()
+        chunk = samples.mean(axis=1, dtype=np.float32) / 32768
+        count = min(len(chunk), len(self.ring))
+        self.ring[:-count] = self.ring[count:]
+        self.ring[-count:] = chunk[-count:]
+        self.audio_time += len(chunk) / self.source.rate
+
+        magnitude = np.abs(np.fft.rfft(self.ring * self.window))
+        power = magnitude ** 2
+        bands = np.add.reduceat(power, self.band_starts)[:len(BANDS)] / self.band_sizes
+        rms = float(np.sqrt(np.mean(chunk ** 2)))
+        values = np.concatenate(([rms], np.sqrt(bands)))
+
+        # Automatic gain: scale each value by its slowly decaying peak
+        self.peak = np.maximum(values, self.peak * PEAK_DECAY)
+        normalized = values / self.peak
+
+        # Fast attack, slow release
+        weight = np.where(normalized > self.envelope, ATTACK, RELEASE)
+        self.envelope += (normalized - self.envelope) * weight
+
+        # Onsets: spectral flux well above its recent average
+        if self.previous_magnitude is not None:
+            flux = float(np.sum(np.maximum(magnitude - self.previous_magnitude, 0)))
+            threshold = self.flux_history.mean() + ONSET_SENSITIVITY * self.flux_history.std()
+            if flux > threshold and self.audio_time - self.last_onset >= ONSET_MIN_INTERVAL and rms > 1e-4:
+                self.onsets += 1
+                self.last_onset = self.audio_time
+            self.flux_history[self.flux_index] = flux
+            self.flux_index = (self.flux_index + 1) % len(self.flux_history)
+        self.previous_magnitude = magnitude
+
+        level, bass, mid, treble = np.clip(self.envelope, 0, 1).tolist()
+        # One assignment, so the show thread always sees a complete set of targets
+        self.targets = AudioTargets(level, bass, mid, treble, self.onsets, captured)
+
+        dsp_time = time.perf_counter() - started
+        AUDIO_DSP_SECONDS.observe(dsp_time)
+        self.dsp_time_avg += (dsp_time - self.dsp_time_avg) * 0.1
+        return self.targets
+
+    def info(self):
+        """Describe the audio input for the web interface."""
+        targets = self.targets
+        return {
+            'source': self.source.name,
+            'running': self.alive,
+            'level': round(targets.level, 3),
+            'onsets': targets.onsets,
+            'dsp_ms': round(self.dsp_time_avg * 1000, 3),
+            'error': self.error
+        }
+
+
+def audio_frame(hue, bri, targets, hue_start, hue_end, min_bri, max_bri, onset_step):
+    """Apply audio targets to a frame's Hue-unit hue and brightness (scalars or per-light arrays).
+
+    Brightness follows the audio level within the brightness range, and every onset
+    moves the hue on by onset_step (a fraction of the theme's hue range), wrapping
+    within the range.
+    """
+    bri = np.round(min_bri + targets.level * (max_bri - min_bri)) + np.zeros_like(bri)
+    span = hue_end - hue_start
+    if span > 0:
+        hue = hue_start + np.mod(np.asarray(hue) - hue_start + targets.onsets * onset_step * span, span)
+    return np.asarray(hue).astype(np.uint16), bri.astype(np.uint8)
+
+
+def main():
+    """Analyze a WAV file offline and print the onsets and the DSP cost per chunk."""
+    parser = argparse.ArgumentParser(description="Analyze a WAV file with the light show's audio pipeline.")
+    parser.add_argument('wav', help="16-bit PCM WAV file")
+    parser.add_argument('--levels', action='store_true', help="Print the targets for every chunk")
+    args = parser.parse_args()
+
+    try:
+        source = WavSource(args.wav, realtime=False)
+    except AudioError as e:
+        parser.exit(1, f"Error: {e}\n")
+
+    analyzer = AudioAnalyzer(source)
+    onsets = 0
+    started = time.perf_counter()
+    chunks = 0
+    while True:
+        samples = source.read(CHUNK_FRAMES)
+        if samples is None:
+            break
+        targets = analyzer.process(samples, time.monotonic())
+        chunks += 1
+        if targets.onsets != onsets:
+            onsets = targets.onsets
+            print(f"{analyzer.audio_time:8.3f}s onset {onsets}")
+        elif args.levels:
+            print(f"{analyzer.audio_time:8.3f}s level {targets.level:.2f} bass {targets.bass:.2f} "
+                  f"mid {targets.mid:.2f} treble {targets.treble:.2f}")
+    elapsed = time.perf_counter() - started
+    source.close()
+
+    print(f"{analyzer.audio_time:.1f}s of audio, {chunks} chunks, {onsets} onsets, "
+          f"{elapsed / max(chunks, 1) * 1000:.3f} ms per chunk")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Hue Light Show Benchmark - runs the web controller's light show engine headless
+against the local bridge simulator at several light counts, and reports how it
+keeps up: bridge requests per frame, frame rate, frame latency, cycle time and
+CPU time per frame. Results are written as JSON so runs can be compared between versions.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import platform
+import threading
+import subprocess
+
+import numpy as np
+
+import hue_web_controller as controller
+from hue_bridge_sim import SIM_USERNAME, SIM_LIGHT_RATE, SIM_GROUP_RATE
+from hue_bridge_output import combined_stats
+from hue_transport import PooledBridge, BRIDGE_POOL_SIZE, BRIDGE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+LIGHT_COUNTS = [1, 10, 50, 200]
+BENCHMARK_CYCLE_TIME = 10  # Seconds per color cycle while benchmarking (the controller's minimum is 5)
+BENCHMARK_CYCLES = 2  # Full color cycles measured per light count
+WARMUP_TIME = 2  # Seconds the show runs before measuring, so the first full-state frame isn't counted
+SIM_STARTUP_TIMEOUT = 10
+RESULTS_FILE = 'benchmark-results.json'
+
+
+def free_port():
+    """Find a free TCP port on localhost."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_simulator(num_lights, log_path, latency, light_rate, group_rate):
+    """Run the bridge simulator in its own process, so its CPU time isn't counted as the engine's."""
+    port = free_port()
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hue_bridge_sim.py'),
+        '--lights', str(num_lights), '--port', str(port), '--latency', str(latency),
+        '--light-rate', str(light_rate), '--group-rate', str(group_rate), '--log-file', log_path
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # Wait until it accepts connections
+    deadline = time.monotonic() + SIM_STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process, f"127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError("Bridge simulator didn't start")
+
+
+def read_request_log(log_path, start, end):
+    """Load the simulator's requests that arrived between start and end (time.time() values)."""
+    with open(log_path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return [entry for entry in entries if start <= entry['time'] <= end]
+
+
+def percentiles(samples):
+    """Summarize samples (in seconds) as millisecond percentiles."""
+    if not samples:
+        return None
+    values = np.asarray(samples) * 1000
+    return {
+        'p50': round(float(np.percentile(values, 50)), 2),
+        'p90': round(float(np.percentile(values, 90)), 2),
+        'p99': round(float(np.percentile(values, 99)), 2),
+        'max': round(float(values.max()), 2)
+    }
+
+
+def histogram_totals(child):
+    """Get the number and sum of a histogram's observations."""
+    with child.lock:
+        return sum(child.counts), child.sum
+
+
+def start_web_server(num_clients):
+    """Serve the controller's web interface and connect Socket.IO clients to it.
+
+    Needs the python-socketio client extras (pip install "python-socketio[client]").
+    Returns a dictionary counting the state updates each client received.
+    """
+    import socketio as socketio_client
+
+    port = free_port()
+    thread = threading.Thread(
+        target=controller.socketio.run, args=(controller.app,),
+        kwargs={'host': '127.0.0.1', 'port': port, 'debug': False}, name='benchmark-web'
+    )
+    thread.daemon = True
+    thread.start()
+    time.sleep(1)
+
+    received = {}
+    for index in range(num_clients):
+        client = socketio_client.Client()
+        received[index] = 0
+
+        def count(data, index=index):
+            received[index] += 1
+
+        client.on('state_tick', count)
+        client.on('state_update', count)
+        client.connect(f"http://127.0.0.1:{port}")
+    return received
+
+
+def run_benchmark(num_lights, args, client_updates=None):
+    """Run the light show on num_lights simulated lights and measure it."""
+    log_path = f"benchmark-sim-{num_lights}.jsonl"
+    if os.path.exists(log_path):
+        os.remove(log_path)
+
+    process, address = start_simulator(num_lights, log_path, args.latency, args.light_rate, args.group_rate)
+    try:
+        # Fresh engine state for every light count
+        controller.lights = controller.lights._replace(selected=())
+        controller.frame_table = None
+        controller.inventory_file = None  # Always read the simulator's lights
+        bridge = PooledBridge(address, SIM_USERNAME, pool_size=args.pool_size, timeout=args.timeout)
+        controller.start_engine([('simulator', bridge)])
+        controller.set_speed(args.transition_time, args.cycle_time)
+        controller.start_light_show()
+
+        time.sleep(WARMUP_TIME)
+        clock = controller.frame_clock
+        frames_before = clock.frames
+        skipped_before = clock.skipped_frames
+        clock.frame_latencies.clear()
+        updates_before = sum(client_updates.values()) if client_updates else 0
+        emits_before, emit_time_before = histogram_totals(controller.FRAME_EMIT_SECONDS)
+        cpu_before = time.process_time()
+        wall_start, monotonic_start = time.time(), time.monotonic()
+
+        time.sleep(args.cycle_time * args.cycles)
+
+        cpu_time = time.process_time() - cpu_before
+        elapsed = time.monotonic() - monotonic_start
+        wall_end = time.time()
+        frames = clock.frames - frames_before
+        skipped = clock.skipped_frames - skipped_before
+        latencies = list(clock.frame_latencies)
+        cycle_time = clock.cycle_time_last
+        updates = (sum(client_updates.values()) - updates_before) if client_updates else None
+        emits, emit_time = histogram_totals(controller.FRAME_EMIT_SECONDS)
+        emits, emit_time = emits - emits_before, emit_time - emit_time_before
+        client_backlogs = controller.broadcaster.client_backlogs() if client_updates else {}
+        scheduler_stats = combined_stats(controller.bridge_outputs)
+        target_fps = 1.0 / controller.frame_table.step_time
+    finally:
+        controller.stop_engine()
+        if controller.light_show_thread is not None:
+            controller.light_show_thread.join(timeout=5)
+        process.terminate()
+        process.wait()
+
+    requests = read_request_log(log_path, wall_start, wall_end)
+    os.remove(log_path)
+    writes = [entry for entry in requests if entry['method'] != 'GET']
+    rejected = [entry for entry in requests if entry['status'] != 200]
+    # Frames the clock skipped never ran, but they count towards the target
+    frames_due = max(1, frames + skipped)
+
+    return {
+        'lights': num_lights,
+        'duration': round(elapsed, 2),
+        'frames': frames,
+        'skipped_frames': skipped,
+        'target_fps': round(target_fps, 2),
+        'fps': round(frames / elapsed, 2),
+        'requests': len(requests),
+        'requests_per_frame': round(len(requests) / frames_due, 3),
+        'write_requests_per_frame': round(len(writes) / frames_due, 3),
+        'rejected_requests': len(rejected),
+        'frame_latency_ms': percentiles(latencies),
+        'configured_cycle_time': args.cycle_time,
+        'actual_cycle_time': round(cycle_time, 3) if cycle_time is not None else None,
+        'cpu_ms_per_frame': round(cpu_time * 1000 / max(1, frames), 3),
+        'client_updates_per_second': round(updates / elapsed / len(client_updates), 2) if client_updates else None,
+        # Time the show loop spends handing state to the broadcaster, and what's left queued for the clients
+        'emit_ms_per_frame': round(emit_time * 1000 / max(1, emits), 3),
+        'client_backlog_bytes': max((size for _, size in client_backlogs.values()), default=0) if client_updates else None,
+        'scheduler': {key: value for key, value in scheduler_stats.items() if key != 'missed_lights'}
+    }
+
+
+def compare(results, baseline_path):
+    """Print how each run changed against a previous results file."""
+    with open(baseline_path) as f:
+        baseline = {run['lights']: run for run in json.load(f)['runs']}
+
+    print(f"\nChange against {baseline_path}:")
+    for run in results['runs']:
+        previous = baseline.get(run['lights'])
+        if previous is None:
+            continue
+        changes = []
+        for key in ('fps', 'requests_per_frame', 'cpu_ms_per_frame'):
+            if previous[key]:
+                changes.append(f"{key} {(run[key] - previous[key]) / previous[key] * 100:+.1f}%")
+        if run['frame_latency_ms'] and previous['frame_latency_ms']:
+            changes.append(f"p99 latency {run['frame_latency_ms']['p99'] - previous['frame_latency_ms']['p99']:+.2f}ms")
+        print(f"  {run['lights']:>4} lights: {', '.join(changes)}")
+
+
+def main():
+    """Run the benchmark suite from the command line."""
+    parser = argparse.ArgumentParser(description="Benchmark the light show engine against the bridge simulator.")
+    parser.add_argument('--lights', default=','.join(str(count) for count in LIGHT_COUNTS),
+                        help="comma-separated light counts to run (default: 1,10,50,200)")
+    parser.add_argument('--cycle-time', type=float, default=BENCHMARK_CYCLE_TIME,
+                        help=f"full cycle time in seconds (default: {BENCHMARK_CYCLE_TIME})")
+    parser.add_argument('--cycles', type=float, default=BENCHMARK_CYCLES,
+                        help=f"cycles measured per light count (default: {BENCHMARK_CYCLES})")
+    parser.add_argument('--transition-time', type=float, default=controller.TRANSITION_TIME,
+                        help=f"transition time in seconds (default: {controller.TRANSITION_TIME})")
+    parser.add_argument('--latency', type=float, default=0.005, help="simulated bridge latency in seconds (default: 0.005)")
+    parser.add_argument('--light-rate', type=float, default=SIM_LIGHT_RATE,
+                        help="simulated bridge light command budget per second (0 = unlimited)")
+    parser.add_argument('--group-rate', type=float, default=SIM_GROUP_RATE,
+                        help="simulated bridge group command budget per second (0 = unlimited)")
+    parser.add_argument('--pool-size', type=int, default=BRIDGE_POOL_SIZE, help="bridge connection pool size")
+    parser.add_argument('--timeout', type=float, default=BRIDGE_TIMEOUT, help="bridge request timeout in seconds")
+    parser.add_argument('--clients', type=int, default=0,
+                        help="Socket.IO clients connected during the runs (needs python-socketio[client])")
+    parser.add_argument('--output', default=RESULTS_FILE, help=f"JSON results file (default: {RESULTS_FILE})")
+    parser.add_argument('--baseline', help="previous results file to compare against")
+    args = parser.parse_args()
+
+    # The engine logs every light it finds; keep the benchmark output readable
+    logging.getLogger().setLevel(logging.WARNING)
+
+    client_updates = start_web_server(args.clients) if args.clients else None
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'runs': []
+    }
+
+    print(f"{'lights':>6} {'fps':>12} {'req/frame':>10} {'p50 ms':>8} {'p99 ms':>8} {'cycle s':>14} {'cpu ms/frame':>13} "
+          f"{'emit ms':>8}")
+    for num_lights in [int(count) for count in args.lights.split(',') if count.strip()]:
+        run = run_benchmark(num_lights, args, client_updates)
+        results['runs'].append(run)
+
+        latency = run['frame_latency_ms'] or {'p50': 0, 'p99': 0}
+        actual_cycle = run['actual_cycle_time'] if run['actual_cycle_time'] is not None else float('nan')
+        print(f"{run['lights']:>6} {run['fps']:>5.2f}/{run['target_fps']:<6.2f} {run['requests_per_frame']:>10.2f} "
+              f"{latency['p50']:>8.2f} {latency['p99']:>8.2f} {actual_cycle:>6.2f}/{run['configured_cycle_time']:<7.2f} "
+              f"{run['cpu_ms_per_frame']:>13.3f} {run['emit_ms_per_frame']:>8.3f}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
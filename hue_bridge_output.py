@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Bridge outputs - everything that writes to one Hue Bridge (command scheduler, group,
+shadow state, frame commit and scenes, plus the bridge's event stream when it's used), so a
+show can drive several bridges, each with its own worker and command budget.
+"""
+
+import logging
+
+from hue_frame_commit import FrameCommit
+from hue_group_output import GroupOutput
+from hue_health import LightHealth
+from hue_scenes import SceneOutput
+from hue_scheduler import BridgeScheduler
+from hue_shadow_state import ShadowState
+
+logger = logging.getLogger(__name__)
+
+LIGHT_ID_SEPARATOR = ':'  # Namespaced light IDs look like "bridge-name:3"
+
+
+class BridgeOutput:
+    """The output pipeline for one bridge. Light IDs here are the bridge's own."""
+
+    def __init__(self, name, bridge, event_stream=None):
+        self.name = name
+        self.bridge = bridge
+        self.event_stream = event_stream  # An EventStream replacing the shadow state poll, or None
+        self.shadow = ShadowState(bridge)
+        # Lights that keep failing are left out of the frames until they answer again
+        self.health = LightHealth(self.shadow)
+        # Fan each frame's per-light commands out over the bridge's connection pool
+        self.scheduler = BridgeScheduler(bridge, concurrency=getattr(bridge, 'pool_size', 1), health=self.health)
+        self.group = GroupOutput(bridge)
+        self.frame_commit = FrameCommit(bridge, self.group, self.scheduler, self.shadow, self.health)
+        self.scenes = SceneOutput(bridge, self.scheduler, self.shadow)
+
+    def start(self):
+        """Start sending queued commands, remove scenes left by an earlier run and follow the light states.
+
+        The light states come from the bridge's event stream if there is one, otherwise from polling.
+        """
+        self.scheduler.start()
+        self.scenes.start()
+        if self.event_stream is not None:
+            self.event_stream.start()
+        else:
+            self.shadow.start()
+
+    def stop(self):
+        """Stop sending, remove the temporary group and scenes and close the connections."""
+        if self.event_stream is not None:
+            self.event_stream.stop()
+        self.shadow.stop()
+        self.scheduler.stop()
+        self.scenes.clear()
+        self.group.remove()
+        if hasattr(self.bridge, 'close'):
+            self.bridge.close()
+
+    def sync_group(self, light_ids):
+        """Queue an update of the bridge group to the given lights."""
+        light_ids = list(light_ids)
+        if light_ids:
+            self.scheduler.submit_call('group_sync', lambda: self.group.sync(light_ids))
+
+
+def light_key(output_name, light_id, namespaced):
+    """Get the show-wide ID of a bridge's light: the bridge's own ID, or "name:id" with several bridges."""
+    return f"{output_name}{LIGHT_ID_SEPARATOR}{light_id}" if namespaced else light_id
+
+
+def combined_stats(outputs):
+    """Add up the scheduler statistics of several bridges."""
+    totals = {'queue_depth': 0, 'in_flight': 0, 'sent': 0, 'replaced': 0, 'dropped': 0, 'errors': 0, 'missed': 0,
+              'latency_ms': None, 'missed_lights': {}}
+    namespaced = len(outputs) > 1
+    for output in outputs:
+        stats = output.scheduler.stats()
+        for key in ('queue_depth', 'in_flight', 'sent', 'replaced', 'dropped', 'errors', 'missed'):
+            totals[key] += stats[key]
+        if stats['latency_ms'] is not None:
+            totals['latency_ms'] = max(totals['latency_ms'] or 0, stats['latency_ms'])
+        for light_id, count in stats['missed_lights'].items():
+            totals['missed_lights'][light_key(output.name, light_id, namespaced)] = count
+    return totals
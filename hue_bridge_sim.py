@@ -0,0 +1,605 @@
+#!/usr/bin/env python3
+"""
+Hue Bridge Simulator - a local stand-in for the Hue Bridge REST API, for load testing
+the light show without real hardware.
+
+It can simulate hundreds of lights, per-request latency, the bridge's command rate
+limit, its scene storage limit and dead lights that never answer. Every request is logged with a timestamp.
+Changes to the lights are also pushed on an API v2 style event stream (server-sent
+events at /eventstream/clip/v2, over plain HTTP), for testing the app's event stream.
+
+Point the app at it by setting "ipAddress" in hue-config.json to the simulator's
+address, e.g. "127.0.0.1:8000".
+"""
+
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from hue_eventstream import EVENTSTREAM_PATH
+from hue_scheduler import TokenBucket
+
+SIM_PORT = 8000
+SIM_USERNAME = 'simulator'
+SIM_LIGHT_RATE = 10  # Light commands per second before the simulator starts rejecting them
+SIM_GROUP_RATE = 1  # Group commands per second before the simulator starts rejecting them
+SIM_RATE_LIMIT_STATUS = 503  # HTTP status for rejected commands (the bridge answers 503; some proxies use 429)
+SIM_DEAD_LIGHT_DELAY = 30  # Seconds a dead light takes to "answer" (longer than any client timeout)
+SIM_SCENE_LIMIT = 200  # Scenes the bridge has room for
+SIM_EVENT_INTERVAL = 0.1  # Seconds the event stream gathers changes into one message, like the bridge does
+SIM_KEEPALIVE_INTERVAL = 10  # Seconds between keepalive comments on an idle event stream
+SIM_COMMAND_LOG = 10000  # Most recent requests kept in memory (the log file, if any, has them all)
+
+LIGHT_MODELS = [
+    ('Hue color lamp', 'LCT015', 'Extended color light'),
+    ('Hue lightstrip plus', 'LST002', 'Extended color light'),
+    ('Hue go', 'LLC020', 'Color light'),
+]
+
+
+def make_light(light_id):
+    """Build the API representation of a simulated light."""
+    name, model_id, light_type = LIGHT_MODELS[(light_id - 1) % len(LIGHT_MODELS)]
+    return {
+        'state': {
+            'on': False, 'bri': 254, 'hue': 0, 'sat': 254, 'effect': 'none',
+            'xy': [0.3, 0.3], 'ct': 366, 'alert': 'none', 'colormode': 'hs',
+            'mode': 'homeautomation', 'reachable': True
+        },
+        'type': light_type,
+        'name': f"{name} {light_id}",
+        'modelid': model_id,
+        'manufacturername': 'Signify Netherlands B.V.',
+        'productname': name,
+        'capabilities': {
+            'certified': True,
+            'control': {'colorgamuttype': 'C', 'ct': {'min': 153, 'max': 500}}
+        },
+        'uniqueid': f"00:17:88:01:00:{light_id // 256:02x}:{light_id % 256:02x}-0b",
+        'swversion': '1.88.1'
+    }
+
+
+def resource_id(light, kind):
+    """Get the API v2 ID of a simulated light's resource (the light itself, or its connectivity)."""
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, f"{light['uniqueid']}/{kind}"))
+
+
+def light_resource(light_id, light, changes):
+    """Build an API v2 light resource carrying the given v1 state changes."""
+    resource = {'id': resource_id(light, 'light'), 'id_v1': f"/lights/{light_id}", 'type': 'light'}
+    if 'on' in changes:
+        resource['on'] = {'on': changes['on']}
+    if 'bri' in changes:
+        resource['dimming'] = {'brightness': round(changes['bri'] / 254 * 100, 2)}
+    if 'name' in changes:
+        resource['metadata'] = {'name': changes['name']}
+    return resource
+
+
+def connectivity_resource(light_id, light):
+    """Build an API v2 zigbee_connectivity resource for a simulated light."""
+    return {
+        'id': resource_id(light, 'zigbee_connectivity'), 'id_v1': f"/lights/{light_id}", 'type': 'zigbee_connectivity',
+        'status': 'connected' if light['state']['reachable'] else 'connectivity_issue'
+    }
+
+
+class HueBridgeSimulator:
+    """In-process simulated Hue Bridge served over HTTP."""
+
+    def __init__(self, num_lights=10, host='127.0.0.1', port=SIM_PORT, latency=0.0, jitter=0.0,
+                 light_rate=SIM_LIGHT_RATE, group_rate=SIM_GROUP_RATE, rate_limit_status=SIM_RATE_LIMIT_STATUS,
+                 dead_lights=(), dead_light_delay=SIM_DEAD_LIGHT_DELAY, log_file=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.light_bucket = TokenBucket(light_rate, light_rate) if light_rate else None
+        self.group_bucket = TokenBucket(group_rate, group_rate) if group_rate else None
+        self.rate_limit_status = rate_limit_status
+        self.dead_lights = set(dead_lights)
+        self.dead_light_delay = dead_light_delay
+        self.log_file = log_file
+
+        self.lights = {str(light_id): make_light(light_id) for light_id in range(1, num_lights + 1)}
+        for light_id in self.dead_lights:
+            if str(light_id) in self.lights:
+                self.lights[str(light_id)]['state']['reachable'] = False
+        self.groups = {}
+        self.scenes = {}
+        self.config = {
+            'name': 'Hue Bridge Simulator',
+            'bridgeid': '001788FFFE000000',
+            'modelid': 'BSB002',
+            'mac': '00:17:88:00:00:00',
+            'apiversion': '1.48.0',
+            'swversion': '1948086000',
+            'datastoreversion': '98',
+        }
+
+        self.commands = deque(maxlen=SIM_COMMAND_LOG)  # Recent requests: {'time', 'method', 'path', 'body', 'status'}
+        self.served = 0  # Requests served so far
+        self.subscribers = set()  # Queues of the open event streams
+        self.events = 0  # Events published so far, for the event IDs
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.server = None
+        self.thread = None
+
+    @property
+    def address(self):
+        """Address to put in hue-config.json's ipAddress."""
+        return f"{self.host}:{self.port}"
+
+    def start(self):
+        """Serve the simulated API in a background thread."""
+        simulator = self
+
+        class Handler(SimulatorRequestHandler):
+            sim = simulator
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]  # Port 0 picks a free port
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.server.serve_forever, name='hue-bridge-sim')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self.stop_event.set()
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.put(None)  # Wake the event streams so they end
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def log(self, method, path, body, status):
+        """Record a request with its timestamp."""
+        entry = {'time': time.time(), 'method': method, 'path': path, 'body': body, 'status': status}
+        with self.lock:
+            self.commands.append(entry)
+            self.served += 1
+        if self.log_file is not None:
+            with self.lock:
+                self.log_file.write(json.dumps(entry) + '\n')
+                self.log_file.flush()
+
+    def clear_log(self):
+        """Forget the logged requests."""
+        with self.lock:
+            self.commands.clear()
+
+    def rate_limited(self, kind):
+        """Check the command budget for a light or group command; True means reject it."""
+        bucket = self.light_bucket if kind == 'light' else self.group_bucket
+        if bucket is None:
+            return False
+        with self.lock:
+            return not bucket.try_acquire()
+
+    def subscribe(self):
+        """Open an event stream. Returns the queue its events arrive on (None when the simulator stops)."""
+        subscriber = queue.Queue()
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish_event(self, kind, resources):
+        """Push an event ("update", "add" or "delete") about some API v2 resources to every event stream."""
+        if not resources:
+            return
+        with self.lock:
+            self._publish_event(kind, resources)
+
+    def _publish_event(self, kind, resources):
+        # Called with the lock held
+        self.events += 1
+        event = {
+            'creationtime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'id': str(uuid.uuid4()), 'type': kind, 'data': resources
+        }
+        for subscriber in self.subscribers:
+            subscriber.put((f"{int(time.time())}:{self.events}", event))
+
+    def apply_state(self, light_ids, changes, address):
+        """Apply a state change to lights and build the bridge's success response."""
+        response = []
+        with self.lock:
+            updates = []
+            for light_id in light_ids:
+                state = self.lights[light_id]['state']
+                changed = {}
+                for key, value in changes.items():
+                    if key == 'transitiontime':
+                        continue
+                    if key.endswith('_inc') and key[:-4] in state:
+                        key, value = key[:-4], state[key[:-4]] + value
+                    if key in ('on', 'bri') and state.get(key) != value:
+                        changed[key] = value
+                    state[key] = value
+                    if key in ('hue', 'sat'):
+                        state['colormode'] = 'hs'
+                if changed:
+                    updates.append(light_resource(light_id, self.lights[light_id], changed))
+            if updates and self.subscribers:
+                self._publish_event('update', updates)
+        for key, value in changes.items():
+            response.append({'success': {f"{address}/{key}": value}})
+        return response
+
+    def rename_light(self, light_id, name):
+        """Rename a light, as the Hue app would."""
+        with self.lock:
+            light = self.lights[str(light_id)]
+            light['name'] = name
+            self._publish_event('update', [light_resource(light_id, light, {'name': name})])
+
+    def add_light(self):
+        """Add a light, as if a search had just found it. Returns its ID."""
+        with self.lock:
+            light_id = max([int(key) for key in self.lights] + [0]) + 1
+            light = self.lights[str(light_id)] = make_light(light_id)
+            resource = light_resource(light_id, light, {'on': light['state']['on'], 'bri': light['state']['bri'],
+                                                        'name': light['name']})
+            self._publish_event('add', [resource, connectivity_resource(light_id, light)])
+        return light_id
+
+    def remove_light(self, light_id):
+        """Delete a light from the bridge."""
+        with self.lock:
+            light = self.lights.pop(str(light_id))
+            for group in self.groups.values():
+                group['lights'] = [member for member in group['lights'] if member != str(light_id)]
+            self._publish_event('delete', [
+                {'id': resource_id(light, 'light'), 'id_v1': f"/lights/{light_id}", 'type': 'light'},
+                {'id': resource_id(light, 'zigbee_connectivity'), 'id_v1': f"/lights/{light_id}",
+                 'type': 'zigbee_connectivity'},
+            ])
+
+    def set_reachable(self, light_id, reachable):
+        """Make a light drop off the network (e.g. switched off at the wall) or come back."""
+        with self.lock:
+            light = self.lights[str(light_id)]
+            if light['state']['reachable'] != reachable:
+                light['state']['reachable'] = reachable
+                self._publish_event('update', [connectivity_resource(light_id, light)])
+
+
+def error_response(error_type, address, description):
+    """Build a Hue API error response."""
+    return [{'error': {'type': error_type, 'address': address, 'description': description}}]
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    """Request handler implementing the subset of the Hue API the light show uses."""
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real bridge
+    sim = None  # Set to the HueBridgeSimulator by HueBridgeSimulator.start()
+
+    def log_message(self, format, *args):
+        pass  # Requests are logged by the simulator instead
+
+    def do_GET(self):
+        if self.path.rstrip('/') == EVENTSTREAM_PATH:
+            self._eventstream()
+        else:
+            self._handle('GET')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _handle(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length else b''
+        try:
+            body = json.loads(raw_body) if raw_body else None
+        except ValueError:
+            body = None
+
+        status, response = self._route(method, self.path.rstrip('/'), body)
+        self.sim.log(method, self.path, body, status)
+
+        # Simulated network and bridge processing time
+        delay = self.sim.latency + random.uniform(0, self.sim.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        payload = json.dumps(response).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting (e.g. on a dead light)
+            self.close_connection = True
+
+    def _eventstream(self):
+        """Stream events to the client until it disconnects or the simulator stops."""
+        sim = self.sim
+        if not self.headers.get('hue-application-key'):
+            sim.log('GET', self.path, None, 403)
+            payload = json.dumps({'errors': [{'description': "unauthorized user"}]}).encode('utf-8')
+            self.send_response(403)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        sim.log('GET', self.path, None, 200)
+        subscriber = sim.subscribe()
+        self.close_connection = True  # The stream runs until one side hangs up
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(b': hi\n\n')
+            self.wfile.flush()
+
+            while not sim.stop_event.is_set():
+                try:
+                    events = [subscriber.get(timeout=SIM_KEEPALIVE_INTERVAL)]
+                except queue.Empty:
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                # Gather the changes of the next moment into one message
+                sim.stop_event.wait(SIM_EVENT_INTERVAL)
+                while not subscriber.empty():
+                    events.append(subscriber.get_nowait())
+                if None in events:
+                    break
+                message = f"id: {events[-1][0]}\ndata: {json.dumps([event for _, event in events])}\n\n"
+                self.wfile.write(message.encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            sim.unsubscribe(subscriber)
+
+    def _route(self, method, path, body):
+        """Dispatch a request. Returns (HTTP status, JSON response)."""
+        sim = self.sim
+
+        if path == '/api' and method == 'POST':
+            return 200, [{'success': {'username': SIM_USERNAME}}]
+        if path == '/api/config':
+            return 200, {key: sim.config[key] for key in ('name', 'bridgeid', 'modelid', 'mac', 'apiversion', 'swversion')}
+
+        match = re.match(r'^/api/[^/]+(/.*)?$', path)
+        if not match:
+            return 404, error_response(4, path, f"method, {method}, not available for resource, {path}")
+        resource = match.group(1) or ''
+        parts = resource.strip('/').split('/') if resource else []
+
+        if not parts and method == 'GET':
+            with sim.lock:
+                return 200, {'lights': sim.lights, 'groups': sim.groups, 'config': sim.config, 'scenes': sim.scenes}
+        if parts == ['config'] and method == 'GET':
+            return 200, sim.config
+
+        if parts and parts[0] == 'lights':
+            return self._lights(method, parts, body, resource)
+        if parts and parts[0] == 'groups':
+            return self._groups(method, parts, body, resource)
+        if parts and parts[0] == 'scenes':
+            return self._scenes(method, parts, body, resource)
+
+        return 404, error_response(4, resource, f"method, {method}, not available for resource, {resource}")
+
+    def _lights(self, method, parts, body, resource):
+        sim = self.sim
+
+        if len(parts) == 1 and method == 'GET':
+            with sim.lock:
+                return 200, json.loads(json.dumps(sim.lights))
+
+        light_id = parts[1]
+        if light_id not in sim.lights:
+            return 404, error_response(3, resource, f"resource, {resource}, not available")
+
+        # Dead lights never answer commands in time (reads come from the bridge's cache)
+        if method == 'PUT' and int(light_id) in sim.dead_lights:
+            sim.stop_event.wait(sim.dead_light_delay)
+
+        if len(parts) == 2 and method == 'GET':
+            with sim.lock:
+                return 200, json.loads(json.dumps(sim.lights[light_id]))
+        if len(parts) == 2 and method == 'PUT':
+            if sim.rate_limited('light'):
+                return sim.rate_limit_status, error_response(901, resource, "Internal error, 503")
+            if 'name' in (body or {}):
+                sim.rename_light(light_id, body['name'])
+            return 200, [{'success': {f"{resource}/{key}": value}} for key, value in (body or {}).items()]
+        if len(parts) == 3 and parts[2] == 'state' and method == 'PUT':
+            if sim.rate_limited('light'):
+                return sim.rate_limit_status, error_response(901, resource, "Internal error, 503")
+            return 200, sim.apply_state([light_id], body or {}, resource)
+        if len(parts) == 2 and method == 'DELETE':
+            sim.remove_light(light_id)
+            return 200, [{'success': f"{resource} deleted"}]
+
+        return 405, error_response(4, resource, f"method, {method}, not available for resource, {resource}")
+
+    def _groups(self, method, parts, body, resource):
+        sim = self.sim
+
+        if len(parts) == 1 and method == 'GET':
+            with sim.lock:
+                return 200, json.loads(json.dumps(sim.groups))
+        if len(parts) == 1 and method == 'POST':
+            if sim.rate_limited('group'):
+                return sim.rate_limit_status, error_response(901, resource, "Internal error, 503")
+            with sim.lock:
+                group_id = str(max([int(key) for key in sim.groups] + [0]) + 1)
+                sim.groups[group_id] = {
+                    'name': (body or {}).get('name', f"Group {group_id}"),
+                    'lights': [str(light) for light in (body or {}).get('lights', [])],
+                    'type': (body or {}).get('type', 'LightGroup'),
+                    'action': {'on': False, 'bri': 254, 'hue': 0, 'sat': 254}
+                }
+            return 200, [{'success': {'id': group_id}}]
+
+        group_id = parts[1]
+        if group_id != '0' and group_id not in sim.groups:
+            return 404, error_response(3, resource, f"resource, {resource}, not available")
+
+        if len(parts) == 2 and method == 'GET':
+            with sim.lock:
+                if group_id == '0':
+                    return 200, {'name': 'Group 0', 'lights': list(sim.lights), 'type': 'LightGroup'}
+                return 200, json.loads(json.dumps(sim.groups[group_id]))
+        if len(parts) == 2 and method == 'DELETE':
+            with sim.lock:
+                del sim.groups[group_id]
+            return 200, [{'success': f"{resource} deleted"}]
+        if len(parts) == 2 and method == 'PUT':
+            if sim.rate_limited('group'):
+                return sim.rate_limit_status, error_response(901, resource, "Internal error, 503")
+            with sim.lock:
+                for key, value in (body or {}).items():
+                    if key in ('name', 'lights'):
+                        sim.groups[group_id][key] = [str(light) for light in value] if key == 'lights' else value
+            return 200, [{'success': {f"{resource}/{key}": value}} for key, value in (body or {}).items()]
+        if len(parts) == 3 and parts[2] == 'action' and method == 'PUT':
+            if sim.rate_limited('group'):
+                return sim.rate_limit_status, error_response(901, resource, "Internal error, 503")
+            if 'scene' in (body or {}):
+                return self._recall_scene(body['scene'], resource)
+            with sim.lock:
+                members = list(sim.lights) if group_id == '0' else list(sim.groups[group_id]['lights'])
+            members = [light_id for light_id in members if light_id in sim.lights]
+            return 200, sim.apply_state(members, body or {}, resource)
+
+        return 405, error_response(4, resource, f"method, {method}, not available for resource, {resource}")
+
+    def _recall_scene(self, scene_id, resource):
+        """Set every light in a scene to its stored state."""
+        sim = self.sim
+        with sim.lock:
+            scene = sim.scenes.get(scene_id)
+            lightstates = json.loads(json.dumps(scene['lightstates'])) if scene is not None else None
+        if lightstates is None:
+            return 200, error_response(7, f"{resource}/scene", f"invalid value, {scene_id}, for parameter, scene")
+        for light_id, state in lightstates.items():
+            if light_id in sim.lights:
+                sim.apply_state([light_id], state, resource)
+        return 200, [{'success': {f"{resource}/scene": scene_id}}]
+
+    def _scenes(self, method, parts, body, resource):
+        sim = self.sim
+        body = body or {}
+
+        if len(parts) == 1 and method == 'GET':
+            with sim.lock:
+                # Like the bridge, the list leaves out the light states
+                return 200, {scene_id: {key: value for key, value in scene.items() if key != 'lightstates'}
+                             for scene_id, scene in sim.scenes.items()}
+        if len(parts) == 1 and method == 'POST':
+            with sim.lock:
+                if len(sim.scenes) >= SIM_SCENE_LIMIT:
+                    return 200, error_response(301, '/scenes', "Scenes table full")
+                scene_id = uuid.uuid4().hex[:15]
+                sim.scenes[scene_id] = {
+                    'name': body.get('name', scene_id), 'type': 'LightScene',
+                    'lights': [str(light) for light in body.get('lights', [])],
+                    'recycle': body.get('recycle', False),
+                    'lightstates': body.get('lightstates', {})
+                }
+            return 200, [{'success': {'id': scene_id}}]
+
+        scene_id = parts[1]
+        if scene_id not in sim.scenes:
+            return 404, error_response(3, resource, f"resource, {resource}, not available")
+
+        if len(parts) == 2 and method == 'GET':
+            with sim.lock:
+                return 200, json.loads(json.dumps(sim.scenes[scene_id]))
+        if len(parts) == 2 and method == 'PUT':
+            with sim.lock:
+                for key in ('name', 'lights', 'lightstates'):
+                    if key in body:
+                        sim.scenes[scene_id][key] = body[key]
+            return 200, [{'success': {f"{resource}/{key}": value}} for key, value in body.items()]
+        if len(parts) == 2 and method == 'DELETE':
+            with sim.lock:
+                del sim.scenes[scene_id]
+            return 200, [{'success': f"{resource} deleted"}]
+
+        return 405, error_response(4, resource, f"method, {method}, not available for resource, {resource}")
+
+
+def main():
+    """Run the simulator from the command line."""
+    parser = argparse.ArgumentParser(description="Local Hue Bridge simulator for load testing the light show.")
+    parser.add_argument('--lights', type=int, default=10, help="number of simulated lights (default: 10)")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=SIM_PORT, help=f"port to listen on (default: {SIM_PORT})")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many random extra seconds per response")
+    parser.add_argument('--light-rate', type=float, default=SIM_LIGHT_RATE,
+                        help="light commands per second before rejecting (0 = unlimited)")
+    parser.add_argument('--group-rate', type=float, default=SIM_GROUP_RATE,
+                        help="group commands per second before rejecting (0 = unlimited)")
+    parser.add_argument('--rate-limit-status', type=int, default=SIM_RATE_LIMIT_STATUS, choices=[429, 503],
+                        help="HTTP status returned for rejected commands")
+    parser.add_argument('--dead', default='', help="comma-separated IDs of lights that never answer")
+    parser.add_argument('--log-file', help="append every request to this file as JSON lines")
+    args = parser.parse_args()
+
+    dead_lights = [int(light_id) for light_id in args.dead.split(',') if light_id.strip()]
+    log_file = open(args.log_file, 'a') if args.log_file else None
+
+    simulator = HueBridgeSimulator(
+        num_lights=args.lights, host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+        light_rate=args.light_rate, group_rate=args.group_rate, rate_limit_status=args.rate_limit_status,
+        dead_lights=dead_lights, log_file=log_file
+    )
+    simulator.start()
+
+    print(f"Hue Bridge simulator with {args.lights} lights listening on http://{simulator.address}")
+    print(f"Set \"ipAddress\": \"{simulator.address}\" and \"username\": \"{SIM_USERNAME}\" in hue-config.json to use it.")
+    print("Press Ctrl+C to stop.")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\nStopping simulator ({simulator.served} requests served).")
+    finally:
+        simulator.stop()
+        if log_file is not None:
+            log_file.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+State broadcasting - fans the show's state updates out to every connected Socket.IO client
+from a worker of its own, so the show loop only hands an update over and never waits on
+clients. Each update is encoded once and the same message is queued for every client that
+is keeping up; a client that falls behind skips updates and is sent the full state instead
+once it has caught up, so a slow phone never makes the server buffer without limit.
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+
+from socketio import packet
+from engineio import packet as eio_packet
+
+import hue_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_QUEUE_SIZE = 8  # Updates waiting for the worker; past this, new ones are merged into the newest
+CLIENT_BACKLOG_LIMIT = 8  # Messages waiting to go out to a client before it skips updates
+RESYNC_INTERVAL = 0.5  # Seconds between checks on lagging clients while nothing is being broadcast
+
+BROADCAST_SECONDS = metrics.histogram('hue_broadcast_seconds', "Time to encode one state update and queue it for every client")
+BROADCAST_UPDATES = metrics.counter(
+    'hue_broadcast_updates_total',
+    "State updates by outcome: sent (to one client), skipped (client too far behind), "
+    "merged (into a queued update) and resync (full state sent to a client that caught up)",
+    ['outcome']
+)
+UPDATES_SENT = BROADCAST_UPDATES.labels('sent')
+UPDATES_SKIPPED = BROADCAST_UPDATES.labels('skipped')
+UPDATES_MERGED = BROADCAST_UPDATES.labels('merged')
+CLIENT_RESYNCS = BROADCAST_UPDATES.labels('resync')
+
+
+class Broadcaster:
+    """Send state updates to every client of a Flask-SocketIO server from one background task.
+
+    Updates are dictionaries of the latest value of the fields they carry, so two queued
+    updates can be merged into one without losing anything. snapshot is a callable returning
+    the full state, sent to new clients and to clients that skipped updates.
+    """
+
+    def __init__(self, socketio, snapshot, snapshot_event='state_update', namespace='/',
+                 queue_size=BROADCAST_QUEUE_SIZE, backlog_limit=CLIENT_BACKLOG_LIMIT):
+        self.socketio = socketio
+        self.snapshot = snapshot
+        self.snapshot_event = snapshot_event
+        self.namespace = namespace
+        self.queue_size = queue_size
+        self.backlog_limit = backlog_limit
+        self.queue = deque()  # (event, data) updates waiting for the worker
+        self.lagging = set()  # Clients that skipped an update and need the full state
+        self.condition = threading.Condition()
+        self.running = False
+        self.generation = 0  # Bumped on every start, so a stopped worker never runs alongside its replacement
+        self.task = None
+
+    def publish(self, event, data):
+        """Queue an update for every client. Never blocks on the clients."""
+        with self.condition:
+            self._start()
+            if len(self.queue) >= self.queue_size and self.queue[-1][0] == event:
+                self.queue[-1][1].update(data)
+                UPDATES_MERGED.inc()
+            else:
+                self.queue.append((event, dict(data)))
+            self.condition.notify()
+
+    def resync(self, sid):
+        """Send a client the full state, ahead of any further updates."""
+        with self.condition:
+            self._start()
+            self.lagging.add(sid)
+            self.condition.notify()
+
+    def stop(self):
+        """Stop the worker. Updates still queued are dropped."""
+        with self.condition:
+            self.running = False
+            self.queue.clear()
+            self.condition.notify()
+
+    def backlog(self, eio_sid):
+        """Get the number of messages waiting to go out to a client."""
+        socket = self.socketio.server.eio.sockets.get(eio_sid)
+        return socket.queue.qsize() if socket is not None else 0
+
+    def client_backlogs(self):
+        """Measure each client's send queue. Returns {sid: (messages, bytes)}."""
+        backlogs = {}
+        for sid, eio_sid in self._clients():
+            socket = self.socketio.server.eio.sockets.get(eio_sid)
+            if socket is None:
+                continue
+            waiting = [message for message in list(socket.queue.queue) if message is not None]
+            size = sum(len(message.data) for message in waiting if isinstance(message.data, (str, bytes)))
+            backlogs[sid] = (len(waiting), size)
+        return backlogs
+
+    def _start(self):
+        # Started on first use so the task runs under whichever async mode the server was set up with
+        if not self.running:
+            self.running = True
+            self.generation += 1
+            self.task = self.socketio.start_background_task(self._run, self.generation)
+
+    def _clients(self):
+        return list(self.socketio.server.manager.get_participants(self.namespace, None))
+
+    def _run(self, generation):
+        """Fan queued updates out to the clients until stopped."""
+        while True:
+            with self.condition:
+                if self.running and not self.queue:
+                    self.condition.wait(RESYNC_INTERVAL)
+                if not self.running or self.generation != generation:
+                    return
+                updates = list(self.queue)
+                self.queue.clear()
+                lagging = bool(self.lagging)
+
+            try:
+                for event, data in updates:
+                    self._fan_out(event, data)
+                if lagging:
+                    self._resync_caught_up()
+            except Exception as e:
+                logger.error(f"Error broadcasting state: {e}")
+
+    def _encode(self, event, data):
+        """Encode an event once, as the Engine.IO messages every client is sent."""
+        encoded = self.socketio.server.packet_class(packet.EVENT, namespace=self.namespace, data=[event, data]).encode()
+        return [eio_packet.Packet(eio_packet.MESSAGE, part) for part in (encoded if isinstance(encoded, list) else [encoded])]
+
+    def _send(self, eio_sid, messages):
+        for message in messages:
+            self.socketio.server.eio.send_packet(eio_sid, message)
+
+    def _fan_out(self, event, data):
+        """Send one update to every client that's keeping up."""
+        started = time.perf_counter()
+        messages = self._encode(event, data)
+        sent = skipped = 0
+        for sid, eio_sid in self._clients():
+            if sid in self.lagging:
+                continue
+            if self.backlog(eio_sid) >= self.backlog_limit:
+                # Updates only make sense applied in order, so the client waits for the full state instead
+                with self.condition:
+                    self.lagging.add(sid)
+                skipped += 1
+                continue
+            self._send(eio_sid, messages)
+            sent += 1
+
+        if sent:
+            UPDATES_SENT.inc(sent)
+        if skipped:
+            UPDATES_SKIPPED.inc(skipped)
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
+
+    def _resync_caught_up(self):
+        """Send the full state to lagging clients whose send queue has drained."""
+        with self.condition:
+            lagging = list(self.lagging)
+
+        ready = []
+        for sid in lagging:
+            eio_sid = self.socketio.server.manager.eio_sid_from_sid(sid, self.namespace)
+            if eio_sid is None:
+                # Disconnected
+                with self.condition:
+                    self.lagging.discard(sid)
+            elif self.backlog(eio_sid) < self.backlog_limit:
+                ready.append((sid, eio_sid))
+        if not ready:
+            return
+
+        # The snapshot is at least as new as every update already sent, so later updates apply on top of it
+        messages = self._encode(self.snapshot_event, self.snapshot())
+        with self.condition:
+            for sid, _ in ready:
+                self.lagging.discard(sid)
+        for sid, eio_sid in ready:
+            self._send(eio_sid, messages)
+        CLIENT_RESYNCS.inc(len(ready))
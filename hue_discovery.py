@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Bridge discovery - finds Hue Bridges on the local network without asking for an IP address,
+by probing every host on the subnet for the bridge's /api/config endpoint while listening for
+SSDP and mDNS answers, then registers with the bridge by polling until its link button is pressed.
+
+Only uses the standard library, so get_hue_username.py can use it too.
+
+Usage:
+    python hue_discovery.py                      # Search the local network
+    python hue_discovery.py 127.0.0.1:8000 ...   # Probe particular addresses (e.g. the simulator)
+"""
+
+import os
+import json
+import time
+import socket
+import struct
+import logging
+import argparse
+import ipaddress
+import threading
+import http.client
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DISCOVERY_FILE = 'hue-discovery.json'  # Bridges found by the last search
+DISCOVERY_VERSION = 1
+PROBE_TIMEOUT = 0.5  # Seconds to wait for one host to answer
+DISCOVERY_WORKERS = 128  # Hosts probed at once; a /24 takes two rounds of PROBE_TIMEOUT
+DISCOVERY_WAIT = 2.0  # Longest a search can take, in seconds
+LISTEN_TIME = 1.0  # Seconds to wait for SSDP and mDNS answers
+REGISTRATION_WAIT = 30  # Seconds to wait for the link button to be pressed
+REGISTRATION_INTERVAL = 1  # Seconds between registration attempts
+LINK_BUTTON_NOT_PRESSED = 101  # Hue API error type
+
+SSDP_ADDRESS = ('239.255.255.250', 1900)
+SSDP_SEARCH = (
+    'M-SEARCH * HTTP/1.1\r\n'
+    'HOST: 239.255.255.250:1900\r\n'
+    'MAN: "ssdp:discover"\r\n'
+    'MX: 1\r\n'
+    'ST: ssdp:all\r\n'
+    '\r\n'
+).encode()
+
+MDNS_ADDRESS = ('224.0.0.251', 5353)
+MDNS_SERVICE = '_hue._tcp.local'
+
+
+class DiscoveryError(Exception):
+    """Raised when no bridge can be found or registered with."""
+
+
+def probe_bridge(address, timeout=PROBE_TIMEOUT):
+    """Ask a host for its bridge config. Returns {'address', 'bridgeid', 'name', 'modelid'} or None.
+
+    address is an IP address or host, optionally with a port ("127.0.0.1:8000"). /api/config
+    answers without a username, so this works before registering.
+    """
+    connection = http.client.HTTPConnection(address, timeout=timeout)
+    try:
+        connection.request('GET', '/api/config')
+        response = connection.getresponse()
+        if response.status != 200:
+            return None
+        config = json.loads(response.read())
+    except (OSError, ValueError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+
+    if not isinstance(config, dict) or 'bridgeid' not in config:
+        return None
+    return {
+        'address': address,
+        'bridgeid': str(config['bridgeid']).upper(),
+        'name': config.get('name', ''),
+        'modelid': config.get('modelid', '')
+    }
+
+
+def local_address():
+    """Get this machine's address on the local network."""
+    # Connecting a UDP socket picks the outgoing interface without sending anything
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.connect(('10.255.255.255', 1))
+        return sock.getsockname()[0]
+
+
+def subnet_hosts(address=None, prefix=24):
+    """Get every host address on a subnet (by default the local /24), except the address itself."""
+    address = address or local_address()
+    network = ipaddress.ip_network(f"{address}/{prefix}", strict=False)
+    return [str(host) for host in network.hosts() if str(host) != address]
+
+
+def _ssdp_answer(data, sender):
+    """Get the address to probe from an SSDP answer, if it came from a Hue Bridge."""
+    headers = {}
+    for line in data.decode('latin-1').split('\r\n')[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'hue-bridgeid' not in headers and 'IpBridge' not in headers.get('server', ''):
+        return None
+    location = urlparse(headers.get('location', ''))
+    return location.netloc or sender[0]
+
+
+def _mdns_query():
+    """Build an mDNS PTR question for the Hue Bridge service, asking for a unicast answer."""
+    name = b''.join(bytes([len(label)]) + label.encode() for label in MDNS_SERVICE.split('.')) + b'\x00'
+    # Header: ID, flags, one question; then the name, type PTR and class IN with the unicast bit
+    return struct.pack('>HHHHHH', 0, 0, 1, 0, 0, 0) + name + struct.pack('>HH', 12, 0x8001)
+
+
+def _mdns_answer(data, sender):
+    """Get the address to probe from an mDNS answer, if it's about the Hue Bridge service."""
+    return sender[0] if b'\x04_hue\x04_tcp' in data else None
+
+
+def _listen(message, destination, parse, found, end):
+    """Send a multicast search and report the address parsed from every answer until end."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+            sock.sendto(message, destination)
+            while True:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return
+                sock.settimeout(remaining)
+                try:
+                    data, sender = sock.recvfrom(4096)
+                except socket.timeout:
+                    return
+                address = parse(data, sender)
+                if address:
+                    found(address)
+    except OSError as e:
+        logger.debug(f"Multicast search to {destination[0]} failed: {e}")
+
+
+def discover_bridges(hosts=None, timeout=PROBE_TIMEOUT, workers=DISCOVERY_WORKERS, wait=DISCOVERY_WAIT, listen=True):
+    """Search for Hue Bridges. Returns a list of probe_bridge() results, one per bridge.
+
+    Every address in hosts (by default the local /24) is probed at once, a bounded number
+    at a time, while SSDP and mDNS answers add any bridge that lives elsewhere. Gives up on
+    whatever hasn't answered after wait seconds.
+    """
+    if hosts is None:
+        try:
+            hosts = subnet_hosts()
+        except OSError as e:
+            logger.warning(f"Could not work out the local network to search: {e}")
+            hosts = []
+
+    end = time.monotonic() + wait
+    bridges = {}  # bridge ID -> probe result, so a bridge found several ways is listed once
+    probed = set()
+    futures = []
+    lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hue-discovery')
+
+    def check(address):
+        bridge = probe_bridge(address, timeout)
+        if bridge is not None:
+            with lock:
+                bridges.setdefault(bridge['bridgeid'], bridge)
+
+    def probe(address):
+        with lock:
+            if address in probed:
+                return
+            probed.add(address)
+            futures.append(executor.submit(check, address))
+
+    listeners = []
+    if listen:
+        listen_end = min(end, time.monotonic() + LISTEN_TIME)
+        for message, destination, parse in ((SSDP_SEARCH, SSDP_ADDRESS, _ssdp_answer),
+                                            (_mdns_query(), MDNS_ADDRESS, _mdns_answer)):
+            listener = threading.Thread(target=_listen, args=(message, destination, parse, probe, listen_end),
+                                        name='hue-discovery-listen', daemon=True)
+            listener.start()
+            listeners.append(listener)
+
+    for address in hosts:
+        probe(address)
+
+    # Wait for the sweep and the listeners (which may add probes) to finish, or for time to run out
+    while time.monotonic() < end:
+        with lock:
+            outstanding = [future for future in futures if not future.done()]
+        if not outstanding and not any(listener.is_alive() for listener in listeners):
+            break
+        time.sleep(0.02)
+    # Drop the probes that haven't started (shutdown's cancel_futures needs Python 3.9); running ones end at their timeout
+    with lock:
+        for future in futures:
+            future.cancel()
+    executor.shutdown(wait=False)
+
+    with lock:
+        return sorted(bridges.values(), key=lambda bridge: bridge['bridgeid'])
+
+
+def load_discovered(path=DISCOVERY_FILE):
+    """Load the bridges found by the last search. A missing or unreadable file is treated as empty."""
+    if not path or not os.path.exists(path):
+        return []
+
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != DISCOVERY_VERSION:
+            return []
+        return [bridge for bridge in data['bridges'] if bridge.get('address')]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.warning(f"Ignoring bridge discovery cache {path}: {e}")
+        return []
+
+
+def save_discovered(bridges, path=DISCOVERY_FILE):
+    """Save the bridges found by a search, replacing the file in one step."""
+    if not path:
+        return
+
+    try:
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump({'version': DISCOVERY_VERSION, 'time': time.time(), 'bridges': bridges}, f, indent=2)
+        os.replace(temporary_path, path)
+    except OSError as e:
+        logger.warning(f"Could not save discovered bridges to {path}: {e}")
+
+
+def find_bridges(path=DISCOVERY_FILE, refresh=False, **options):
+    """Get the Hue Bridges on the network, checking the cached ones first.
+
+    Cached bridges that still answer are returned straight away; otherwise the network is
+    searched (see discover_bridges for the options) and the result cached.
+    """
+    if not refresh:
+        cached = [bridge for bridge in (probe_bridge(entry['address']) for entry in load_discovered(path)) if bridge]
+        if cached:
+            return cached
+
+    bridges = discover_bridges(**options)
+    if bridges:
+        save_discovered(bridges, path)
+    return bridges
+
+
+def choose_bridge(interactive=True, path=DISCOVERY_FILE):
+    """Find the bridge to use and return its address.
+
+    Interactively, asks which bridge to use when several are found and for an address when
+    none are. Otherwise takes the first bridge found, and raises DiscoveryError if there is none.
+    """
+    print("Searching the network for Hue Bridges...")
+    bridges = find_bridges(path)
+
+    if not bridges:
+        if not interactive:
+            raise DiscoveryError("No Hue Bridge found on the local network. "
+                                 "Set \"ipAddress\" in hue-config.json or check the bridge is on the same network.")
+        return input("No Hue Bridge found. Please enter your Hue Bridge IP address: ").strip()
+
+    if len(bridges) == 1 or not interactive:
+        bridge = bridges[0]
+        print(f"Using Hue Bridge {bridge['name']} ({bridge['bridgeid']}) at {bridge['address']}")
+        return bridge['address']
+
+    print("Found several Hue Bridges:")
+    for index, bridge in enumerate(bridges, start=1):
+        print(f"{index}. {bridge['name']} ({bridge['bridgeid']}) at {bridge['address']}")
+    choice = input(f"Which bridge should be used? (1-{len(bridges)}, default 1): ").strip()
+    try:
+        return bridges[int(choice) - 1]['address'] if choice else bridges[0]['address']
+    except (ValueError, IndexError):
+        print("Invalid choice, using the first bridge")
+        return bridges[0]['address']
+
+
+def register(address, devicetype, wait=REGISTRATION_WAIT, interval=REGISTRATION_INTERVAL, timeout=PROBE_TIMEOUT * 4):
+    """Create a username on a bridge, retrying until its link button is pressed or wait seconds pass.
+
+    Nothing needs typing, so this works for headless setups too. Raises DiscoveryError on failure.
+    """
+    body = json.dumps({'devicetype': devicetype[:40]})
+    end = time.monotonic() + wait
+    while True:
+        connection = http.client.HTTPConnection(address, timeout=timeout)
+        try:
+            connection.request('POST', '/api', body, {'Content-Type': 'application/json'})
+            result = json.loads(connection.getresponse().read())[0]
+        except (OSError, ValueError, KeyError, IndexError, http.client.HTTPException) as e:
+            raise DiscoveryError(f"Could not register with the bridge at {address}: {e}")
+        finally:
+            connection.close()
+
+        if 'success' in result:
+            return result['success']['username']
+        error = result.get('error', {})
+        if error.get('type') != LINK_BUTTON_NOT_PRESSED:
+            raise DiscoveryError(f"Bridge at {address} refused registration: {error.get('description', result)}")
+        if time.monotonic() + interval > end:
+            raise DiscoveryError("The link button wasn't pressed in time.")
+        time.sleep(interval)
+
+
+def main():
+    """Search for Hue Bridges from the command line."""
+    parser = argparse.ArgumentParser(description="Find Hue Bridges on the local network")
+    parser.add_argument('hosts', nargs='*', help="Addresses to probe instead of the local network (host or host:port)")
+    parser.add_argument('--wait', type=float, default=DISCOVERY_WAIT, help=f"Seconds to search (default: {DISCOVERY_WAIT})")
+    parser.add_argument('--no-listen', action='store_true', help="Don't listen for SSDP and mDNS answers")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    bridges = discover_bridges(args.hosts or None, wait=args.wait, listen=not args.no_listen)
+    elapsed = time.monotonic() - started
+
+    for bridge in bridges:
+        print(f"{bridge['address']}: {bridge['name']} ({bridge['bridgeid']}, {bridge['modelid']})")
+    print(f"Found {len(bridges)} bridges in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
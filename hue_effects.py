@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Spatial effects - give each selected light its own phase offset along the theme's hue
+path, so the colors chase, wave or alternate across the lights instead of fading in step.
+"""
+
+import numpy as np
+
+EFFECTS = ('uniform', 'chase', 'wave', 'alternate')
+DEFAULT_EFFECT = 'uniform'
+WAVE_SPREAD = 0.25  # Share of a cycle the wave spans from the first light to the last
+
+
+def phase_offsets(effect, light_count):
+    """Get one phase offset per light, as a fraction of a cycle, in selection order.
+
+    Returns None for the uniform effect, where every light shares one frame.
+    - chase: the lights are spread evenly over the whole cycle, so every color is always showing
+    - wave: neighbouring lights are slightly apart, so a gentle gradient rolls along the lights
+    - alternate: every other light is half a cycle ahead
+    """
+    if effect not in EFFECTS:
+        raise ValueError(f"Unknown effect: {effect}")
+    if effect == 'uniform' or light_count < 2:
+        return None
+
+    index = np.arange(light_count, dtype=np.float64)
+    if effect == 'chase':
+        return index / light_count
+    if effect == 'wave':
+        return index / (light_count - 1) * WAVE_SPREAD
+    return np.mod(index, 2) / 2
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Bridge event stream - subscribes to the Hue API v2 event stream (server-sent events) so the
+bridge pushes every change to us: lights switched at the wall or from the Hue app, lights
+going unreachable, renamed, added or removed. Used in place of polling the light states.
+
+Usage:
+    python hue_eventstream.py 192.168.1.2 USERNAME        # Print a bridge's events
+    python hue_eventstream.py 127.0.0.1:8000 simulator --http
+"""
+
+import re
+import ssl
+import json
+import socket
+import logging
+import argparse
+import threading
+import http.client
+
+logger = logging.getLogger(__name__)
+
+EVENTSTREAM_PATH = '/eventstream/clip/v2'
+EVENTSTREAM_TIMEOUT = 120  # Seconds without a byte (not even a keepalive) before reconnecting
+RECONNECT_DELAY = 1  # Seconds before the first reconnect; doubled on every failure
+RECONNECT_MAX_DELAY = 30
+
+V1_LIGHT_PATH = re.compile(r'^/lights/(\d+)$')
+
+
+class EventStreamError(Exception):
+    """Raised when the bridge refuses the event stream."""
+
+
+def read_events(lines):
+    """Parse server-sent events from an iterable of lines (bytes). Yields (event ID, data) pairs."""
+    event_id, data = None, []
+    for raw_line in lines:
+        line = raw_line.decode('utf-8').rstrip('\r\n')
+        if not line:
+            # A blank line ends the event
+            if data:
+                yield event_id, '\n'.join(data)
+            event_id, data = None, []
+        elif line.startswith(':'):
+            continue  # Comment, e.g. the bridge's ": hi" greeting or a keepalive
+        else:
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'data':
+                data.append(value)
+            elif field == 'id':
+                event_id = value
+
+
+def v1_light_id(resource):
+    """Get the API v1 light ID of a v2 resource (a light, or its connectivity), or None."""
+    match = V1_LIGHT_PATH.match(resource.get('id_v1') or '')
+    return int(match.group(1)) if match else None
+
+
+def light_state_changes(resource):
+    """Get the shadow state attributes (on, reachable) a v2 update carries."""
+    changes = {}
+    if isinstance(resource.get('on'), dict) and 'on' in resource['on']:
+        changes['on'] = bool(resource['on']['on'])
+    if resource.get('type') == 'zigbee_connectivity' and 'status' in resource:
+        changes['reachable'] = resource['status'] == 'connected'
+    return changes
+
+
+class EventStream:
+    """Keep a bridge's event stream open in a background thread, reconnecting when it drops.
+
+    on_events is called with a list of (event type, resource) pairs for every message, where
+    the event type is "update", "add", "delete" or "error" and resource is the API v2 resource.
+    on_connect is called (with True on reconnects) each time the stream is opened, since
+    changes made while it was down were missed.
+    """
+
+    def __init__(self, address, username, on_events, on_connect=None, secure=True, timeout=EVENTSTREAM_TIMEOUT):
+        self.address = address
+        self.username = username
+        self.on_events = on_events
+        self.on_connect = on_connect
+        self.secure = secure  # Real bridges only serve API v2 over HTTPS, with a self-signed certificate
+        self.timeout = timeout
+        self.last_event_id = None
+        self.connected = False
+        self.connections = 0  # Times the stream has been opened
+        self.sock = None  # The open stream's socket, kept since http.client lets go of it once the response starts
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Open the stream in the background."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name=f'hue-eventstream-{self.address}')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Close the stream."""
+        self.stop_event.set()
+        sock = self.sock
+        if sock is not None:
+            # Unblock the read the thread is waiting in
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _connect(self):
+        if self.secure:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            return http.client.HTTPSConnection(self.address, timeout=self.timeout, context=context)
+        return http.client.HTTPConnection(self.address, timeout=self.timeout)
+
+    def _run(self):
+        """Listen until stopped, reconnecting with a growing delay."""
+        delay = RECONNECT_DELAY
+        while not self.stop_event.is_set():
+            try:
+                self._listen()
+                delay = RECONNECT_DELAY
+            except (OSError, ValueError, http.client.HTTPException, EventStreamError) as e:
+                if not self.stop_event.is_set():
+                    logger.warning(f"Event stream from {self.address} dropped: {e}")
+            finally:
+                self.connected = False
+            if self.stop_event.wait(delay):
+                break
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def _listen(self):
+        """Open the stream and hand its events on until it ends."""
+        connection = self._connect()
+        try:
+            headers = {'hue-application-key': self.username, 'Accept': 'text/event-stream'}
+            if self.last_event_id:
+                headers['Last-Event-ID'] = self.last_event_id
+            connection.connect()
+            self.sock = connection.sock
+            if self.stop_event.is_set():
+                return
+            connection.request('GET', EVENTSTREAM_PATH, headers=headers)
+            response = connection.getresponse()
+            if response.status != 200:
+                raise EventStreamError(f"HTTP {response.status} {response.reason}")
+
+            self.connected = True
+            self.connections += 1
+            logger.info(f"Listening to the event stream from {self.address}")
+            if self.on_connect is not None:
+                self._call(self.on_connect, self.connections > 1)
+
+            for event_id, data in read_events(iter(response.readline, b'')):
+                if event_id:
+                    self.last_event_id = event_id
+                events = [(container.get('type'), resource)
+                          for container in json.loads(data) for resource in container.get('data', [])]
+                if events:
+                    self._call(self.on_events, events)
+        finally:
+            self.sock = None
+            connection.close()
+
+    def _call(self, callback, argument):
+        # A failing handler shouldn't drop the stream (and miss the events after it)
+        try:
+            callback(argument)
+        except Exception as e:
+            logger.error(f"Error handling events from {self.address}: {e}")
+
+
+def main():
+    """Print a bridge's events from the command line."""
+    parser = argparse.ArgumentParser(description="Print the events a Hue Bridge pushes")
+    parser.add_argument('address', help="Bridge address (host or host:port)")
+    parser.add_argument('username', help="Bridge username (application key)")
+    parser.add_argument('--http', action='store_true', help="Use plain HTTP (the simulator) instead of HTTPS")
+    args = parser.parse_args()
+
+    def print_events(events):
+        for kind, resource in events:
+            print(f"{kind} {resource.get('type')} {resource.get('id_v1') or resource.get('id')}: "
+                  f"{json.dumps({key: value for key, value in resource.items() if key not in ('id', 'id_v1', 'type', 'owner')})}")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    stream = EventStream(args.address, args.username, print_events, secure=not args.http)
+    stream.start()
+    try:
+        stream.stop_event.wait()
+    except KeyboardInterrupt:
+        stream.stop()
+
+
+if __name__ == '__main__':
+    main()
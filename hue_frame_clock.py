@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Frame clock - paces the light show against absolute frame times on time.monotonic(),
+so bridge latency doesn't stretch the cycle, and keeps timing statistics.
+"""
+
+import time
+import math
+from collections import deque
+
+LATENESS_SMOOTHING = 0.1  # Weight of the newest frame in the average lateness
+FRAME_HISTORY = 4096  # Number of recent frame latencies kept for percentiles
+
+
+class FrameClock:
+    """Deadline-based frame clock that skips frames to catch up instead of running slow."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.frame = 0  # Index of the current frame
+        self.anchor_time = time.monotonic()  # Frame anchor_frame was due at anchor_time
+        self.anchor_frame = 0
+
+        # Statistics
+        self.frames = 0
+        self.skipped_frames = 0
+        self.lateness_last = 0.0
+        self.lateness_avg = 0.0
+        self.lateness_max = 0.0
+        self.cycle_started = self.anchor_time
+        self.cycle_time_last = None
+        self.frame_latencies = deque(maxlen=FRAME_HISTORY)  # Seconds from each frame's due time until its work was done
+
+    def frame_time(self, frame):
+        """Absolute (monotonic) time a frame is due."""
+        return self.anchor_time + (frame - self.anchor_frame) * self.interval
+
+    def next_frame_time(self):
+        """Absolute (monotonic) time the next frame is due."""
+        return self.frame_time(self.frame + 1)
+
+    def set_interval(self, interval):
+        """Change the frame interval from the current frame on, without a jump."""
+        if interval == self.interval:
+            return
+        self.anchor_time = self.frame_time(self.frame)
+        self.anchor_frame = self.frame
+        self.interval = interval
+
+    def reset(self):
+        """Make the current frame due now, e.g. after the show was paused or idle."""
+        self.anchor_time = time.monotonic()
+        self.anchor_frame = self.frame
+        self.cycle_started = self.anchor_time
+
+    def wait(self):
+        """Sleep until the next frame is due. Returns how many frames to advance (more than 1 when frames were skipped)."""
+        target = self.next_frame_time()
+        now = time.monotonic()
+        self.frame_latencies.append(now - self.frame_time(self.frame))
+        if now < target:
+            time.sleep(target - now)
+            now = time.monotonic()
+
+        # If we're more than a whole frame late, jump to the frame that is due now
+        due = self.anchor_frame + math.floor((now - self.anchor_time) / self.interval)
+        next_frame = max(self.frame + 1, due)
+        advanced = next_frame - self.frame
+        self.frame = next_frame
+
+        lateness = now - self.frame_time(next_frame)
+        self.frames += 1
+        self.skipped_frames += advanced - 1
+        self.lateness_last = lateness
+        self.lateness_avg += (lateness - self.lateness_avg) * LATENESS_SMOOTHING
+        self.lateness_max = max(self.lateness_max, lateness)
+        return advanced
+
+    def cycle_completed(self):
+        """Record that the show finished a full color cycle."""
+        now = time.monotonic()
+        self.cycle_time_last = now - self.cycle_started
+        self.cycle_started = now
+
+    def stats(self):
+        """Get timing statistics for the web interface."""
+        return {
+            'frame_interval': round(self.interval, 4),
+            'frames': self.frames,
+            'skipped_frames': self.skipped_frames,
+            'lateness_ms': round(self.lateness_last * 1000, 1),
+            'lateness_avg_ms': round(self.lateness_avg * 1000, 1),
+            'lateness_max_ms': round(self.lateness_max * 1000, 1),
+            'cycle_time': round(self.cycle_time_last, 2) if self.cycle_time_last is not None else None
+        }
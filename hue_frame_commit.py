@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Frame commit layer - collects light attribute changes for a frame and sends them
+to the Hue Bridge as a single state body per light, or as one group action when
+every light in the frame gets the same state. Lights whose circuit breaker is open
+are left out.
+"""
+
+import time
+import threading
+import logging
+
+from hue_scheduler import has_errors, AUDIO_LATENCY_SECONDS
+from hue_shadow_state import ShadowState
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCommit:
+    """Stage per-light state changes and commit each light's frame as one request.
+
+    Without a scheduler, commits call the bridge directly. With a BridgeScheduler,
+    commits are queued and the scheduler paces them to the bridge's command budget.
+    """
+
+    def __init__(self, bridge, group=None, scheduler=None, shadow=None, health=None):
+        self.bridge = bridge
+        self.group = group  # Optional GroupOutput used for uniform frames
+        self.scheduler = scheduler  # Optional BridgeScheduler that owns the bridge writes
+        # Last known state of each light: what we sent (or queued), refreshed by the shadow poll
+        self.shadow = shadow if shadow is not None else ShadowState(bridge)
+        self.health = health  # Optional LightHealth deciding which lights get commands
+        self.pending = {}  # light ID -> attributes staged for the next commit
+        self.lock = threading.Lock()
+
+    def stage(self, light_id, transitiontime=None, **state):
+        """Stage attribute changes for a light using Hue API names (on, hue, sat, bri)."""
+        with self.lock:
+            body = self.pending.setdefault(light_id, {})
+            body.update(state)
+            if transitiontime is not None:
+                body['transitiontime'] = int(transitiontime)
+
+    def stage_many(self, light_ids, transitiontime=None, **columns):
+        """Stage a frame for several lights at once.
+
+        Each attribute (and the transition time) is either one value for every light
+        or a sequence with a value per light, in the order of light_ids.
+        """
+        if transitiontime is not None:
+            columns['transitiontime'] = transitiontime if isinstance(transitiontime, (list, tuple)) else int(transitiontime)
+        names = list(columns)
+        values = [column if isinstance(column, (list, tuple)) else [column] * len(light_ids)
+                  for column in columns.values()]
+        with self.lock:
+            for light_id, light_values in zip(light_ids, zip(*values)):
+                self.pending.setdefault(light_id, {}).update(zip(names, light_values))
+
+    def delta(self, light_id, body):
+        """Drop attributes that already match the light's known state."""
+        last = self.shadow.states.get(light_id, {})
+        changes = {key: value for key, value in body.items()
+                   if key != 'transitiontime' and last.get(key) != value}
+
+        # A transition time on its own doesn't change anything on the bridge
+        if changes and 'transitiontime' in body:
+            changes['transitiontime'] = body['transitiontime']
+        return changes
+
+    def invalidate(self, light_id=None):
+        """Forget what was last sent so the next commit resends every attribute."""
+        self.shadow.forget(light_id)
+
+    def commit(self, deadline=None, captured=None):
+        """Send the staged frame, as one group action if possible or one set_light call per light.
+
+        deadline (a time.monotonic() value) is passed on to the scheduler, which drops or
+        stops waiting for commands that haven't gone out by then. captured is the time.monotonic()
+        the audio the frame follows was captured, for measuring audio latency.
+        Returns the number of requests sent (or queued). With a scheduler, the changed lights
+        are queued in one batch.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+
+        if self._use_group(pending):
+            return self._commit_group(pending, deadline, captured)
+
+        if self.scheduler is not None:
+            return self._queue_lights(pending, deadline, captured)
+
+        requests_sent = 0
+        for light_id, body in pending.items():
+            changes = self.delta(light_id, body)
+            if changes and self._allowed(light_id) and self._send_light(light_id, changes):
+                requests_sent += 1
+                if captured is not None:
+                    AUDIO_LATENCY_SECONDS.observe(time.monotonic() - captured)
+
+        return requests_sent
+
+    def _queue_lights(self, pending, deadline=None, captured=None):
+        """Queue every changed light on the scheduler in one batch."""
+        commands = []
+        for light_id, body in pending.items():
+            changes = self.delta(light_id, body)
+            if changes and self._allowed(light_id):
+                commands.append((light_id, changes))
+
+        if commands:
+            self.scheduler.submit_lights(commands, on_error=self.invalidate, deadline=deadline, captured=captured)
+            self.shadow.update_many((light_id, self._recorded(changes)) for light_id, changes in commands)
+        return len(commands)
+
+    def _allowed(self, light_id):
+        """Check whether a light gets its changes (it doesn't while its breaker is open)."""
+        return self.health is None or self.health.allow(light_id)
+
+    @staticmethod
+    def _recorded(changes):
+        """Get the attributes of a command that stay on the light (everything but the transition time)."""
+        return {key: value for key, value in changes.items() if key != 'transitiontime'}
+
+    def _record(self, light_id, changes):
+        """Remember the attributes sent to a light."""
+        self.shadow.update(light_id, self._recorded(changes))
+
+    def _send_light(self, light_id, changes):
+        """Send one light's changes straight to the bridge."""
+        try:
+            # set_light adds its own keys to the dict it's given, so pass a copy
+            result = self.bridge.set_light(light_id, dict(changes))
+        except Exception as e:
+            self._failed(light_id, logging.ERROR, f"Error updating light {light_id}: {e}")
+            return False
+
+        if has_errors(result):
+            self._failed(light_id, logging.WARNING, f"Bridge rejected update for light {light_id}: {result}")
+            return True
+
+        if self.health is not None:
+            self.health.record_success(light_id)
+        self._record(light_id, changes)
+        return True
+
+    def _failed(self, light_id, level, message):
+        if self.health is not None:
+            self.health.record_failure(light_id, message)
+        else:
+            logger.log(level, message)
+        self.invalidate(light_id)
+
+    def _use_group(self, pending):
+        """Decide whether this frame should go out as a single group action."""
+        if self.group is None or len(pending) < 2:
+            return False
+
+        # Only uniform frames can be sent to a group
+        bodies = iter(pending.values())
+        first = next(bodies)
+        if any(body != first for body in bodies):
+            return False
+
+        # The group must hold exactly these lights, and the group rate limit must allow it
+        if not self.group.covers(pending.keys()):
+            return False
+        if self.scheduler is not None:
+            return self.scheduler.group_available()
+        return self.group.available()
+
+    def _commit_group(self, pending, deadline=None, captured=None):
+        """Send a uniform frame as one group action and record it for every member light."""
+        body = next(iter(pending.values()))
+
+        # Send each attribute that is out of date on any member light
+        changes = {}
+        for light_id in pending:
+            changes.update(self.delta(light_id, body))
+        if not changes:
+            return 0
+
+        if self.scheduler is not None:
+            self.scheduler.submit_group(self.group.group_id, changes, members=list(pending),
+                                        on_error=lambda group_id: self.invalidate(), deadline=deadline,
+                                        captured=captured)
+        else:
+            try:
+                result = self.group.send(changes)
+            except Exception as e:
+                logger.error(f"Error updating bridge group {self.group.group_id}: {e}")
+                self.invalidate()
+                return 0
+
+            if has_errors(result):
+                logger.warning(f"Bridge rejected update for group {self.group.group_id}: {result}")
+                self.invalidate()
+                return 1
+            if captured is not None:
+                AUDIO_LATENCY_SECONDS.observe(time.monotonic() - captured)
+
+        for light_id in pending:
+            self._record(light_id, changes)
+        return 1
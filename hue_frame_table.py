@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Frame tables - precompute every step of a light show cycle in one NumPy pass so the
+show loop only has to look frames up by index.
+"""
+
+import numpy as np
+
+TOTAL_STEPS = 360  # Steps per full color cycle
+
+
+class FrameTable:
+    """One full show cycle in Hue-native units, stored as typed arrays.
+
+    Arrays are indexed by step. Per-light tables (compiled with phase offsets)
+    are indexed by [light, step].
+    """
+
+    __slots__ = ('steps', 'step_time', 'transitiontime', 'params',
+                 'hue', 'sat', 'bri', 'hue_degrees', 'brightness', 'rgb', 'keyframes', 'scenes', 'light_ids')
+
+    def __init__(self):
+        self.keyframes = None  # Optional KeyframePlan: send only keyframes and let the bridge fade between them
+        self.scenes = None  # Optional ScenePlan: recall per-light keyframes stored as bridge scenes
+        self.light_ids = None  # Light ID of each row of a per-light table
+
+    def frame(self, step):
+        """Get the (hue, sat, bri) values to send for a step of a shared table."""
+        return self.hue[step].item(), self.sat[step].item(), self.bri[step].item()
+
+    def light_frames(self, step, rows=slice(None)):
+        """Get the (hue, sat, bri) values of a per-light table's lights (all, or the given rows) for a step, as lists."""
+        return self.hue[rows, step].tolist(), self.sat[rows, step].tolist(), self.bri[rows, step].tolist()
+
+    def _preview(self, step):
+        # The web interface previews the first light of a per-light table
+        return step if self.light_ids is None else (0, step)
+
+    def display(self, step):
+        """Get the hue (degrees) and brightness (%) shown in the web interface for a step."""
+        index = self._preview(step)
+        return round(self.hue_degrees[index].item(), 2), round(self.brightness[index].item(), 2)
+
+    def color(self, step):
+        """Get the preview color for a step as a hex string."""
+        return f"#{self.rgb[self._preview(step)].item():06x}"
+
+
+def hue_to_rgb_array(hue_degrees):
+    """Convert an array of hue values (0-360) to packed 0xRRGGBB integers at full saturation."""
+    h = np.mod(hue_degrees, 360)
+    x = 1 - np.abs(np.mod(h / 60, 2) - 1)
+    sector = np.minimum((h // 60).astype(np.intp), 5)
+
+    # Channel values for each 60° sector: 1 = full, 'x' = rising/falling, 0 = off
+    ones = np.ones_like(x)
+    zeros = np.zeros_like(x)
+    r = np.choose(sector, [ones, x, zeros, zeros, x, ones])
+    g = np.choose(sector, [x, ones, ones, x, zeros, zeros])
+    b = np.choose(sector, [zeros, zeros, x, ones, ones, x])
+
+    r, g, b = [(channel * 255).astype(np.uint32) for channel in (r, g, b)]
+    return (r << 16) | (g << 8) | b
+
+
+def cycle_curve(progress, hue_start, hue_end, min_brightness, max_brightness):
+    """Get the hue (degrees) and brightness (%) at positions in the cycle (0 to 1).
+
+    The hue ramps linearly from hue_start to hue_end over the cycle and the brightness
+    follows one period of a sine wave between min_brightness and max_brightness.
+    """
+    # Map the cycle onto the theme's hue range
+    hue_degrees = hue_start + progress * (hue_end - hue_start)
+
+    # Use a sine wave to smoothly transition between min and max brightness
+    brightness_offset = (np.sin(progress * 2 * np.pi) + 1) / 2  # 0 to 1
+    brightness = min_brightness + brightness_offset * (max_brightness - min_brightness)
+    return hue_degrees, brightness
+
+
+def compile_frame_table(hue_start, hue_end, min_brightness, max_brightness, full_cycle_time,
+                        transition_time, steps=TOTAL_STEPS, phase_offsets=None, light_ids=None):
+    """Build the frame table for a whole cycle.
+
+    The cycle follows cycle_curve(). phase_offsets, if given, holds one offset per
+    light as a fraction of a cycle and produces a per-light table whose rows
+    belong to light_ids, in order.
+    """
+    position = np.arange(steps, dtype=np.float64)
+    if phase_offsets is not None:
+        offsets = np.asarray(phase_offsets, dtype=np.float64)
+        position = np.mod(position[np.newaxis, :] + offsets[:, np.newaxis] * steps, steps)
+    progress = position / steps
+    hue_degrees, brightness = cycle_curve(progress, hue_start, hue_end, min_brightness, max_brightness)
+
+    table = FrameTable()
+    table.steps = steps
+    table.step_time = full_cycle_time / steps
+    table.transitiontime = int(transition_time * 10)  # Philips Hue uses 1/10 of a second as the unit
+    table.params = (hue_start, hue_end, min_brightness, max_brightness, full_cycle_time, transition_time, steps)
+    if phase_offsets is not None:
+        table.light_ids = tuple(light_ids) if light_ids is not None else tuple(range(len(offsets)))
+
+    # Convert values to Philips Hue format
+    table.hue = (hue_degrees / 360 * 65535).astype(np.uint16)
+    table.bri = (brightness / 100 * 254).astype(np.uint8)  # Convert percentage to 0-254
+    table.sat = np.full(hue_degrees.shape, 254, dtype=np.uint8)  # 254 = 100% saturation for vibrant colors
+
+    table.hue_degrees = hue_degrees.astype(np.float32)
+    table.brightness = brightness.astype(np.float32)
+    table.rgb = hue_to_rgb_array(hue_degrees)
+    return table
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Group output - keeps a temporary bridge LightGroup in sync with the selected lights
+so a uniform frame can be sent as a single group action.
+"""
+
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+GROUP_NAME = 'hue-light-show'  # Name of the temporary group created on the bridge
+GROUP_COMMAND_INTERVAL = 1.0  # The bridge handles roughly one group command per second
+
+
+class GroupOutput:
+    """Own a temporary LightGroup on the bridge that mirrors the selected lights."""
+
+    def __init__(self, bridge, name=GROUP_NAME, command_interval=GROUP_COMMAND_INTERVAL):
+        self.bridge = bridge
+        self.name = name
+        self.command_interval = command_interval
+        self.group_id = None
+        self.light_ids = frozenset()
+        self.last_command = 0.0
+        self.lock = threading.Lock()
+
+    def sync(self, light_ids):
+        """Create or reuse the bridge group and make its members match light_ids."""
+        light_ids = frozenset(light_ids)
+
+        with self.lock:
+            if self.group_id is not None and light_ids == self.light_ids:
+                return True
+
+            try:
+                if self.group_id is None:
+                    self.group_id = self._find_group()
+
+                if self.group_id is None:
+                    result = self.bridge.create_group(self.name, sorted(light_ids))
+                    self.group_id = int(result[0]['success']['id'])
+                    logger.info(f"Created bridge group '{self.name}' (ID: {self.group_id})")
+                else:
+                    self.bridge.set_group(self.group_id, 'lights', sorted(light_ids))
+
+                self.light_ids = light_ids
+                logger.info(f"Bridge group {self.group_id} now holds {len(light_ids)} lights")
+                return True
+            except Exception as e:
+                logger.error(f"Error syncing bridge group: {e}")
+                self.light_ids = frozenset()
+                return False
+
+    def _find_group(self):
+        """Look for a group left on the bridge by a previous run."""
+        groups = self.bridge.get_group() or {}
+        for group_id, group in groups.items():
+            if group.get('name') == self.name and group.get('type', 'LightGroup') == 'LightGroup':
+                logger.info(f"Reusing existing bridge group '{self.name}' (ID: {group_id})")
+                return int(group_id)
+        return None
+
+    def covers(self, light_ids):
+        """Check whether the group holds exactly these lights."""
+        return self.group_id is not None and frozenset(light_ids) == self.light_ids
+
+    def available(self):
+        """Check whether the group command budget allows another command now."""
+        return time.monotonic() - self.last_command >= self.command_interval
+
+    def send(self, action):
+        """Send an action to every light in the group with one request."""
+        self.last_command = time.monotonic()
+        # set_group adds its own keys to the dict it's given, so pass a copy
+        return self.bridge.set_group(self.group_id, dict(action))
+
+    def remove(self):
+        """Delete the temporary group from the bridge."""
+        with self.lock:
+            if self.group_id is None:
+                return
+
+            try:
+                self.bridge.delete_group(self.group_id)
+                logger.info(f"Removed bridge group {self.group_id}")
+            except Exception as e:
+                logger.error(f"Error removing bridge group {self.group_id}: {e}")
+
+            self.group_id = None
+            self.light_ids = frozenset()
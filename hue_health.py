@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Light health - a circuit breaker per light, so a light that stops answering (e.g. switched
+off at the wall) is left out of the frames instead of costing a timeout every frame. After
+a few failures in a row the breaker opens and the light is skipped; it's tried again after
+a backoff that doubles every time the light still fails. Also limits how often repeated
+errors about the same light are logged.
+"""
+
+import time
+import threading
+import logging
+
+import hue_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = 3  # Failures in a row that open a light's breaker
+PROBE_BACKOFF = 2.0  # Seconds before the first retry of a light whose breaker opened
+PROBE_MAX_BACKOFF = 60.0  # Longest wait between retries
+PROBE_TIMEOUT = 10.0  # Seconds before a retry that never reported back is given up on
+LOG_INTERVAL = 30.0  # Seconds between log messages about the same light
+
+CLOSED = 'closed'  # Healthy: commands are sent
+OPEN = 'open'  # Failing: commands are skipped until the next retry
+HALF_OPEN = 'half_open'  # One command is out to see whether the light is back
+
+BREAKER_TRANSITIONS = metrics.counter(
+    'hue_light_breaker_transitions_total',
+    "Light circuit breaker changes by new state: open (light skipped), half_open (retried) and closed (back)",
+    ['state']
+)
+
+
+class LogLimiter:
+    """Log repeated messages about the same thing at most once per interval, counting those held back."""
+
+    def __init__(self, log=logger, interval=LOG_INTERVAL):
+        self.log = log
+        self.interval = interval
+        self.last = {}  # key -> (time of the last message logged, messages held back since)
+        self.lock = threading.Lock()
+
+    def __call__(self, level, key, message):
+        now = time.monotonic()
+        with self.lock:
+            logged, held_back = self.last.get(key, (None, 0))
+            if logged is not None and now - logged < self.interval:
+                self.last[key] = (logged, held_back + 1)
+                return
+            self.last[key] = (now, 0)
+        if held_back:
+            message = f"{message} ({held_back} similar messages in the last {now - logged:.0f}s not logged)"
+        self.log.log(level, message)
+
+    def forget(self, key):
+        """Log the next message about key straight away."""
+        with self.lock:
+            self.last.pop(key, None)
+
+
+class Breaker:
+    """Circuit breaker state of one light."""
+
+    __slots__ = ('state', 'failures', 'backoff', 'retry_at', 'probe_sent')
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0  # Failures in a row
+        self.backoff = 0.0
+        self.retry_at = 0.0  # time.monotonic() of the next retry while open
+        self.probe_sent = 0.0  # time.monotonic() the retry command was let through while half open
+
+
+class LightHealth:
+    """Track which of a bridge's lights answer commands, and keep failing ones out of the frames.
+
+    shadow is an optional ShadowState: while it reports a light unreachable (from the poll or the
+    event stream), its retries are put off without sending anything.
+    """
+
+    def __init__(self, shadow=None, threshold=FAILURE_THRESHOLD, backoff=PROBE_BACKOFF,
+                 max_backoff=PROBE_MAX_BACKOFF, probe_timeout=PROBE_TIMEOUT):
+        self.shadow = shadow
+        self.threshold = threshold
+        self.initial_backoff = backoff
+        self.max_backoff = max_backoff
+        self.probe_timeout = probe_timeout
+        self.breakers = {}  # light ID -> Breaker, only for lights that have failed
+        self.log = LogLimiter()
+        self.lock = threading.Lock()
+
+    def allow(self, light_id):
+        """Check whether to send a command to a light now. Cheap for healthy lights."""
+        if light_id not in self.breakers:
+            return True
+
+        now = time.monotonic()
+        with self.lock:
+            breaker = self.breakers.get(light_id)
+            if breaker is None or breaker.state == CLOSED:
+                return True
+            if breaker.state == HALF_OPEN:
+                if now - breaker.probe_sent < self.probe_timeout:
+                    return False  # The retry is still out
+            elif now < breaker.retry_at:
+                return False
+            elif self.shadow is not None and self.shadow.get(light_id, 'reachable') is False:
+                # The bridge itself can't see the light; wait longer before trying it
+                self._reopen(breaker, now)
+                return False
+            else:
+                self._transition(breaker, HALF_OPEN)
+            breaker.probe_sent = now
+            return True
+
+    def record_success(self, light_id):
+        """Record a command to a light that went through."""
+        if light_id not in self.breakers:
+            return
+        with self.lock:
+            breaker = self.breakers.pop(light_id, None)
+            if breaker is not None and breaker.state != CLOSED:
+                self._transition(breaker, CLOSED)
+                logger.info(f"Light {light_id} is answering again")
+        self.log.forget(light_id)
+
+    def record_failure(self, light_id, error):
+        """Record a failed command to a light; opens its breaker after too many in a row."""
+        now = time.monotonic()
+        with self.lock:
+            breaker = self.breakers.setdefault(light_id, Breaker())
+            breaker.failures += 1
+            if breaker.state == HALF_OPEN:
+                self._reopen(breaker, now)
+                self._transition(breaker, OPEN)
+                message = f"Light {light_id} still failing, retrying in {breaker.backoff:.0f}s ({error})"
+            elif breaker.state == CLOSED and breaker.failures >= self.threshold:
+                breaker.backoff = 0.0
+                self._reopen(breaker, now)
+                self._transition(breaker, OPEN)
+                message = (f"Light {light_id} failed {breaker.failures} times in a row, skipping it "
+                           f"for {breaker.backoff:.0f}s ({error})")
+            else:
+                message = None
+
+        if message is not None:
+            logger.warning(message)
+        else:
+            self.log(logging.ERROR, light_id, str(error))
+
+    def report(self):
+        """Get the lights that aren't healthy: {light ID: {'state', 'failures'}}."""
+        with self.lock:
+            return {light_id: {'state': breaker.state, 'failures': breaker.failures}
+                    for light_id, breaker in self.breakers.items() if breaker.state != CLOSED}
+
+    def skipped(self):
+        """Count the lights being left out of the frames."""
+        with self.lock:
+            return sum(1 for breaker in self.breakers.values() if breaker.state != CLOSED)
+
+    def _reopen(self, breaker, now):
+        # Back off exponentially between retries
+        breaker.backoff = min(self.max_backoff, breaker.backoff * 2 if breaker.backoff else self.initial_backoff)
+        breaker.retry_at = now + breaker.backoff
+
+    @staticmethod
+    def _transition(breaker, state):
+        breaker.state = state
+        BREAKER_TRANSITIONS.labels(state).inc()
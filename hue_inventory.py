@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Light inventory cache - what the bridges' lights are (names, models and capabilities),
+read with one request per bridge and saved next to hue-config.json so the web version
+can start serving straight away and check the bridges in the background.
+"""
+
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_FILE = 'hue-inventory.json'
+INVENTORY_VERSION = 1
+
+# Light types by the archetype the Hue app assigns, then by model ID prefix
+ARCHETYPE_TYPES = {
+    'huelightstrip': "Light Strip", 'hueplay': "Light Bar", 'huebloom': "Lamp", 'hueiris': "Lamp",
+    'huego': "Lamp", 'tableshade': "Lamp", 'floorshade': "Lamp", 'tablewash': "Lamp",
+    'classicbulb': "Bulb", 'sultanbulb': "Bulb", 'candlebulb': "Bulb", 'spotbulb': "Bulb",
+    'vintagebulb': "Bulb", 'flood': "Flood Light", 'ceilinground': "Ceiling Light",
+    'pendantround': "Pendant", 'pendantlong': "Pendant"
+}
+MODEL_TYPES = (
+    ('LST', "Light Strip"), ('LCL', "Light Strip"), ('LLC', "Lamp"), ('LCT', "Bulb"),
+    ('LCA', "Bulb"), ('LCE', "Bulb"), ('LCG', "Bulb"), ('LTW', "Bulb"), ('LWB', "Bulb"), ('LWA', "Bulb")
+)
+
+
+def classify_light(info):
+    """Get a light's type for the web interface from its archetype, model ID or, failing those, its name."""
+    archetype = info.get('config', {}).get('archetype', '').lower()
+    if archetype in ARCHETYPE_TYPES:
+        return ARCHETYPE_TYPES[archetype]
+
+    model_id = info.get('modelid', '')
+    for prefix, light_type in MODEL_TYPES:
+        if model_id.startswith(prefix):
+            return light_type
+
+    # Try to determine light type from the name
+    name = info.get('name', '').lower()
+    if 'strip' in name:
+        return "Light Strip"
+    if 'bulb' in name:
+        return "Bulb"
+    if 'lamp' in name:
+        return "Lamp"
+    return "Unknown"
+
+
+def describe_light(info):
+    """Get the inventory entry for a light from its bridge API representation."""
+    control = info.get('capabilities', {}).get('control', {})
+    return {
+        'name': info.get('name', ''),
+        'type': classify_light(info),
+        'modelid': info.get('modelid'),
+        'productname': info.get('productname'),
+        'manufacturer': info.get('manufacturername'),
+        'uniqueid': info.get('uniqueid'),
+        'color': 'colorgamuttype' in control or 'color' in info.get('type', '').lower(),
+        'ct': 'ct' in control,
+        'gamut': control.get('colorgamuttype')
+    }
+
+
+def fetch_lights(bridge):
+    """Read every light on a bridge with one request. Returns {light ID: inventory entry}."""
+    lights = bridge.get_light()
+    return {int(light_id): describe_light(info) for light_id, info in lights.items()}
+
+
+def load_inventory(path=INVENTORY_FILE):
+    """Load the cached inventory: {bridge name: {'address': ..., 'lights': {light ID: entry}}}.
+
+    A missing, unreadable or outdated cache is treated as empty.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != INVENTORY_VERSION:
+            return {}
+        return {
+            name: {'address': bridge['address'],
+                   'lights': {int(light_id): entry for light_id, entry in bridge['lights'].items()}}
+            for name, bridge in data['bridges'].items()
+        }
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.warning(f"Ignoring light inventory cache {path}: {e}")
+        return {}
+
+
+def save_inventory(inventory, path=INVENTORY_FILE):
+    """Save the inventory, replacing the cache file in one step so a crash never leaves half a file."""
+    if not path:
+        return
+
+    data = {
+        'version': INVENTORY_VERSION,
+        'bridges': {
+            name: {'address': bridge['address'],
+                   'lights': {str(light_id): entry for light_id, entry in bridge['lights'].items()}}
+            for name, bridge in inventory.items()
+        }
+    }
+    try:
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(temporary_path, path)
+    except OSError as e:
+        logger.warning(f"Could not save the light inventory to {path}: {e}")
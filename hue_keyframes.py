@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Keyframe planner - finds the fewest keyframes whose straight-line fades (in Hue units,
+with the transition time set to the segment's length) follow the show's color cycle
+within a tolerance, so the bridge interpolates long stretches of the cycle by itself.
+"""
+
+import numpy as np
+
+from hue_frame_table import cycle_curve
+
+KEYFRAME_TOLERANCE = 2.0  # Largest error allowed: degrees of hue or percentage points of brightness
+
+
+class KeyframePlan:
+    """Segments of one show cycle, in frame table steps.
+
+    Segment k starts at step starts[k] and fades the lights to its target values
+    by step ends[k]. A segment with ends[k] == starts[k] is an instant jump.
+    """
+
+    __slots__ = ('starts', 'ends', 'hue', 'sat', 'bri', 'step_time', 'tolerance', 'max_error')
+
+    def segment(self, step):
+        """Get the index of the segment a step falls in."""
+        return int(np.searchsorted(self.starts, step, side='right')) - 1
+
+    def command(self, segment, step):
+        """Get the (hue, sat, bri, transitiontime) to send for a segment, starting at step.
+
+        Starting late (e.g. after skipped frames) shortens the transition so the
+        fade still lands on time.
+        """
+        remaining = max(0, self.ends[segment].item() - step)
+        transitiontime = int(round(remaining * self.step_time * 10))  # Philips Hue uses 1/10 of a second as the unit
+        return self.hue[segment].item(), self.sat[segment].item(), self.bri[segment].item(), transitiontime
+
+    def after_jump(self, segment):
+        """Check whether a segment directly follows an instant jump."""
+        return segment > 0 and self.ends[segment - 1] == self.starts[segment - 1]
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def _segment_error(hue_degrees, brightness, start, end):
+    """Largest error between the curve over steps start..end and a straight fade between its ends."""
+    fraction = np.arange(end - start + 1) / (end - start)
+    hue_fade = hue_degrees[start] + (hue_degrees[end] - hue_degrees[start]) * fraction
+    brightness_fade = brightness[start] + (brightness[end] - brightness[start]) * fraction
+    return max(np.abs(hue_fade - hue_degrees[start:end + 1]).max(),
+               np.abs(brightness_fade - brightness[start:end + 1]).max())
+
+
+def plan_keyframes(table, tolerance=KEYFRAME_TOLERANCE):
+    """Plan the keyframes for a (single-light) frame table.
+
+    Segments are grown greedily for as long as the fade stays within tolerance.
+    The cycle end is always a keyframe, and if the hue doesn't come back to where
+    it started (the hue wraps from hue_end to hue_start), each cycle begins with
+    an instant jump instead of a fade backwards through the hue range; the lights
+    hold the jump's color for the first step.
+    """
+    hue_start, hue_end, min_brightness, max_brightness = table.params[:4]
+    steps = table.steps
+
+    # The curve at every step, plus the end of the cycle
+    progress = np.arange(steps + 1, dtype=np.float64) / steps
+    hue_degrees, brightness = cycle_curve(progress, hue_start, hue_end, min_brightness, max_brightness)
+
+    starts, ends = [], []
+    max_error = 0.0
+    start = 0
+    if hue_degrees[steps] != hue_degrees[0]:
+        starts.append(0)
+        ends.append(0)
+        start = 1
+
+    while start < steps:
+        end = start + 1
+        while end < steps:
+            error = _segment_error(hue_degrees, brightness, start, end + 1)
+            if error > tolerance:
+                break
+            end += 1
+        max_error = max(max_error, _segment_error(hue_degrees, brightness, start, end))
+        starts.append(start)
+        ends.append(end)
+        start = end
+
+    ends = np.array(ends, dtype=np.intp)
+    plan = KeyframePlan()
+    plan.starts = np.array(starts, dtype=np.intp)
+    plan.ends = ends
+    # Convert values to Philips Hue format
+    plan.hue = (hue_degrees[ends] / 360 * 65535).astype(np.uint16)
+    plan.bri = (brightness[ends] / 100 * 254).astype(np.uint8)  # Convert percentage to 0-254
+    plan.sat = np.full(len(ends), 254, dtype=np.uint8)
+    plan.step_time = table.step_time
+    plan.tolerance = tolerance
+    plan.max_error = max_error
+    return plan
@@ -9,7 +9,11 @@ import os
 import time
 import sys
 import math
-from phue import Bridge
+import socket
+from hue_transport import PooledBridge, BRIDGE_POOL_SIZE, BRIDGE_TIMEOUT
+from hue_frame_commit import FrameCommit
+from hue_health import LightHealth
+from hue_discovery import choose_bridge, register, REGISTRATION_WAIT
 
 # Configuration
 CONFIG_FILE = 'hue-config.json'
@@ -25,7 +29,12 @@ def get_bridge_connection():
             config = json.load(f)
         
         print(f"Using saved connection to bridge at {config['ipAddress']}")
-        bridge = Bridge(config['ipAddress'])
+        bridge = PooledBridge(
+            config['ipAddress'],
+            config.get('username'),
+            pool_size=config.get('poolSize', BRIDGE_POOL_SIZE),
+            timeout=config.get('timeout', BRIDGE_TIMEOUT)
+        )
         
         # If the bridge is already authorized, this won't do anything
         # If not, it will raise an exception
@@ -40,20 +49,18 @@ def get_bridge_connection():
     
     # No saved credentials, need to discover and authenticate
     print("No saved configuration found.")
-    ip_address = input("Please enter your Hue Bridge IP address: ")
-    
-    print("Press the link button on your Hue Bridge within the next 30 seconds...")
-    print("Then press Enter to continue...")
-    input()
-    
     try:
-        bridge = Bridge(ip_address)
+        ip_address = choose_bridge(sys.stdin.isatty())
+        
+        print(f"Press the link button on your Hue Bridge within the next {REGISTRATION_WAIT} seconds...")
+        username = register(ip_address, f"{APP_NAME}#{socket.gethostname()}")
+        bridge = PooledBridge(ip_address, username)
         bridge.connect()
         
         # Save the config for future use
         config = {
             "ipAddress": ip_address,
-            "username": bridge.username
+            "username": username
         }
         
         with open(CONFIG_FILE, 'w') as f:
@@ -116,9 +123,13 @@ def start_color_fade(light):
     """Start the color fading effect."""
     print("Starting color fade effect. Press Ctrl+C to stop.")
     
+    # Each frame goes to the bridge as one request with only the changed attributes. If the
+    # light stops answering (e.g. switched off at the wall), it's only retried now and then
+    frame_commit = FrameCommit(light.bridge, health=LightHealth())
+    
     # First, make sure the light is on with 100% brightness
-    light.on = True
-    light.brightness = 254  # 254 = 100% brightness (Philips Hue API uses 0-254 scale)
+    frame_commit.stage(light.light_id, on=True, bri=254)  # 254 = 100% brightness (Philips Hue API uses 0-254 scale)
+    frame_commit.commit()
     
     # Calculate how many steps we need for a smooth transition
     total_steps = 360  # Using hue values from 0-360 (HSV color model)
@@ -134,9 +145,13 @@ def start_color_fade(light):
             hue_value = int((hue / 360) * 65535)
             
             # Set the light state with the new color
-            light.transitiontime = int(TRANSITION_TIME * 10)  # Philips Hue uses 1/10 of a second as the unit
-            light.hue = hue_value
-            light.saturation = 254  # 254 = 100% saturation for vibrant colors (Philips Hue API uses 0-254 scale)
+            frame_commit.stage(
+                light.light_id,
+                transitiontime=TRANSITION_TIME * 10,  # Philips Hue uses 1/10 of a second as the unit
+                hue=hue_value,
+                sat=254  # 254 = 100% saturation for vibrant colors (Philips Hue API uses 0-254 scale)
+            )
+            frame_commit.commit()
             
             # Increment the step
             current_step = (current_step + 1) % 360
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Scene output - plays frames in which every light has its own color by storing each
+frame on the bridge as a scene and recalling it with a single group command, instead
+of sending one request per light. A show's frames are compiled into keyframes ahead
+of time; the bridge fades each light from one scene to the next. Only a small working
+set of scenes is kept on the bridge (the bridge has room for about 200, shared with
+the user's own), reused least recently used first, and identical frames share a scene.
+"""
+
+import threading
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+import hue_metrics as metrics
+from hue_scheduler import has_errors
+
+logger = logging.getLogger(__name__)
+
+SCENE_NAME = 'hue-light-show'  # Name prefix of the scenes created on the bridge
+SCENE_WORKING_SET = 32  # Scenes kept on the bridge per show
+SCENE_INTERVAL = 2.0  # Seconds between scene recalls: room for a recall and storing the next scene in the group budget
+SCENE_TABLE_FULL = 301  # Bridge error type when there's no room for another scene
+ALL_LIGHTS_GROUP = 0  # Recalling a scene on group 0 sets every light in the scene
+
+SCENE_LOOKUPS = metrics.counter(
+    'hue_scene_lookups_total',
+    "Frames looked up in the scene working set by outcome: hit (already stored) or miss (stored now)",
+    ['outcome']
+)
+SCENE_HITS = SCENE_LOOKUPS.labels('hit')
+SCENE_MISSES = SCENE_LOOKUPS.labels('miss')
+SCENE_EVICTIONS = metrics.counter('hue_scene_evictions_total', "Scenes overwritten to make room in the working set")
+
+
+class ScenePlan:
+    """Keyframes of a per-light frame table, evenly spaced in steps.
+
+    Segment k starts at step starts[k], and its scene fades every light to the
+    table's values at step ends[k] (which wraps to step 0 at the end of the cycle).
+    """
+
+    __slots__ = ('starts', 'ends', 'step_time', 'interval')
+
+    def segment(self, step):
+        """Get the index of the segment a step falls in."""
+        return int(np.searchsorted(self.starts, step, side='right')) - 1
+
+    def frame(self, table, segment, rows, light_ids):
+        """Get a segment's scene for some of the table's lights (rows), as {light ID: state}.
+
+        A light whose hue wraps around (from the end of the theme's hue range back to its
+        start) during the segment jumps there instead of fading back through the range.
+        """
+        start, end = self.starts[segment].item(), self.ends[segment].item() % table.steps
+        transitiontime = int(round((self.ends[segment] - start).item() * self.step_time * 10))
+        hue, sat, bri = table.light_frames(end, rows)
+        direction = 1 if table.params[1] >= table.params[0] else -1
+        wraps = ((table.hue_degrees[rows, end] - table.hue_degrees[rows, start]) * direction < 0).tolist()
+        return {
+            light_id: {'on': True, 'hue': hue[index], 'sat': sat[index], 'bri': bri[index],
+                       'transitiontime': 0 if wraps[index] else transitiontime}
+            for index, light_id in enumerate(light_ids)
+        }
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def plan_scenes(table, interval=SCENE_INTERVAL):
+    """Plan a scene per interval seconds of a per-light frame table's cycle."""
+    steps_per_scene = max(1, int(np.ceil(interval / table.step_time)))
+    plan = ScenePlan()
+    plan.starts = np.arange(0, table.steps, steps_per_scene, dtype=np.intp)
+    plan.ends = np.minimum(plan.starts + steps_per_scene, table.steps)
+    plan.step_time = table.step_time
+    plan.interval = interval
+    return plan
+
+
+def frame_key(frame):
+    """Get a hashable key of a frame, so identical frames map to the same scene."""
+    return tuple(sorted((light_id, tuple(sorted(state.items()))) for light_id, state in frame.items()))
+
+
+class SceneOutput:
+    """Store frames as scenes on one bridge and recall them, keeping an LRU working set of scenes.
+
+    Bridge writes go through the BridgeScheduler as one-off calls when one is given, so
+    they're paced with the group commands; a newer frame replaces one still waiting. Each
+    call sends a single request: a frame that isn't stored yet takes one call to store
+    and another to recall.
+    """
+
+    def __init__(self, bridge, scheduler=None, shadow=None, capacity=SCENE_WORKING_SET, name=SCENE_NAME):
+        self.bridge = bridge
+        self.scheduler = scheduler
+        self.shadow = shadow  # Optional ShadowState to record the recalled states in
+        self.capacity = capacity
+        self.name = name
+        self.scenes = OrderedDict()  # Frame key -> scene ID on the bridge, least recently used first
+        self.current = None  # Key of the frame last recalled
+        self.created = 0  # Scenes created so far, for their names
+        self.lock = threading.Lock()
+        self.store_lock = threading.Lock()  # One store at a time, so a frame is never stored twice
+
+    def start(self):
+        """Queue the removal of scenes a previous run left on the bridge."""
+        self._submit('scene_list', self._remove_leftovers)
+
+    def recall(self, frame):
+        """Show a frame ({light ID: state}), storing it as a scene first unless it's in the working set.
+
+        Returns the number of commands queued (0 if the frame is already showing).
+        """
+        key = frame_key(frame)
+        with self.lock:
+            if key == self.current:
+                return 0
+            self.current = key
+
+        self._submit('scene_recall', lambda: self._recall(key, frame))
+        if self.shadow is not None:
+            self.shadow.update_many((light_id, {name: value for name, value in state.items() if name != 'transitiontime'})
+                                    for light_id, state in frame.items())
+        return 1
+
+    def prefetch(self, frame):
+        """Store a frame that's coming up as a scene, unless it's in the working set already."""
+        key = frame_key(frame)
+        with self.lock:
+            if key in self.scenes:
+                return
+        self._submit('scene_store', lambda: self._store(key, frame))
+
+    def stats(self):
+        with self.lock:
+            return {'scenes': len(self.scenes), 'capacity': self.capacity}
+
+    def clear(self):
+        """Delete every scene this output created from the bridge, one queued call per scene."""
+        with self.lock:
+            scene_ids = list(self.scenes.values())
+            self.scenes.clear()
+            self.current = None
+        for scene_id in scene_ids:
+            self._submit(('scene_delete', scene_id), lambda scene_id=scene_id: self._delete(scene_id))
+        if scene_ids:
+            logger.info(f"Removing {len(scene_ids)} scenes from the bridge")
+
+    def _submit(self, key, function):
+        # Once the scheduler has stopped (shutting down) there's nothing left to pace against
+        if self.scheduler is not None and self.scheduler.running:
+            self.scheduler.submit_call(key, function)
+        else:
+            function()
+
+    def _request(self, mode, address, data=None):
+        return self.bridge.request(mode, f'/api/{self.bridge.username}{address}', data)
+
+    def _recall(self, key, frame):
+        with self.lock:
+            scene_id = self.scenes.get(key)
+            if scene_id is not None:
+                self.scenes.move_to_end(key)
+                SCENE_HITS.inc()
+
+        if scene_id is None:
+            # Storing takes this call's request; the recall goes out as a call of its own, unless a newer frame replaced it
+            if self._store(key, frame):
+                with self.lock:
+                    current = self.current == key
+                if current:
+                    self._submit('scene_recall', lambda: self._recall(key, frame))
+            return
+
+        result = self.bridge.set_group(ALL_LIGHTS_GROUP, {'scene': scene_id})
+        if has_errors(result):
+            self._failed(key, f"Bridge rejected recall of scene {scene_id}: {result}")
+
+    def _failed(self, key, message):
+        logger.warning(message)
+        with self.lock:
+            if self.current == key:
+                self.current = None
+        # What the lights show is unknown now, so the next frame resends everything
+        if self.shadow is not None:
+            self.shadow.forget()
+
+    def _store(self, key, frame):
+        """Store a frame as a scene with one request, creating it or overwriting the least recently used one.
+
+        Returns whether the frame is stored now (or can be once the bridge's scene table is known to be full).
+        """
+        with self.store_lock:
+            with self.lock:
+                if key in self.scenes:
+                    return True
+                SCENE_MISSES.inc()
+                reuse = self._evict() if len(self.scenes) >= self.capacity else None
+
+            body = {
+                'lights': [str(light_id) for light_id in frame],
+                'lightstates': {str(light_id): state for light_id, state in frame.items()}
+            }
+            if reuse is not None:
+                result = self._request('PUT', f'/scenes/{reuse}', body)
+            else:
+                self.created += 1
+                result = self._request('POST', '/scenes', dict(body, name=f"{self.name} {self.created}", recycle=True))
+
+            if not has_errors(result):
+                with self.lock:
+                    self.scenes[key] = reuse if reuse is not None else result[0]['success']['id']
+                return True
+
+            if reuse is None and self._table_full(result):
+                # The bridge is out of room: work with the scenes already stored, overwriting one on the next try
+                with self.lock:
+                    stored = len(self.scenes)
+                    self.capacity = max(1, stored)
+                logger.warning(f"The bridge has no room for more scenes; keeping {self.capacity} in the working set")
+                if stored:
+                    return True
+
+        self._failed(key, f"Bridge rejected scene for a frame of {len(frame)} lights: {result}")
+        return False
+
+    def _evict(self):
+        """Take the least recently used scene out of the working set to reuse its slot. Call with the lock held."""
+        _, scene_id = self.scenes.popitem(last=False)
+        SCENE_EVICTIONS.inc()
+        return scene_id
+
+    @staticmethod
+    def _table_full(result):
+        return any(isinstance(item, dict) and item.get('error', {}).get('type') == SCENE_TABLE_FULL
+                   for item in (result if isinstance(result, list) else [result]))
+
+    def _delete(self, scene_id):
+        try:
+            self._request('DELETE', f'/scenes/{scene_id}')
+        except Exception as e:
+            logger.error(f"Error removing scene {scene_id}: {e}")
+
+    def _remove_leftovers(self):
+        """Find scenes a previous run left on the bridge and queue their removal."""
+        # Held so a scene stored meanwhile is already in the working set when the list is compared to it
+        with self.store_lock:
+            try:
+                scenes = self._request('GET', '/scenes') or {}
+            except Exception as e:
+                logger.error(f"Error reading the bridge's scenes: {e}")
+                return
+            with self.lock:
+                ours = set(self.scenes.values())
+
+        leftovers = [scene_id for scene_id, scene in scenes.items()
+                     if scene.get('name', '').startswith(f"{self.name} ") and scene_id not in ours]
+        for scene_id in leftovers:
+            self._submit(('scene_delete', scene_id), lambda scene_id=scene_id: self._delete(scene_id))
+        if leftovers:
+            logger.info(f"Removing {len(leftovers)} scenes left on the bridge by an earlier run")
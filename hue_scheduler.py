@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Bridge command scheduler - owns every write to the Hue Bridge and paces them to
+the bridge's command budget, keeping only the newest pending command per light.
+"""
+
+import time
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import hue_metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+LIGHT_COMMANDS_PER_SECOND = 10  # The bridge handles about 10 light commands per second
+GROUP_COMMANDS_PER_SECOND = 1  # ...and about one group command per second
+LIGHT_BURST = 2  # Light commands that may go out back to back after an idle period
+GROUP_BURST = 1
+LATENCY_SMOOTHING = 0.1  # Weight of the newest command in the average bridge latency
+
+AUDIO_LATENCY_SECONDS = metrics.histogram(
+    'hue_audio_latency_seconds', "Time from audio capture until the bridge has answered a light command it drives")
+
+
+class TokenBucket:
+    """Token bucket that refills at a fixed rate up to a burst size."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        """Check whether a token can be taken right now."""
+        self._refill()
+        return self.tokens >= 1
+
+    def try_acquire(self):
+        """Take a token if one is available."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self):
+        """Seconds until the next token is available."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class BridgeScheduler:
+    """Single writer for the bridge with last-write-wins queues and token-bucket pacing.
+
+    With concurrency above 1, commands the budget allows are fanned out in parallel
+    over a bounded worker pool, so one slow light doesn't hold up the others.
+    Commands can carry a deadline (a time.monotonic() value): queued commands that
+    pass it are abandoned, and lights whose command lands after it are recorded.
+    They can also carry the time.monotonic() the audio they follow was captured, to
+    measure audio latency up to the bridge's answer.
+    A light with a command in flight never gets a second one, so a slow light
+    collects newer state in its queue slot instead of piling up requests.
+    """
+
+    def __init__(self, bridge, light_rate=LIGHT_COMMANDS_PER_SECOND, group_rate=GROUP_COMMANDS_PER_SECOND,
+                 concurrency=1, health=None):
+        self.bridge = bridge
+        self.health = health  # Optional LightHealth told how each light command went (and logging its errors)
+        self.light_bucket = TokenBucket(light_rate, LIGHT_BURST)
+        self.group_bucket = TokenBucket(group_rate, GROUP_BURST)
+        self.concurrency = max(1, concurrency)
+
+        # Each queue maps a key to [payload, on_error, deadline, captured]
+        self.pending_lights = OrderedDict()  # light ID -> state
+        self.pending_groups = OrderedDict()  # group ID -> action
+        self.pending_calls = OrderedDict()   # key -> function, for one-off writes such as group membership
+        self.in_flight = set()  # (kind, key) of commands currently being sent
+
+        self.condition = threading.Condition()
+        self.thread = None
+        self.executor = None
+        self.running = False
+
+        # Statistics
+        self.sent = 0
+        self.replaced = 0
+        self.dropped = 0
+        self.errors = 0
+        self.missed = 0  # Light commands that missed their deadline (dropped or landed late)
+        self.missed_lights = {}  # light ID -> number of commands that missed their deadline
+        self.latency_avg = None  # Smoothed round trip of a light command, in seconds
+
+    def start(self):
+        """Start the worker thread that sends queued commands."""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+
+        if self.concurrency > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='bridge-dispatch')
+
+        self.thread = threading.Thread(target=self._run, name='bridge-scheduler')
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"Bridge command scheduler started ({self.concurrency} concurrent commands)")
+
+    def stop(self):
+        """Stop the worker and drop anything still queued."""
+        with self.condition:
+            self.running = False
+            self.dropped += self.queue_depth()
+            self.pending_lights.clear()
+            self.pending_groups.clear()
+            self.pending_calls.clear()
+            self.condition.notify_all()
+
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        logger.info("Bridge command scheduler stopped")
+
+    def submit_light(self, light_id, state, on_error=None, deadline=None, captured=None):
+        """Queue a state change for a light, merging it into any command still waiting."""
+        self.submit_lights([(light_id, state)], on_error, deadline, captured)
+
+    def submit_lights(self, commands, on_error=None, deadline=None, captured=None):
+        """Queue a frame's (light ID, state) changes in one go, merging them into commands still waiting."""
+        with self.condition:
+            for light_id, state in commands:
+                pending = self.pending_lights.get(light_id)
+                if pending is None:
+                    self.pending_lights[light_id] = [dict(state), on_error, deadline, captured]
+                else:
+                    # Newer values win; the command keeps its place in the queue
+                    pending[0].update(state)
+                    pending[1] = on_error or pending[1]
+                    pending[2] = deadline
+                    pending[3] = captured
+                    self.replaced += 1
+            self.condition.notify()
+
+    def submit_group(self, group_id, action, members=(), on_error=None, deadline=None, captured=None):
+        """Queue a group action, superseding older queued attributes for its member lights."""
+        with self.condition:
+            for light_id in members:
+                pending = self.pending_lights.get(light_id)
+                if pending is None:
+                    continue
+
+                for key in action:
+                    pending[0].pop(key, None)
+                if not pending[0].keys() - {'transitiontime'}:
+                    del self.pending_lights[light_id]
+                    self.dropped += 1
+
+            pending = self.pending_groups.get(group_id)
+            if pending is None:
+                self.pending_groups[group_id] = [dict(action), on_error, deadline, captured]
+            else:
+                pending[0].update(action)
+                pending[1] = on_error or pending[1]
+                pending[2] = deadline
+                pending[3] = captured
+                self.replaced += 1
+            self.condition.notify()
+
+    def submit_call(self, key, function):
+        """Queue a one-off bridge write; a newer call with the same key replaces an older one."""
+        with self.condition:
+            if key in self.pending_calls:
+                self.replaced += 1
+            self.pending_calls[key] = [function, None, None, None]
+            self.condition.notify()
+
+    def group_available(self):
+        """Check whether a group action would be sent without waiting."""
+        with self.condition:
+            return not self.pending_groups and not self.pending_calls and self.group_bucket.available()
+
+    def light_capacity(self):
+        """Estimate how many light commands per second the bridge can take right now.
+
+        That's the light command budget, or fewer if commands take so long that the
+        concurrent slots can't keep up with it.
+        """
+        with self.condition:
+            if not self.latency_avg:
+                return self.light_bucket.rate
+            return min(self.light_bucket.rate, self.concurrency / self.latency_avg)
+
+    def busy(self, light_id):
+        """Check whether a command that affects a light is still queued or being sent."""
+        with self.condition:
+            return (light_id in self.pending_lights or ('light', light_id) in self.in_flight or
+                    bool(self.pending_groups) or any(kind == 'group' for kind, _ in self.in_flight))
+
+    def queue_depth(self):
+        """Number of commands waiting to be sent."""
+        return len(self.pending_lights) + len(self.pending_groups) + len(self.pending_calls)
+
+    def stats(self):
+        """Get queue and command statistics."""
+        with self.condition:
+            return {
+                'queue_depth': self.queue_depth(),
+                'in_flight': len(self.in_flight),
+                'sent': self.sent,
+                'replaced': self.replaced,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'missed': self.missed,
+                'latency_ms': round(self.latency_avg * 1000, 1) if self.latency_avg is not None else None,
+                'missed_lights': dict(self.missed_lights)
+            }
+
+    def _next_batch(self):
+        """Pop the commands the budget allows right now. Call with the condition held.
+
+        Returns (batch, expired, wait): the commands to send, queued commands whose
+        deadline has passed, and how long to wait for a token if nothing could be sent.
+        """
+        now = time.monotonic()
+        batch, expired = [], []
+        wait_time = None
+        queues = [
+            (self.pending_calls, self.group_bucket, 'call'),
+            (self.pending_groups, self.group_bucket, 'group'),
+            (self.pending_lights, self.light_bucket, 'light')
+        ]
+
+        for queue, bucket, kind in queues:
+            for key in list(queue):
+                if len(batch) + len(self.in_flight) >= self.concurrency:
+                    return batch, expired, wait_time
+
+                # A light with a command still in flight keeps collecting newer state until it's back
+                if (kind, key) in self.in_flight:
+                    continue
+
+                command = queue[key]
+                if command[2] is not None and command[2] < now:
+                    del queue[key]
+                    expired.append((kind, key, command))
+                    continue
+
+                if not bucket.try_acquire():
+                    bucket_wait = bucket.wait_time()
+                    wait_time = bucket_wait if wait_time is None else min(wait_time, bucket_wait)
+                    break
+
+                del queue[key]
+                batch.append((kind, key, command))
+
+        return batch, expired, wait_time
+
+    def _run(self):
+        """Worker loop: send queued commands as the token buckets allow."""
+        while True:
+            with self.condition:
+                while self.running and not (self.queue_depth() and len(self.in_flight) < self.concurrency):
+                    self.condition.wait()
+                if not self.running:
+                    break
+
+                batch, expired, wait_time = self._next_batch()
+                for kind, key, command in batch:
+                    self.in_flight.add((kind, key))
+
+                if not batch and not expired:
+                    # Wait for a token or a finished command; newer submissions can still replace queued ones
+                    self.condition.wait(wait_time)
+                    continue
+
+            for kind, key, command in expired:
+                self._expire(kind, key, command)
+            if batch:
+                self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        """Send a batch of commands, in parallel if the scheduler is concurrent."""
+        if self.executor is None:
+            for command in batch:
+                self._execute(*command)
+            return
+
+        # Don't wait for the batch: each worker frees its slot when its command is back
+        for command in batch:
+            self.executor.submit(self._execute, *command)
+
+    def _expire(self, kind, key, command):
+        """Abandon a queued command that missed its deadline."""
+        with self.condition:
+            self.dropped += 1
+            if kind == 'light':
+                self.missed += 1
+                self.missed_lights[key] = self.missed_lights.get(key, 0) + 1
+
+        # Whatever it carried never reached the bridge, so let the caller resend it
+        on_error = command[1]
+        if on_error is not None:
+            on_error(key)
+
+    def _execute(self, kind, key, command):
+        """Send one command to the bridge."""
+        payload, on_error, deadline, captured = command
+        error = None  # Message of what went wrong, if anything
+        started = time.monotonic()
+        try:
+            if kind == 'call':
+                payload()
+                result = None
+            elif kind == 'group':
+                result = self.bridge.set_group(key, payload)
+            else:
+                result = self.bridge.set_light(key, payload)
+
+            if has_errors(result):
+                error = f"Bridge rejected {kind} command for {key}: {result}"
+                if kind != 'light' or self.health is None:
+                    logger.warning(error)
+        except Exception as e:
+            error = f"Error sending {kind} command for {key}: {e}"
+            if kind != 'light' or self.health is None:
+                logger.error(error)
+
+        if kind == 'light' and self.health is not None:
+            if error:
+                self.health.record_failure(key, error)
+            else:
+                self.health.record_success(key)
+        if error and on_error is not None:
+            on_error(key)
+        elif not error and captured is not None:
+            AUDIO_LATENCY_SECONDS.observe(time.monotonic() - captured)
+
+        with self.condition:
+            self.in_flight.discard((kind, key))
+            self.sent += 1
+            if error:
+                self.errors += 1
+            if kind == 'light':
+                now = time.monotonic()
+                latency = now - started
+                if self.latency_avg is None:
+                    self.latency_avg = latency
+                else:
+                    self.latency_avg += (latency - self.latency_avg) * LATENCY_SMOOTHING
+                if deadline is not None and now > deadline:
+                    self.missed += 1
+                    self.missed_lights[key] = self.missed_lights.get(key, 0) + 1
+            self.condition.notify()
+
+
+def has_errors(result):
+    """Check a bridge response for error entries."""
+    if isinstance(result, dict):
+        return 'error' in result
+    if isinstance(result, list):
+        return any(has_errors(item) for item in result)
+    return False
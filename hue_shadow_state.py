@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Shadow light state - a local copy of every light's state, kept up to date from our
+own writes and a low-frequency poll (or the bridge's event stream), so the show loop
+never has to ask the bridge.
+"""
+
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+SHADOW_POLL_INTERVAL = 10  # Seconds between full refreshes from the bridge
+STATE_KEYS = ('on', 'hue', 'sat', 'bri', 'reachable')  # Light state attributes we keep a copy of
+
+
+class ShadowState:
+    """Cached state for every light, refreshed with a single GET of all lights."""
+
+    def __init__(self, bridge, poll_interval=SHADOW_POLL_INTERVAL):
+        self.bridge = bridge
+        self.poll_interval = poll_interval
+        self.states = {}  # light ID -> {attribute: value}
+        self.writes = 0  # Number of updates recorded so far
+        self.written = {}  # light ID -> value of writes at the light's last update
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def get(self, light_id, key, default=None):
+        """Get one cached attribute of a light."""
+        return self.states.get(light_id, {}).get(key, default)
+
+    def state(self, light_id):
+        """Get a copy of the cached state of a light."""
+        with self.lock:
+            return dict(self.states.get(light_id, {}))
+
+    def update(self, light_id, changes):
+        """Record attributes we've sent to a light."""
+        with self.lock:
+            self.states.setdefault(light_id, {}).update(changes)
+            self.writes += 1
+            self.written[light_id] = self.writes
+
+    def update_many(self, changes):
+        """Record the attributes sent to several lights, as (light ID, changes) pairs."""
+        with self.lock:
+            self.writes += 1
+            for light_id, light_changes in changes:
+                self.states.setdefault(light_id, {}).update(light_changes)
+                self.written[light_id] = self.writes
+
+    def observe(self, light_id, changes):
+        """Record attributes the bridge reports a light has (e.g. pushed on its event stream).
+
+        Returns the attributes that differ from the cached ones.
+        """
+        with self.lock:
+            state = self.states.setdefault(light_id, {})
+            changed = {key: value for key, value in changes.items() if state.get(key) != value}
+            state.update(changed)
+        return changed
+
+    def forget(self, light_id=None):
+        """Drop cached state so the next write resends everything.
+
+        Whether a light is reachable isn't something we write, so that's kept.
+        """
+        with self.lock:
+            if light_id is None:
+                states, self.states = self.states, {}
+                self.written.clear()
+            else:
+                states = {light_id: self.states.pop(light_id, {})}
+                self.written.pop(light_id, None)
+            for forgotten_id, state in states.items():
+                if 'reachable' in state:
+                    self.states[forgotten_id] = {'reachable': state['reachable']}
+
+    def refresh(self):
+        """Reload the state of every light from the bridge with one request.
+
+        Lights written to while the request was out keep what we sent them, since
+        the bridge's answer may predate it.
+        """
+        with self.lock:
+            writes = self.writes
+        lights = self.bridge.get_light()
+
+        states = {}
+        for light_id, light in lights.items():
+            state = light.get('state', {})
+            states[int(light_id)] = {key: state[key] for key in STATE_KEYS if key in state}
+
+        with self.lock:
+            for light_id, written in self.written.items():
+                if written > writes and light_id in self.states:
+                    states.setdefault(light_id, {}).update(self.states[light_id])
+            self.states = states
+        return states
+
+    def start(self):
+        """Start polling the bridge in the background."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._poll, name='shadow-state-poll')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop the background poll."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _poll(self):
+        """Refresh the cache until stopped."""
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing light states: {e}")
+            self.stop_event.wait(self.poll_interval)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Show parameters - the settings the web interface controls (theme, brightness range, speed,
+effect, keyframe and scene options) held in one immutable snapshot. Changing a setting builds a new
+snapshot and swaps it in with a single assignment, so the show thread reads one consistent
+set of parameters per frame without taking a lock.
+"""
+
+FIELDS = ('theme', 'hue_start', 'hue_end', 'min_brightness', 'max_brightness',
+          'transition_time', 'full_cycle_time', 'effect', 'keyframes', 'keyframe_tolerance', 'scenes')
+
+
+class ShowParams:
+    """An immutable snapshot of the show parameters. Use replace() to get a changed copy."""
+
+    __slots__ = FIELDS
+
+    def __init__(self, theme, hue_start, hue_end, min_brightness, max_brightness,
+                 transition_time, full_cycle_time, effect, keyframes, keyframe_tolerance, scenes):
+        set_field = object.__setattr__
+        set_field(self, 'theme', theme)
+        set_field(self, 'hue_start', hue_start)  # Hue range in degrees (0-360)
+        set_field(self, 'hue_end', hue_end)
+        set_field(self, 'min_brightness', min_brightness)  # Brightness range in percent
+        set_field(self, 'max_brightness', max_brightness)
+        set_field(self, 'transition_time', transition_time)  # Seconds
+        set_field(self, 'full_cycle_time', full_cycle_time)  # Seconds
+        set_field(self, 'effect', effect)  # How the lights are spread along the theme's hue path
+        set_field(self, 'keyframes', keyframes)  # Send only planned keyframes and let the bridge fade
+        set_field(self, 'keyframe_tolerance', keyframe_tolerance)
+        set_field(self, 'scenes', scenes)  # Play per-light effects by recalling frames stored as bridge scenes
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ShowParams is immutable; use replace() to change {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"ShowParams is immutable; can't delete {name}")
+
+    def replace(self, **changes):
+        """Get a copy with some parameters changed."""
+        unknown = set(changes) - set(FIELDS)
+        if unknown:
+            raise TypeError(f"Unknown show parameters: {', '.join(sorted(unknown))}")
+        return ShowParams(**dict(self.as_dict(), **changes))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in FIELDS}
+
+    def __eq__(self, other):
+        if not isinstance(other, ShowParams):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELDS)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in FIELDS))
+
+    def __repr__(self):
+        return f"ShowParams({', '.join(f'{name}={getattr(self, name)!r}' for name in FIELDS)})"
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Show timelines - a whole show compiled ahead of time into a compact binary file of
+fixed-width records (time, light, hue, sat, bri, transition), played back by memory
+mapping the file so even multi-hour shows start instantly and use little memory.
+
+Usage:
+    python hue_timeline.py compile show.hlt --cycles 120 --effect chase --lights 8
+    python hue_timeline.py import keyframes.csv show.hlt
+    python hue_timeline.py info show.hlt
+"""
+
+import os
+import csv
+import struct
+import argparse
+
+import numpy as np
+
+from hue_frame_table import compile_frame_table, TOTAL_STEPS
+from hue_effects import EFFECTS, DEFAULT_EFFECT, phase_offsets
+
+TIMELINE_MAGIC = b'HUETL\x00'
+TIMELINE_VERSION = 1
+TIMELINE_DIRECTORY = 'timelines'  # Where the web version compiles and looks up timelines
+TIMELINE_EXTENSION = '.hlt'
+TIMELINE_FRAME_TIME = 0.1  # Seconds between playback frames (the Hue transition time unit)
+ALL_LIGHTS = 0xFFFF  # Light slot of records that apply to every light
+PLAYBACK_WINDOW = 1024  # Record times read per lookup during playback
+
+# Header: magic, format version, light slots, duration (ms), record count
+HEADER = struct.Struct('<6sHIIQ')
+
+# One 12-byte record per light command, sorted by time. Lights are slots (0 = the first selected
+# light) so a show can be played on any lights; time is in milliseconds from the start of the show
+RECORD_DTYPE = np.dtype([
+    ('time', '<u4'),
+    ('light', '<u2'),
+    ('hue', '<u2'),
+    ('sat', 'u1'),
+    ('bri', 'u1'),
+    ('transitiontime', '<u2')  # 1/10 s, like the Hue API
+])
+
+
+class TimelineError(Exception):
+    """Raised when a timeline or keyframe file can't be read."""
+
+
+class Timeline:
+    """A memory-mapped timeline file. Records are only read from disk as playback reaches them."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise TimelineError(f"{path} is too short to be a timeline")
+
+        magic, version, self.light_count, self.duration_ms, count = HEADER.unpack(header)
+        if magic != TIMELINE_MAGIC:
+            raise TimelineError(f"{path} is not a timeline file")
+        if version != TIMELINE_VERSION:
+            raise TimelineError(f"{path} has unsupported timeline version {version}")
+        if os.path.getsize(path) < HEADER.size + count * RECORD_DTYPE.itemsize:
+            raise TimelineError(f"{path} is truncated")
+
+        if count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        self.times = self.records['time']  # A strided view on the mapping, not a copy
+
+    @property
+    def name(self):
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    @property
+    def duration(self):
+        """Length of the show in seconds."""
+        return self.duration_ms / 1000
+
+    def __len__(self):
+        return len(self.records)
+
+    def info(self):
+        """Describe the timeline for the web interface."""
+        return {
+            'name': self.name,
+            'duration': self.duration,
+            'records': len(self),
+            'lights': self.light_count
+        }
+
+
+class TimelinePlayer:
+    """Walks a timeline, handing out the records that have come due."""
+
+    def __init__(self, timeline):
+        self.timeline = timeline
+        self.position = 0  # Index of the next record to play
+
+    def advance(self, elapsed):
+        """Get the records due up to elapsed seconds into the show, as a view on the mapped file."""
+        target = int(elapsed * 1000)
+        times = self.timeline.times
+        end = self.position
+
+        # Search a small window ahead of the play position rather than the whole file,
+        # so the cost of a frame doesn't grow with the length of the show
+        while end < len(times):
+            window = times[end:end + PLAYBACK_WINDOW]
+            due = int(np.searchsorted(window, target, side='right'))
+            end += due
+            if due < len(window):
+                break
+
+        records = self.timeline.records[self.position:end]
+        self.position = end
+        return records
+
+    @property
+    def finished(self):
+        return self.position >= len(self.timeline)
+
+    def rewind(self):
+        """Go back to the start of the show."""
+        self.position = 0
+
+
+def write_timeline(path, chunks, light_count, duration_ms):
+    """Write a timeline file from an iterable of record arrays, each already sorted by time.
+
+    Chunks are written as they come, so a long show never has to be held in memory.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION, light_count, duration_ms, 0))
+        for chunk in chunks:
+            np.asarray(chunk, dtype=RECORD_DTYPE).tofile(f)
+            count += len(chunk)
+
+        # Fill in the record count now that it's known
+        f.seek(0)
+        f.write(HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION, light_count, duration_ms, count))
+    return Timeline(path)
+
+
+def _table_records(table):
+    """Get one cycle of a frame table as timeline records (shared tables use ALL_LIGHTS)."""
+    steps = table.steps
+    step_times = np.round(np.arange(steps) * table.step_time * 1000).astype(np.uint32)
+    if table.light_ids is None:
+        records = np.zeros(steps, dtype=RECORD_DTYPE)
+        records['time'] = step_times
+        records['light'] = ALL_LIGHTS
+    else:
+        # Step-major order keeps the records sorted by time
+        lights = len(table.light_ids)
+        records = np.zeros(steps * lights, dtype=RECORD_DTYPE)
+        records['time'] = np.repeat(step_times, lights)
+        records['light'] = np.tile(np.arange(lights, dtype=np.uint16), steps)
+    records['hue'] = table.hue.T.ravel()
+    records['sat'] = table.sat.T.ravel()
+    records['bri'] = table.bri.T.ravel()
+    records['transitiontime'] = table.transitiontime
+    return records
+
+
+def compile_table_timeline(path, table, cycles=1):
+    """Compile a number of cycles of a frame table into a timeline file."""
+    cycle_records = _table_records(table)
+    cycle_ms = int(round(table.steps * table.step_time * 1000))
+    light_count = len(table.light_ids) if table.light_ids is not None else 1
+
+    def chunks():
+        # Write one cycle at a time, shifted to its place in the show
+        for cycle in range(cycles):
+            records = cycle_records.copy()
+            records['time'] += cycle * cycle_ms
+            yield records
+
+    return write_timeline(path, chunks(), light_count, cycle_ms * cycles)
+
+
+def read_keyframes(source):
+    """Read a keyframe CSV file with the columns time, light, hue, saturation, brightness.
+
+    time is in seconds, light is a 1-based light slot or "all", hue is in degrees and
+    saturation and brightness are percentages. Returns (time, slot, hue, sat, bri) rows
+    in Hue units.
+    """
+    keyframes = []
+    with open(source, newline='') as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                light = row['light'].strip().lower()
+                slot = ALL_LIGHTS if light in ('all', '*', '') else int(light) - 1
+                if slot != ALL_LIGHTS and not 0 <= slot < ALL_LIGHTS:
+                    raise ValueError(f"bad light slot {light}")
+                keyframes.append((
+                    float(row['time']),
+                    slot,
+                    int(float(row['hue']) % 360 / 360 * 65535),
+                    int(max(0, min(100, float(row['saturation']))) / 100 * 254),
+                    int(max(0, min(100, float(row['brightness']))) / 100 * 254)
+                ))
+            except (KeyError, TypeError, ValueError) as e:
+                raise TimelineError(f"{source}, line {line}: {e}")
+    return keyframes
+
+
+def import_keyframes(source, path):
+    """Compile a keyframe CSV file (see read_keyframes) into a timeline file.
+
+    Each light's first keyframe is set instantly at its time; every later keyframe
+    becomes a fade that starts at the light's previous keyframe and lands on time
+    (one playback frame after it if the previous one was the instant first keyframe,
+    so the two don't merge into one command).
+    """
+    keyframes = read_keyframes(source)
+    if not keyframes:
+        raise TimelineError(f"{source} has no keyframes")
+
+    records = np.zeros(len(keyframes), dtype=RECORD_DTYPE)
+    last_time = {}  # slot -> time of its previous keyframe
+    fading = set()  # Slots past their first keyframe
+    for index, (time_s, slot, hue, sat, bri) in enumerate(sorted(keyframes, key=lambda keyframe: keyframe[0])):
+        start = last_time.get(slot, time_s)
+        if slot in last_time and slot not in fading:
+            start = min(time_s, start + TIMELINE_FRAME_TIME)
+            fading.add(slot)
+        records[index] = (int(round(start * 1000)), slot, hue, sat, bri, min(65535, int(round((time_s - start) * 10))))
+        last_time[slot] = time_s
+
+    records.sort(order='time', kind='stable')
+    slots = records['light'][records['light'] != ALL_LIGHTS]
+    light_count = int(slots.max()) + 1 if len(slots) else 1
+    duration_ms = int(round(max(keyframe[0] for keyframe in keyframes) * 1000))
+    return write_timeline(path, [records], light_count, duration_ms)
+
+
+def timeline_path(name):
+    """Get the path of a named timeline in TIMELINE_DIRECTORY."""
+    return os.path.join(TIMELINE_DIRECTORY, os.path.basename(name) + TIMELINE_EXTENSION)
+
+
+def main():
+    """Compile, import or describe timeline files from the command line."""
+    parser = argparse.ArgumentParser(description="Compile Hue light show timelines")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    compile_parser = commands.add_parser('compile', help="Compile a generated show")
+    compile_parser.add_argument('output', help="Timeline file to write")
+    compile_parser.add_argument('--hue-start', type=float, default=0, help="Theme hue range start (default: 0)")
+    compile_parser.add_argument('--hue-end', type=float, default=360, help="Theme hue range end (default: 360)")
+    compile_parser.add_argument('--min-brightness', type=float, default=50, help="Minimum brightness %% (default: 50)")
+    compile_parser.add_argument('--max-brightness', type=float, default=100, help="Maximum brightness %% (default: 100)")
+    compile_parser.add_argument('--cycle-time', type=float, default=30, help="Seconds per color cycle (default: 30)")
+    compile_parser.add_argument('--transition-time', type=float, default=2, help="Transition time in seconds (default: 2)")
+    compile_parser.add_argument('--steps', type=int, default=TOTAL_STEPS, help=f"Steps per cycle (default: {TOTAL_STEPS})")
+    compile_parser.add_argument('--cycles', type=int, default=1, help="Number of cycles (default: 1)")
+    compile_parser.add_argument('--effect', choices=EFFECTS, default=DEFAULT_EFFECT, help="Effect (default: uniform)")
+    compile_parser.add_argument('--lights', type=int, default=1, help="Light slots for effects (default: 1)")
+
+    import_parser = commands.add_parser('import', help="Import a keyframe CSV file")
+    import_parser.add_argument('source', help="CSV file with time, light, hue, saturation, brightness columns")
+    import_parser.add_argument('output', help="Timeline file to write")
+
+    info_parser = commands.add_parser('info', help="Describe a timeline file")
+    info_parser.add_argument('timeline', help="Timeline file")
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'compile':
+            offsets = phase_offsets(args.effect, args.lights)
+            table = compile_frame_table(args.hue_start, args.hue_end, args.min_brightness, args.max_brightness,
+                                        args.cycle_time, args.transition_time, args.steps, phase_offsets=offsets)
+            timeline = compile_table_timeline(args.output, table, args.cycles)
+        elif args.command == 'import':
+            timeline = import_keyframes(args.source, args.output)
+        else:
+            timeline = Timeline(args.timeline)
+    except (OSError, TimelineError) as e:
+        parser.exit(1, f"Error: {e}\n")
+
+    size = HEADER.size + len(timeline) * RECORD_DTYPE.itemsize
+    print(f"{timeline.path}: {len(timeline)} records, {timeline.light_count} light slots, "
+          f"{timeline.duration:.1f}s, {size / 1024:.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
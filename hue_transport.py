@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Bridge transport - a phue Bridge that talks to the Hue Bridge over a small pool of
+persistent keep-alive HTTP connections instead of opening a new one per request.
+"""
+
+import json
+import time
+import queue
+import socket
+import threading
+import http.client
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from phue import Bridge, PhueRequestTimeout
+
+import hue_metrics as metrics
+from hue_health import LogLimiter
+
+logger = logging.getLogger(__name__)
+
+BRIDGE_POOL_SIZE = 4  # Persistent connections kept open to the bridge
+BRIDGE_TIMEOUT = 5  # Seconds before a bridge request times out
+
+# Errors that mean a kept-alive connection was closed by the bridge while idle
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                           BrokenPipeError, ConnectionResetError)
+
+BRIDGE_REQUEST_SECONDS = metrics.histogram(
+    'hue_bridge_request_seconds', "Bridge request latency by operation and light", ['operation', 'light'])
+BRIDGE_REQUEST_ERRORS = metrics.counter(
+    'hue_bridge_request_errors_total', "Bridge requests that failed, by operation and reason", ['operation', 'reason'])
+BRIDGE_REQUEST_RETRIES = metrics.counter(
+    'hue_bridge_request_retries_total', "Bridge requests retried on a fresh connection", ['operation'])
+
+# A light that stops answering times out on every command, so repeats are held back
+log_timeout = LogLimiter(logger)
+
+
+def describe_request(mode, address):
+    """Get the (operation, light ID) metric labels for a request, e.g. ('PUT /lights/{id}/state', '3')."""
+    parts = [part for part in (address or '').split('/')[3:] if part]  # Drop '', 'api' and the username
+    light = parts[1] if len(parts) > 1 and parts[0] == 'lights' else ''
+    path = '/'.join('{id}' if part.isdigit() else part for part in parts)
+    return f"{mode} /{path}", light
+
+
+class PooledBridge(Bridge):
+    """phue Bridge that reuses a bounded pool of keep-alive connections.
+
+    It is a drop-in replacement for phue.Bridge: every phue call (set_light,
+    get_light_objects, Light properties, ...) goes through request() below.
+    """
+
+    def __init__(self, ip=None, username=None, config_file_path=None,
+                 pool_size=BRIDGE_POOL_SIZE, timeout=BRIDGE_TIMEOUT):
+        # phue's constructor may already talk to the bridge (to register), so set the pool up first
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.idle_connections = queue.LifoQueue()
+        self.connection_slots = threading.BoundedSemaphore(pool_size)
+        self.executor = None
+        super().__init__(ip, username, config_file_path)
+
+    def _new_connection(self):
+        return http.client.HTTPConnection(self.ip, timeout=self.timeout)
+
+    def _acquire(self):
+        """Take an idle connection from the pool, or open a new one if there's a free slot."""
+        self.connection_slots.acquire()
+        try:
+            return self.idle_connections.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _release(self, connection, reusable):
+        """Return a connection to the pool, or close it if it can't be reused."""
+        if reusable:
+            self.idle_connections.put(connection)
+        else:
+            connection.close()
+        self.connection_slots.release()
+
+    def request(self, mode='GET', address=None, data=None):
+        """Send a request to the bridge over a pooled connection and return the decoded JSON."""
+        body = json.dumps(data) if mode in ('PUT', 'POST') else None
+        headers = {'Connection': 'keep-alive'}
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+
+        operation, light = describe_request(mode, address)
+        start = time.perf_counter()
+        connection, reused = self._acquire()
+        reusable = False
+        try:
+            while True:
+                try:
+                    connection.request(mode, address, body, headers)
+                    response = connection.getresponse()
+                    payload = response.read()
+                    break
+                except socket.timeout:
+                    BRIDGE_REQUEST_ERRORS.labels(operation, 'timeout').inc()
+                    error = f"{mode} Request to {self.ip}{address} timed out."
+                    log_timeout(logging.ERROR, (self.ip, address), error)
+                    raise PhueRequestTimeout(None, error)
+                except STALE_CONNECTION_ERRORS:
+                    # The bridge dropped an idle connection; retry once on a fresh one.
+                    # POST isn't idempotent, so it's never retried.
+                    connection.close()
+                    if not reused or mode == 'POST':
+                        BRIDGE_REQUEST_ERRORS.labels(operation, 'connection').inc()
+                        raise
+                    BRIDGE_REQUEST_RETRIES.labels(operation).inc()
+                    connection, reused = self._new_connection(), False
+                except OSError:
+                    BRIDGE_REQUEST_ERRORS.labels(operation, 'connection').inc()
+                    raise
+
+            reusable = not response.will_close
+        finally:
+            self._release(connection, reusable)
+
+        BRIDGE_REQUEST_SECONDS.labels(operation, light).observe(time.perf_counter() - start)
+        if response.status != 200:
+            BRIDGE_REQUEST_ERRORS.labels(operation, f"http_{response.status}").inc()
+        logger.debug(f"{mode} {address} {data} -> {payload}")
+        return json.loads(payload.decode('utf-8'))
+
+    def request_many(self, requests):
+        """Send several (mode, address, data) requests concurrently over the pool.
+
+        Returns one result per request, in order; failed requests return their exception.
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='bridge-io')
+
+        futures = [self.executor.submit(self.request, *request) for request in requests]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        """Close every idle pooled connection."""
+        while True:
+            try:
+                self.idle_connections.get_nowait().close()
+            except queue.Empty:
+                break
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
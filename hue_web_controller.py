@@ -4,16 +4,50 @@ Hue Light Show Web Controller - A Python application that creates a smooth color
 for Philips Hue light strips with a web interface for control.
 """
 
-import json
 import os
+
+# Server mode: "threading" (the default), or "eventlet" or "gevent" to serve many clients from green
+# threads. Those patch the standard library, which has to happen before anything else imports it
+SERVER_MODE = os.environ.get('HUE_SERVER_MODE', 'threading')
+if SERVER_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif SERVER_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import json
 import time
 import sys
-import math
+import socket
 import threading
 import logging
-from flask import Flask, render_template, request, jsonify
+import argparse
+from collections import namedtuple
+
+# Taken before the heavy imports below, as close to the process start as we can get
+PROCESS_START = time.monotonic()
+
+import numpy as np
+from flask import Flask, Response, render_template, request, jsonify
 from flask_socketio import SocketIO
-from phue import Bridge
+from hue_transport import PooledBridge, BRIDGE_POOL_SIZE, BRIDGE_TIMEOUT
+from hue_bridge_output import BridgeOutput, light_key, combined_stats, LIGHT_ID_SEPARATOR
+from hue_frame_table import compile_frame_table, TOTAL_STEPS
+from hue_effects import EFFECTS, DEFAULT_EFFECT, phase_offsets
+from hue_show_params import ShowParams
+from hue_broadcast import Broadcaster
+from hue_frame_clock import FrameClock
+from hue_adaptive import AdaptiveFrameRate
+from hue_keyframes import plan_keyframes, KEYFRAME_TOLERANCE
+from hue_scenes import plan_scenes
+from hue_discovery import choose_bridge, register, DiscoveryError, REGISTRATION_WAIT
+from hue_inventory import load_inventory, save_inventory, fetch_lights, INVENTORY_FILE
+from hue_eventstream import EventStream, v1_light_id, light_state_changes
+from hue_audio import AudioAnalyzer, AudioError, open_audio_source, audio_frame
+from hue_timeline import (Timeline, TimelinePlayer, TimelineError, compile_table_timeline, timeline_path,
+                          ALL_LIGHTS, TIMELINE_FRAME_TIME)
+import hue_metrics as metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -26,33 +60,118 @@ TRANSITION_TIME = 2  # Time in seconds for each color transition
 FULL_CYCLE_TIME = 30  # Time in seconds for a full color cycle
 DEFAULT_MIN_BRIGHTNESS = 50  # Default minimum brightness (%)
 DEFAULT_MAX_BRIGHTNESS = 100  # Default maximum brightness (%)
+STATE_TICK_MAX_RATE = 10  # Maximum state_tick broadcasts per second from the light show loop
+ADAPTIVE_FRAME_RATE = True  # Lower the step rate (with longer transitions) when the bridge can't keep up
+KEYFRAME_MODE = False  # Send only planned keyframes and let the bridge fade between them
+SCENE_MODE = False  # Play per-light effects as bridge scenes, one group command per keyframe
+STARTUP_TARGET = 1.0  # Seconds from process start to the first web response we aim for
+AUDIO_ONSET_HUE_STEP = 0.125  # Share of the theme's hue range each audio onset moves the colors on
+AUDIO_FRAME_TIME = 0.1  # Longest time between frames while following audio, which bounds its latency
+AUDIO_TRANSITIONTIME = 1  # Transition (in 1/10 s) while following audio: short, so the lights keep up with the beat
 
 # Flask app setup
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.config['SECRET_KEY'] = 'hue-light-show-secret-key'
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=SERVER_MODE)
 
 # Global variables
-bridge = None
-available_lights = {}  # Dictionary of all available lights
-selected_lights = []   # List of selected light IDs
+bridge_outputs = []  # One output pipeline (scheduler, group, shadow state, frame commit) per bridge
+# The lights: available is light ID -> light, selected the IDs in the show (all available), and outputs
+# light ID -> (BridgeOutput, the light's ID on its bridge). Swapped whole with a new version on every change
+LightSelection = namedtuple('LightSelection', ['version', 'available', 'selected', 'outputs'])
+lights = LightSelection(version=0, available={}, selected=(), outputs={})
+inventory = {}  # Bridge name -> {'address', 'lights'}: the light inventory as last loaded or read
+inventory_file = INVENTORY_FILE  # Where the light inventory is cached (None to not cache it)
+first_response_time = None  # Seconds from process start to the first web response
 light_show_thread = None
 light_show_running = False
 light_show_paused = False
 current_hue = 0
 current_brightness = 100
 current_saturation = 100
-min_brightness = DEFAULT_MIN_BRIGHTNESS
-max_brightness = DEFAULT_MAX_BRIGHTNESS
-transition_time = TRANSITION_TIME
-full_cycle_time = FULL_CYCLE_TIME
-current_theme = "rainbow"  # Default theme
-hue_start = 0  # Default hue range start (0-360)
-hue_end = 360  # Default hue range end (0-360)
+current_color = "#ff0000"  # Preview color of the current frame
+# Show parameters, swapped for a new snapshot on every change (see update_show_params) and never changed in place
+show_params = ShowParams(
+    theme="rainbow",
+    hue_start=0,
+    hue_end=360,
+    min_brightness=DEFAULT_MIN_BRIGHTNESS,
+    max_brightness=DEFAULT_MAX_BRIGHTNESS,
+    transition_time=TRANSITION_TIME,
+    full_cycle_time=FULL_CYCLE_TIME,
+    effect=DEFAULT_EFFECT,
+    keyframes=KEYFRAME_MODE,
+    keyframe_tolerance=KEYFRAME_TOLERANCE,
+    scenes=SCENE_MODE
+)
+show_params_lock = threading.Lock()  # Serializes writers of show_params and lights; readers just take the current snapshot
+frame_table = None  # Precomputed frames for the current theme, brightness range and speed
+frame_table_lock = threading.Lock()  # Serializes rebuilds, so the last table built is from the latest parameters
+audio_analyzer = None  # Audio input the brightness and hue follow, if one is set
+timeline = None  # Compiled show played instead of the live one, if loaded
+staging_layout = None  # (show light IDs, [(output, bridge light IDs, frame table rows)]) for staging_layout_version
+staging_layout_version = -1
+frame_clock = None  # Paces the show loop and keeps its timing statistics
+frame_rate = None  # Adapts the steps per cycle to what the bridge can keep up with
+
+# Broadcast state (what connected clients have already been sent)
+broadcaster = Broadcaster(socketio, lambda: snapshot_state())  # Fans updates out to clients off the show thread
+broadcast_lock = threading.Lock()
+broadcast_state = {}
+broadcast_lights_version = -1
+last_tick_time = 0
+
+# Metrics (served at /metrics)
+FRAME_STAGE_SECONDS = metrics.histogram(
+    'hue_frame_stage_seconds',
+    "Light show frame time by stage: compute (table lookup and staging), bridge_io (committing to the bridge) "
+    "and emit (building the state update and queuing it for broadcast)",
+    ['stage']
+)
+FRAME_COMPUTE_SECONDS = FRAME_STAGE_SECONDS.labels('compute')
+FRAME_BRIDGE_IO_SECONDS = FRAME_STAGE_SECONDS.labels('bridge_io')
+FRAME_EMIT_SECONDS = FRAME_STAGE_SECONDS.labels('emit')
+LIGHT_SHOW_ERRORS = metrics.counter('hue_light_show_errors_total', "Errors that stopped the light show thread")
+STARTUP_SECONDS = metrics.gauge('hue_startup_seconds', "Seconds from process start to the first web response")
+CONNECTED_CLIENTS = metrics.gauge('hue_connected_clients', "Connected Socket.IO clients")
+metrics.gauge('hue_broadcast_queue_depth', "State updates waiting to be broadcast", function=lambda: len(broadcaster.queue))
+
 
+def _scheduler_stat(key):
+    return lambda: {(output.name,): output.scheduler.stats()[key] for output in bridge_outputs}
 
-def get_bridge_connection():
-    """Connect to the Hue Bridge using saved credentials or create new ones."""
+
+def _clock_stat(key):
+    return lambda: getattr(frame_clock, key) if frame_clock is not None else None
+
+
+metrics.gauge('hue_selected_lights', "Lights selected for the light show", function=lambda: len(lights.selected))
+metrics.gauge('hue_bridge_queue_depth', "Bridge commands waiting to be sent", ['bridge'],
+              function=_scheduler_stat('queue_depth'))
+metrics.counter_function('hue_bridge_commands_sent_total', "Bridge commands sent", _scheduler_stat('sent'), ['bridge'])
+metrics.counter_function('hue_bridge_commands_replaced_total', "Queued bridge commands merged with a newer one",
+                         _scheduler_stat('replaced'), ['bridge'])
+metrics.counter_function('hue_bridge_commands_dropped_total', "Bridge commands dropped before being sent",
+                         _scheduler_stat('dropped'), ['bridge'])
+metrics.counter_function('hue_bridge_command_errors_total', "Bridge commands that failed or were rejected",
+                         _scheduler_stat('errors'), ['bridge'])
+metrics.gauge('hue_lights_skipped', "Lights left out of the frames because they keep failing", ['bridge'],
+              function=lambda: {(output.name,): output.health.skipped() for output in bridge_outputs})
+metrics.gauge('hue_client_backlog_messages', "Most messages waiting to go out to any one client",
+              function=lambda: max((messages for messages, _ in broadcaster.client_backlogs().values()), default=0))
+metrics.gauge('hue_client_backlog_bytes', "Bytes waiting to go out to all clients",
+              function=lambda: sum(size for _, size in broadcaster.client_backlogs().values()))
+metrics.counter_function('hue_frames_total', "Light show frames run", _clock_stat('frames'))
+metrics.counter_function('hue_frames_dropped_total', "Light show frames skipped to catch up with the clock",
+                         _clock_stat('skipped_frames'))
+
+
+def get_bridge_connection(interactive=True):
+    """Connect to the Hue Bridge using saved credentials or create new ones.
+    
+    Without saved credentials, the bridge is found on the network and registered with by
+    waiting for its link button. With interactive=False nothing is ever asked on the terminal.
+    """
     # Check if we have saved credentials
     if os.path.exists(CONFIG_FILE):
         try:
@@ -61,7 +180,12 @@ def get_bridge_connection():
             
             logger.info(f"Using saved connection to bridge at {config['ipAddress']}")
             logger.info("Attempting to connect to the bridge...")
-            bridge = Bridge(config['ipAddress'])
+            bridge = PooledBridge(
+                config['ipAddress'],
+                config.get('username'),
+                pool_size=config.get('poolSize', BRIDGE_POOL_SIZE),
+                timeout=config.get('timeout', BRIDGE_TIMEOUT)
+            )
             
             # If the bridge is already authorized, this won't do anything
             # If not, it will raise an exception
@@ -77,173 +201,388 @@ def get_bridge_connection():
     else:
         logger.info("No saved configuration found.")
     
-    # Try to discover bridges on the network
+    # Discover the bridge on the network and register with it
     try:
-        from phue import PhueRegistrationException
-        
-        # Ask for IP address
-        ip_address = input("Please enter your Hue Bridge IP address: ")
+        ip_address = choose_bridge(interactive)
         
         print("\n===== IMPORTANT: HUE BRIDGE LINK BUTTON =====")
         print("1. Go to your Hue Bridge (the round white device)")
         print("2. Press the large link button on top of the bridge")
-        print("3. Return here within 30 seconds and press Enter")
+        print(f"3. The application will carry on by itself within {REGISTRATION_WAIT} seconds")
         print("==============================================\n")
         
-        input("Press Enter after you've pressed the link button on the Hue Bridge...")
+        username = register(ip_address, f"{APP_NAME}#{socket.gethostname()}")
+        bridge = PooledBridge(ip_address, username)
+        bridge.connect()
         
-        try:
-            bridge = Bridge(ip_address)
-            bridge.connect()
-            
-            # Save the config for future use
-            config = {
-                "ipAddress": ip_address,
-                "username": bridge.username
-            }
-            
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(config, f, indent=2)
-                
-            logger.info("Successfully connected to Hue Bridge and saved credentials.")
-            return bridge
+        # Save the config for future use
+        config = {
+            "ipAddress": ip_address,
+            "username": username
+        }
         
-        except PhueRegistrationException:
-            logger.error("Error: The link button wasn't pressed in time.")
-            logger.error("Please restart the application and try again.")
-            sys.exit(1)
-        except Exception as e:
-            logger.error(f"Error connecting to bridge: {e}")
-            logger.error("Please make sure you pressed the link button and try again.")
-            sys.exit(1)
+        with open(CONFIG_FILE, 'w') as f:
+            json.dump(config, f, indent=2)
+            
+        logger.info("Successfully connected to Hue Bridge and saved credentials.")
+        return bridge
+    
+    except DiscoveryError as e:
+        logger.error(f"Error: {e}")
+        logger.error("Please restart the application and try again.")
+        sys.exit(1)
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
+        logger.error(f"Error connecting to bridge: {e}")
+        logger.error("Please make sure you pressed the link button and try again.")
         sys.exit(1)
 
 
-def get_all_lights(bridge):
-    """Get all available lights from the Hue Bridge."""
-    global available_lights, selected_lights
+def get_bridge_connections(interactive=True):
+    """Connect to every configured Hue Bridge. Returns a list of (name, bridge) pairs.
     
-    # Get all lights from the bridge
-    lights = bridge.get_light_objects('id')
-    available_lights = {}
+    hue-config.json can list several bridges under "bridges", each with its own
+    ipAddress, username and optional name, poolSize and timeout. Without that
+    list, the single-bridge setup (and registration) of get_bridge_connection() is used.
+    """
+    config = {}
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE, 'r') as f:
+                config = json.load(f)
+        except Exception:
+            config = {}
     
-    # Convert to a dictionary with light ID as key
-    for light_id, light in lights.items():
-        light_name = light.name
-        light_type = "Unknown"
-        
-        # Try to determine light type
-        if 'strip' in light_name.lower() or 'lightstrip' in light_name.lower():
-            light_type = "Light Strip"
-        elif 'bulb' in light_name.lower():
-            light_type = "Bulb"
-        elif 'lamp' in light_name.lower():
-            light_type = "Lamp"
-        
-        # Store light information
-        available_lights[light_id] = {
-            'id': light_id,
-            'name': light_name,
-            'type': light_type,
-            'object': light
-        }
+    if not config.get('bridges'):
+        return [(config.get('name', 'bridge'), get_bridge_connection(interactive))]
+    
+    connections = []
+    for index, bridge_config in enumerate(config['bridges']):
+        name = str(bridge_config.get('name', f"bridge{index + 1}"))
+        if LIGHT_ID_SEPARATOR in name or name in [existing for existing, _ in connections]:
+            logger.error(f"Skipping bridge {name}: names must be unique and can't contain '{LIGHT_ID_SEPARATOR}'")
+            continue
         
-        logger.info(f"Found light: {light_name} (ID: {light_id}, Type: {light_type})")
+        try:
+            logger.info(f"Connecting to bridge {name} at {bridge_config['ipAddress']}...")
+            bridge = PooledBridge(
+                bridge_config['ipAddress'],
+                bridge_config.get('username'),
+                pool_size=bridge_config.get('poolSize', BRIDGE_POOL_SIZE),
+                timeout=bridge_config.get('timeout', BRIDGE_TIMEOUT)
+            )
+            bridge.connect()
+            connections.append((name, bridge))
+        except Exception as e:
+            logger.error(f"Error connecting to bridge {name}: {e}")
+            logger.error("Make sure its ipAddress and username are right (get_hue_username.py can create a username).")
     
-    # If no lights found, exit
-    if not available_lights:
-        logger.error("No lights found. Please make sure your Hue lights are connected.")
+    if not connections:
+        logger.error("Could not connect to any of the configured bridges.")
         sys.exit(1)
     
-    # By default, select all lights
-    if not selected_lights:
-        selected_lights = list(available_lights.keys())
-        logger.info(f"Selected all {len(selected_lights)} lights by default")
+    logger.info(f"Connected to {len(connections)} bridges: {', '.join(name for name, _ in connections)}")
+    return connections
+
+
+def get_event_streams():
+    """Find the bridges to follow through their event stream. Returns {bridge name: secure}.
+    
+    Setting "eventStream" in hue-config.json (or in a bridge's entry under "bridges") to true
+    follows the bridge's HTTPS event stream instead of polling its light states; "http" reads
+    it over plain HTTP, from a stand-in such as the simulator.
+    """
+    config = {}
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE, 'r') as f:
+                config = json.load(f)
+        except Exception:
+            config = {}
+    
+    if not config.get('bridges'):
+        entries = [(config.get('name', 'bridge'), config)]
+    else:
+        entries = [(str(bridge_config.get('name', f"bridge{index + 1}")), bridge_config)
+                   for index, bridge_config in enumerate(config['bridges'])]
+    return {name: entry['eventStream'] != 'http' for name, entry in entries if entry.get('eventStream')}
+
+
+def apply_inventory():
+    """Rebuild the available lights from the inventory, keeping the selection where the lights still exist."""
+    global lights
+    
+    # With several bridges, light IDs are namespaced as "bridge-name:id"
+    namespaced = len(bridge_outputs) > 1
+    available = {}
+    outputs = {}
+    for output in bridge_outputs:
+        for bridge_light_id, entry in sorted(inventory[output.name]['lights'].items()):
+            light_id = light_key(output.name, bridge_light_id, namespaced)
+            available[light_id] = dict(entry, id=light_id, bridge=output.name)
+            outputs[light_id] = (output, bridge_light_id)
     
-    return available_lights
+    with show_params_lock:
+        # By default, select all lights
+        selection = tuple(light_id for light_id in lights.selected if light_id in available)
+        if not selection:
+            selection = tuple(available)
+            logger.info(f"Selected all {len(selection)} lights by default")
+        lights = LightSelection(lights.version + 1, available, selection, outputs)
 
 
-def set_selected_lights(light_ids):
-    """Set which lights are included in the light show."""
-    global selected_lights
+def get_all_lights():
+    """Load the lights of every Hue Bridge, from the inventory cache when it has them.
     
-    # Debug log the incoming light_ids
-    logger.info(f"Received light_ids: {light_ids}")
+    Bridges missing from the cache are read (one request each) and the cache is saved.
+    Returns True if any bridge came from the cache, so it should be refreshed in the background.
+    """
+    global inventory
     
-    # Log the available_lights keys for debugging
-    logger.info(f"Available light keys (types): {[(k, type(k).__name__) for k in available_lights.keys()]}")
-    
-    # Check if available_lights keys are integers or strings
-    # Get a sample key to determine the type
-    available_key_type = None
-    if available_lights:
-        sample_key = next(iter(available_lights.keys()))
-        available_key_type = type(sample_key)
-        logger.info(f"Available lights keys are of type: {available_key_type.__name__}")
-    
-    # Convert light_ids to the same type as the keys in available_lights
-    processed_ids = []
-    for light_id in light_ids:
-        if available_key_type == int and isinstance(light_id, str) and light_id.isdigit():
-            processed_ids.append(int(light_id))
-        elif available_key_type == str and not isinstance(light_id, str):
-            processed_ids.append(str(light_id))
+    cached = load_inventory(inventory_file)
+    inventory = {}
+    from_cache = False
+    for output in bridge_outputs:
+        entry = cached.get(output.name)
+        if entry is not None and entry['address'] == output.bridge.ip:
+            from_cache = True
+            logger.info(f"Using the cached light inventory of bridge {output.name}")
         else:
-            processed_ids.append(light_id)
+            # Get all lights from the bridge
+            entry = {'address': output.bridge.ip, 'lights': fetch_lights(output.bridge)}
+        inventory[output.name] = entry
+        
+        for light_id, light in entry['lights'].items():
+            logger.info(f"Found light: {light['name']} (ID: {light_id}, Type: {light['type']}, Model: {light['modelid']})")
     
-    logger.info(f"Processed light_ids: {processed_ids}")
+    # If no lights found, exit
+    if not any(entry['lights'] for entry in inventory.values()):
+        logger.error("No lights found. Please make sure your Hue lights are connected.")
+        sys.exit(1)
     
-    # Validate light IDs
-    valid_ids = [light_id for light_id in processed_ids if light_id in available_lights]
+    if dict(cached, **inventory) != cached:
+        save_inventory(dict(cached, **inventory), inventory_file)
+    apply_inventory()
+    return from_cache
+
+
+def refresh_inventory():
+    """Check the light inventory against the bridges, and save and push it to clients if it changed."""
+    global inventory
     
-    logger.info(f"Valid light_ids: {valid_ids}")
+    fetched = {}
+    for output in bridge_outputs:
+        try:
+            fetched[output.name] = {'address': output.bridge.ip, 'lights': fetch_lights(output.bridge)}
+        except Exception as e:
+            logger.error(f"Error refreshing the lights of bridge {output.name}: {e}")
+            fetched[output.name] = inventory[output.name]
     
-    if not valid_ids and processed_ids:  # Only warn if user actually sent some IDs but none were valid
-        logger.warning("No valid lights selected. Keeping previous selection.")
+    if fetched == inventory:
+        logger.info("Light inventory is up to date")
         return False
     
-    # Log the change in selection
-    old_selection = set(selected_lights)
-    new_selection = set(valid_ids)
+    logger.info("Light inventory changed on the bridge, updating")
+    inventory = fetched
+    save_inventory(dict(load_inventory(inventory_file), **inventory), inventory_file)
+    apply_inventory()
+    sync_bridge_groups()
+    rebuild_frame_table()
+    emit_state()
+    return True
+
+
+def apply_bridge_events(output, events):
+    """Apply the changes a bridge pushed on its event stream, and push them on to clients.
     
-    added = new_selection - old_selection
-    removed = old_selection - new_selection
+    On/off and reachability go into the shadow state and renames into the inventory; added or
+    removed lights have the inventory read again.
+    """
+    global inventory
     
-    if added:
-        logger.info(f"Adding lights: {', '.join([available_lights[light_id]['name'] for light_id in added])}")
+    states_changed = False
+    renamed = {}
+    added_or_removed = False
+    for kind, resource in events:
+        light_id = v1_light_id(resource)
+        if light_id is None:
+            continue
+        if kind == 'delete':
+            output.shadow.forget(light_id)
+            added_or_removed = True
+            continue
+        
+        if output.shadow.observe(light_id, light_state_changes(resource)):
+            states_changed = True
+        if kind == 'add':
+            added_or_removed = True
+        name = resource.get('metadata', {}).get('name')
+        light = inventory[output.name]['lights'].get(light_id)
+        if name is not None and light is not None and light['name'] != name:
+            renamed[light_id] = name
     
-    if removed:
-        logger.info(f"Removing lights: {', '.join([available_lights[light_id]['name'] for light_id in removed])}")
+    if added_or_removed:
+        # One read of the bridge's lights covers any number of added or removed ones
+        if refresh_inventory():
+            return
+    elif renamed:
+        entry = inventory[output.name]
+        bridge_lights = dict(entry['lights'])
+        for light_id, name in renamed.items():
+            logger.info(f"Light {light_id} on bridge {output.name} renamed to {name}")
+            bridge_lights[light_id] = dict(bridge_lights[light_id], name=name)
+        # A new inventory rather than changing the one the show and clients may be reading
+        inventory = dict(inventory, **{output.name: dict(entry, lights=bridge_lights)})
+        save_inventory(dict(load_inventory(inventory_file), **inventory), inventory_file)
+        apply_inventory()
+        states_changed = True
     
-    # If the user selected no lights, keep the current selection
-    if not valid_ids and not processed_ids:
-        logger.warning("Empty light selection received. Keeping previous selection.")
-        return False
+    if states_changed:
+        emit_state()
+
+
+def resync_bridge(output, reconnected):
+    """Load a bridge's light states when its event stream opens, since nothing is polled.
+    
+    After a reconnect the inventory is checked as well, for changes made while the stream was down.
+    """
+    output.shadow.refresh()
+    if not (reconnected and refresh_inventory()):
+        emit_state()
+
+
+def set_selected_lights(light_ids):
+    """Set which lights are included in the light show."""
+    global lights
+    
+    # Debug log the incoming light_ids
+    logger.info(f"Received light_ids: {light_ids}")
+    
+    # Validate and swap in the selection against one inventory, so a refresh can't slip in between
+    with show_params_lock:
+        available_lights = lights.available
+        
+        # Log the available_lights keys for debugging
+        logger.info(f"Available light keys (types): {[(k, type(k).__name__) for k in available_lights.keys()]}")
+        
+        # Check if available_lights keys are integers or strings
+        # Get a sample key to determine the type
+        available_key_type = None
+        if available_lights:
+            sample_key = next(iter(available_lights.keys()))
+            available_key_type = type(sample_key)
+            logger.info(f"Available lights keys are of type: {available_key_type.__name__}")
+        
+        # Convert light_ids to the same type as the keys in available_lights
+        processed_ids = []
+        for light_id in light_ids:
+            if available_key_type == int and isinstance(light_id, str) and light_id.isdigit():
+                processed_ids.append(int(light_id))
+            elif available_key_type == str and not isinstance(light_id, str):
+                processed_ids.append(str(light_id))
+            else:
+                processed_ids.append(light_id)
+        
+        logger.info(f"Processed light_ids: {processed_ids}")
+        
+        # Validate light IDs
+        valid_ids = [light_id for light_id in processed_ids if light_id in available_lights]
+        
+        logger.info(f"Valid light_ids: {valid_ids}")
+        
+        if not valid_ids and processed_ids:  # Only warn if user actually sent some IDs but none were valid
+            logger.warning("No valid lights selected. Keeping previous selection.")
+            return False
+        
+        # Log the change in selection
+        old_selection = set(lights.selected)
+        new_selection = set(valid_ids)
+        
+        added = new_selection - old_selection
+        removed = old_selection - new_selection
+        
+        if added:
+            logger.info(f"Adding lights: {', '.join([available_lights[light_id]['name'] for light_id in added])}")
+        
+        if removed:
+            logger.info(f"Removing lights: {', '.join([available_lights[light_id]['name'] for light_id in removed])}")
+        
+        # If the user selected no lights, keep the current selection
+        if not valid_ids and not processed_ids:
+            logger.warning("Empty light selection received. Keeping previous selection.")
+            return False
+        
+        lights = selection = lights._replace(version=lights.version + 1, selected=tuple(valid_ids))
+    
+    logger.info(f"Selected {len(selection.selected)} lights: {', '.join([available_lights[light_id]['name'] for light_id in selection.selected])}")
     
-    selected_lights = valid_ids
-    logger.info(f"Selected {len(selected_lights)} lights: {', '.join([available_lights[light_id]['name'] for light_id in selected_lights])}")
+    # Keep each bridge's group in sync so uniform frames can still go out as one request
+    sync_bridge_groups()
+    
+    # A per-light effect needs a row for every selected light
+    rebuild_frame_table()
     
     # If the light show is running, make sure newly added lights are turned on
     if light_show_running and not light_show_paused:
-        for light_id in selected_lights:
-            try:
-                light = available_lights[light_id]['object']
-                if not light.on:
-                    light.on = True
-                    logger.info(f"Turned on newly selected light: {available_lights[light_id]['name']}")
-            except Exception as e:
-                logger.error(f"Error turning on light {light_id}: {e}")
+        for light_id in selection.selected:
+            output, bridge_light_id = selection.outputs[light_id]
+            output.frame_commit.stage(bridge_light_id, on=True)
+            if light_id in added:
+                logger.info(f"Turning on newly selected light: {available_lights[light_id]['name']}")
+        commit_frame()
     
     return True
 
 
+def sync_bridge_groups():
+    """Queue an update of each bridge's group to the selected lights on that bridge."""
+    selection = lights
+    lights_by_output = {output: [] for output in bridge_outputs}
+    for light_id in selection.selected:
+        output, bridge_light_id = selection.outputs[light_id]
+        lights_by_output[output].append(bridge_light_id)
+    
+    for output, bridge_light_ids in lights_by_output.items():
+        output.sync_group(bridge_light_ids)
+
+
+def commit_frame(deadline=None, captured=None):
+    """Commit the staged frame on every bridge. Returns the requests sent (or queued) per bridge.
+    
+    Each bridge has its own scheduler worker and command budget, so the bridges are
+    written to in parallel. captured is the capture time of the audio the frame follows, if any.
+    """
+    return [output.frame_commit.commit(deadline=deadline, captured=captured) for output in bridge_outputs]
+
+
+def get_staging_layout():
+    """Get the selected lights in show order, grouped by bridge for batched staging.
+    
+    Returns (light IDs, [(output, the lights' IDs on that bridge, their rows in a per-light frame table)]).
+    The layout is rebuilt only when the lights inventory or selection changes.
+    """
+    global staging_layout, staging_layout_version
+    
+    selection = lights
+    if staging_layout is None or staging_layout_version != selection.version:
+        light_ids = selection.selected
+        layout = []
+        for output in bridge_outputs:
+            rows = [row for row, light_id in enumerate(light_ids) if selection.outputs[light_id][0] is output]
+            if rows:
+                bridge_light_ids = [selection.outputs[light_ids[row]][1] for row in rows]
+                # A single bridge takes every row, which NumPy can slice without copying an index
+                layout.append((output, bridge_light_ids, slice(None) if len(rows) == len(light_ids) else np.array(rows)))
+        staging_layout = (light_ids, layout)
+        staging_layout_version = selection.version
+    return staging_layout
+
+
 def get_selected_lights():
     """Get the currently selected lights."""
+    selection = lights
     return {
-        'available': available_lights,
-        'selected': selected_lights
+        'available': selection.available,
+        'selected': list(selection.selected)
     }
 
 
@@ -271,120 +610,508 @@ def hue_to_rgb(h):
     return f"#{r:02x}{g:02x}{b:02x}"
 
 
+def update_show_params(**changes):
+    """Swap in a new show parameter snapshot with some parameters changed. Returns the new snapshot.
+    
+    The show thread picks up the new snapshot on its next frame.
+    """
+    global show_params
+    
+    with show_params_lock:
+        show_params = show_params.replace(**changes)
+        return show_params
+
+
+def rebuild_frame_table():
+    """Recompile the frame table if a show parameter has changed."""
+    global frame_table
+    
+    with frame_table_lock:
+        # Compile from one snapshot; a change made meanwhile rebuilds again after this
+        params = show_params
+        steps = frame_rate.steps if frame_rate is not None else TOTAL_STEPS
+        effective_transition_time = params.transition_time
+        if frame_rate is not None:
+            effective_transition_time = frame_rate.transition_time(params.transition_time, params.full_cycle_time)
+        
+        table_params = (params.hue_start, params.hue_end, params.min_brightness, params.max_brightness,
+                        params.full_cycle_time, effective_transition_time, steps)
+        
+        # Spatial effects need a per-light table, with one row per selected light
+        light_ids = get_staging_layout()[0] if bridge_outputs else ()
+        offsets = phase_offsets(params.effect, len(light_ids))
+        table_light_ids = light_ids if offsets is not None else None
+        
+        # Keyframes are planned for a shared table only; per-light tables send every step, or a scene per keyframe
+        tolerance = params.keyframe_tolerance if params.keyframes and offsets is None else None
+        scenes = params.scenes and offsets is not None
+        if frame_table is not None and frame_table.params == table_params and frame_table.light_ids == table_light_ids:
+            planned_tolerance = frame_table.keyframes.tolerance if frame_table.keyframes is not None else None
+            if planned_tolerance == tolerance and (frame_table.scenes is not None) == scenes:
+                return frame_table
+        
+        # Build the new table first and swap it in with one assignment, so the show thread never sees a partial table
+        table = compile_frame_table(*table_params, phase_offsets=offsets, light_ids=table_light_ids)
+        if tolerance is not None:
+            table.keyframes = plan_keyframes(table, tolerance)
+        if scenes:
+            table.scenes = plan_scenes(table)
+        frame_table = table
+        return table
+
+
+def apply_audio(hue_value, brightness_value, targets, params):
+    """Make a frame's hue and brightness (one value, or a list per light) follow the audio targets."""
+    hue_value, brightness_value = audio_frame(
+        hue_value, brightness_value, targets,
+        params.hue_start / 360 * 65535, params.hue_end / 360 * 65535,
+        params.min_brightness / 100 * 254, params.max_brightness / 100 * 254,
+        AUDIO_ONSET_HUE_STEP
+    )
+    return hue_value.tolist(), brightness_value.tolist()
+
+
 def run_light_show():
     """Run the light show in a separate thread."""
-    global light_show_running, light_show_paused, current_hue, current_brightness, current_saturation
+    global light_show_running, light_show_paused, current_hue, current_brightness, current_saturation, current_color
+    global frame_clock
     
-    if not selected_lights:
+    if not lights.selected:
         logger.error("No lights selected for the light show")
         light_show_running = False
         return
     
-    logger.info(f"Starting color fade effect on {len(selected_lights)} lights. Control via web interface at http://localhost:3000")
-    logger.info(f"Speed settings: Transition time = {transition_time}s, Full cycle time = {full_cycle_time}s")
-    logger.info(f"Theme: {current_theme} (Hue range: {hue_start}° - {hue_end}°)")
-    
-    # Calculate how many steps we need for a smooth transition
-    total_steps = 360  # Using hue values from 0-360 (HSV color model)
-    step_time = full_cycle_time / total_steps
+    params = show_params
+    logger.info(f"Starting color fade effect on {len(lights.selected)} lights. Control via web interface at http://localhost:3000")
+    logger.info(f"Speed settings: Transition time = {params.transition_time}s, Full cycle time = {params.full_cycle_time}s")
+    logger.info(f"Theme: {params.theme} (Hue range: {params.hue_start}° - {params.hue_end}°)")
     
+    # Every frame of the cycle is precomputed, so each step is just a table lookup
+    rebuild_frame_table()
     current_step = 0
-    hue_range = hue_end - hue_start
+    step_fraction = 0.0  # Part of a step played in frames shorter than a step (while following audio)
+    steps_per_cycle = frame_table.steps
+    
+    # Frames are due at absolute times, so bridge latency doesn't stretch the cycle
+    frame_clock = FrameClock(frame_table.step_time)
+    was_paused = False
+    last_audio_captured = None
+    scene_segment = None  # (table, segment) of the scenes last recalled
     
     try:
         while light_show_running:
-            if not light_show_paused:
+            if light_show_paused:
+                was_paused = True
+            else:
                 # Check if we have any selected lights
-                if not selected_lights:
+                if not lights.selected:
                     logger.warning("No lights selected, waiting for selection")
                     time.sleep(1)
+                    frame_clock.reset()
                     continue
                 
-                # Make sure all currently selected lights are on
-                for light_id in selected_lights:
-                    try:
-                        if light_id in available_lights:
-                            light = available_lights[light_id]['object']
-                            if not light.on:
-                                light.on = True
-                                logger.info(f"Turned on {available_lights[light_id]['name']}")
-                    except Exception as e:
-                        logger.error(f"Error turning on light {light_id}: {e}")
+                # Don't count the time spent paused as lateness
+                if was_paused:
+                    frame_clock.reset()
+                    was_paused = False
+                
+                # Look up the current frame. Settings and the table built from them are swapped
+                # out whole when they change, so one read of each gives a consistent frame
+                frame_start = time.perf_counter()
+                params = show_params
+                light_ids, layout = get_staging_layout()
+                table = frame_table
+                if table.light_ids is not None and table.light_ids != light_ids:
+                    # The selection changed under a per-light effect
+                    table = rebuild_frame_table()
+                if table.steps != steps_per_cycle:
+                    # Keep the position in the cycle when the step rate changes
+                    current_step = current_step * table.steps // steps_per_cycle
+                    steps_per_cycle = table.steps
+                step = current_step % table.steps
+                current_hue, current_brightness = table.display(step)
+                current_color = table.color(step)
+                transitiontime = table.transitiontime
+                deadline = frame_clock.next_frame_time()
+                after_jump = False
+                
+                # The audio analyzer runs in its own thread; the frame only reads its latest targets
+                analyzer = audio_analyzer
+                audio = analyzer.targets if analyzer is not None else None
+                if audio is not None:
+                    transitiontime = AUDIO_TRANSITIONTIME
+                    preview_hue, preview_brightness = apply_audio(
+                        int(current_hue / 360 * 65535), int(current_brightness / 100 * 254), audio, params)
+                    current_hue = round(preview_hue / 65535 * 360, 2)
+                    current_brightness = round(preview_brightness / 254 * 100, 2)
+                    current_color = hue_to_rgb(current_hue)
                 
-                # Calculate the current hue value based on the theme's hue range
-                if hue_range == 0:  # Handle case where start and end are the same
-                    current_hue = hue_start
+                # In keyframe mode every frame of a segment targets the segment's keyframe; the commit
+                # only sends it once (and again to lights whose command failed), and the bridge fades the rest
+                if table.light_ids is None:
+                    hue_value, saturation_value, brightness_value = table.frame(step)
+                    if audio is not None:
+                        hue_value, brightness_value = apply_audio(hue_value, brightness_value, audio, params)
+                if table.keyframes is not None and audio is None:
+                    segment = table.keyframes.segment(step)
+                    hue_value, saturation_value, brightness_value, transitiontime = table.keyframes.command(segment, step)
+                    remaining_steps = table.keyframes.ends[segment].item() - step
+                    # An instant jump never expires: the next segment waits for it
+                    deadline = frame_clock.frame_time(frame_clock.frame + remaining_steps) if remaining_steps > 0 else None
+                    after_jump = table.keyframes.after_jump(segment)
+                
+                # In scene mode each bridge recalls one stored scene per segment and fades every light to
+                # it by itself; the next segment's scene is stored meanwhile so its recall is a single command
+                if table.scenes is not None and audio is None:
+                    segment = table.scenes.segment(step)
+                    if scene_segment != (table, segment):
+                        scene_segment = (table, segment)
+                        next_segment = (segment + 1) % len(table.scenes)
+                        for output, bridge_light_ids, rows in layout:
+                            output.scenes.recall(table.scenes.frame(table, segment, rows, bridge_light_ids))
+                            output.scenes.prefetch(table.scenes.frame(table, next_segment, rows, bridge_light_ids))
+                    layout = ()
                 else:
-                    # Map the current step (0-359) to the theme's hue range
-                    progress = (current_step % 360) / 360.0
-                    current_hue = hue_start + (progress * hue_range)
+                    scene_segment = None
+                
+                # Stage the frame for all selected lights, one batch per bridge. Lights are turned on
+                # as part of the frame; the commit skips it if they're already on.
+                for output, bridge_light_ids, rows in layout:
+                    if table.light_ids is not None:
+                        # Every light has its own color: take the bridge's rows of this step's column in one go
+                        hue_value, saturation_value, brightness_value = table.light_frames(step, rows)
+                        if audio is not None:
+                            hue_value, brightness_value = apply_audio(hue_value, brightness_value, audio, params)
+                    elif after_jump:
+                        # A queued jump back to the start of the hue range must land before the next fade replaces it
+                        bridge_light_ids = [light_id for light_id in bridge_light_ids
+                                            if not output.scheduler.busy(light_id)]
+                    
+                    output.frame_commit.stage_many(
+                        bridge_light_ids,
+                        transitiontime=transitiontime,
+                        on=True,
+                        hue=hue_value,
+                        sat=saturation_value,
+                        bri=brightness_value
+                    )
                 
-                # Calculate brightness based on min/max settings
-                # We'll use a sine wave to smoothly transition between min and max brightness
-                brightness_range = max_brightness - min_brightness
-                brightness_offset = (math.sin(current_step * math.pi / 180) + 1) / 2  # 0 to 1
-                current_brightness = min_brightness + (brightness_offset * brightness_range)
+                compute_done = time.perf_counter()
                 
-                # Convert values to Philips Hue format
-                hue_value = int((current_hue / 360) * 65535)
-                brightness_value = int((current_brightness / 100) * 254)  # Convert percentage to 0-254
+                # Audio in to light commands answered by the bridge is measured by the scheduler, for
+                # the commands of the first frame that follows each analyzed chunk
+                captured = None
+                if audio is not None and audio.captured != last_audio_captured:
+                    captured = last_audio_captured = audio.captured
                 
-                # Set the light state for all selected lights
-                for light_id in selected_lights:
-                    try:
-                        if light_id in available_lights:
-                            light = available_lights[light_id]['object']
-                            light.transitiontime = int(transition_time * 10)  # Philips Hue uses 1/10 of a second as the unit
-                            light.hue = hue_value
-                            light.saturation = 254  # 254 = 100% saturation for vibrant colors
-                            light.brightness = brightness_value
-                    except Exception as e:
-                        logger.error(f"Error updating light {light_id}: {e}")
+                # Send one request per light, skipping lights whose state hasn't changed, to every bridge.
+                # Commands that can't reach the bridge before the next frame (or keyframe) are abandoned.
+                requests_sent = commit_frame(deadline=deadline, captured=captured)
+                commit_done = time.perf_counter()
                 
-                # Increment the step
-                current_step = (current_step + 1) % 360
+                # Send the fields that changed to connected clients, at most STATE_TICK_MAX_RATE times a second
+                emit_state(rate_limited=True)
                 
-                # Emit the current state to connected clients
-                emit_state()
+                FRAME_COMPUTE_SECONDS.observe(compute_done - frame_start)
+                FRAME_BRIDGE_IO_SECONDS.observe(commit_done - compute_done)
+                FRAME_EMIT_SECONDS.observe(time.perf_counter() - commit_done)
+                
+                # Trade step rate for transition time if the bridge is falling behind (or has caught up).
+                # While following audio the frames don't line up with steps, and in scene mode the light
+                # commands are scene calls paced on their own, so the step rate is left alone
+                adapt = audio is None and table.scenes is None
+                if adapt:
+                    frame_rate.record_frame(requests_sent)
+                if adapt and frame_rate.update(params.full_cycle_time):
+                    rebuild_frame_table()
+                    logger.info(f"Adaptive frame rate: {frame_table.steps} steps per cycle, "
+                                f"transition time {frame_table.transitiontime / 10}s")
+                    emit_state()
+            
+            # Wait for the next frame's due time; if we're running late, skip ahead instead of slowing down
+            # Following audio, frames come at least every AUDIO_FRAME_TIME however long the steps are
+            interval = frame_table.step_time
+            if audio_analyzer is not None:
+                interval = min(interval, AUDIO_FRAME_TIME)
+            frame_clock.set_interval(interval)
+            advanced = frame_clock.wait()
             
-            # Sleep for the calculated step time
-            time.sleep(step_time)
+            # Increment the step
+            if not light_show_paused and lights.selected:
+                if interval == frame_table.step_time:
+                    current_step += advanced
+                else:
+                    step_fraction += advanced * interval / frame_table.step_time
+                    steps = int(step_fraction)
+                    step_fraction -= steps
+                    current_step += steps
+                if current_step >= steps_per_cycle:
+                    current_step %= steps_per_cycle
+                    frame_clock.cycle_completed()
             
     except Exception as e:
         logger.error(f"Error in light show thread: {e}")
+        LIGHT_SHOW_ERRORS.inc()
         light_show_running = False
 
 
-def emit_state():
-    """Emit the current state to all connected clients."""
-    # Prepare light information
+def stage_timeline_records(records, layout):
+    """Stage a frame's timeline records on the bridges. Light slots are the selected lights, in order."""
+    # Records for every light: the last one of the frame wins
+    all_lights = records[records['light'] == ALL_LIGHTS]
+    if len(all_lights):
+        record = all_lights[-1]
+        for output, bridge_light_ids, rows in layout:
+            output.frame_commit.stage_many(
+                bridge_light_ids,
+                transitiontime=record['transitiontime'].item(),
+                on=True,
+                hue=record['hue'].item(),
+                sat=record['sat'].item(),
+                bri=record['bri'].item()
+            )
+    
+    # Per-light records, one batch per bridge
+    slot_records = records[records['light'] != ALL_LIGHTS]
+    if not len(slot_records):
+        return
+    slots = slot_records['light']
+    for output, bridge_light_ids, rows in layout:
+        if isinstance(rows, slice):
+            output_records = slot_records[slots < len(bridge_light_ids)]
+            output_slots = output_records['light']
+        else:
+            # Map the show's light slots to this bridge's position in its own light list
+            positions = np.searchsorted(rows, slots)
+            found = (positions < len(rows)) & (rows[np.minimum(positions, len(rows) - 1)] == slots)
+            output_records = slot_records[found]
+            output_slots = positions[found]
+        if not len(output_records):
+            continue
+        
+        output.frame_commit.stage_many(
+            [bridge_light_ids[slot] for slot in output_slots.tolist()],
+            transitiontime=output_records['transitiontime'].tolist(),
+            on=True,
+            hue=output_records['hue'].tolist(),
+            sat=output_records['sat'].tolist(),
+            bri=output_records['bri'].tolist()
+        )
+
+
+def run_timeline_show():
+    """Play the loaded timeline in a separate thread, starting over when it ends."""
+    global light_show_running, current_hue, current_brightness, current_saturation, current_color
+    global frame_clock
+    
+    if not lights.selected:
+        logger.error("No lights selected for the light show")
+        light_show_running = False
+        return
+    
+    show = timeline
+    player = TimelinePlayer(show)
+    logger.info(f"Playing timeline {show.name} ({show.duration:.1f}s, {len(show)} records) on {len(lights.selected)} lights")
+    
+    # Records are read from the mapped file as they come due, so playback starts right away
+    frame_clock = FrameClock(TIMELINE_FRAME_TIME)
+    position = 0.0  # Seconds into the show
+    was_paused = False
+    
+    try:
+        while light_show_running:
+            if light_show_paused:
+                was_paused = True
+            else:
+                # Check if we have any selected lights
+                if not lights.selected:
+                    logger.warning("No lights selected, waiting for selection")
+                    time.sleep(1)
+                    frame_clock.reset()
+                    continue
+                
+                # Don't count the time spent paused as lateness
+                if was_paused:
+                    frame_clock.reset()
+                    was_paused = False
+                
+                frame_start = time.perf_counter()
+                layout = get_staging_layout()[1]
+                records = player.advance(position)
+                if len(records):
+                    stage_timeline_records(records, layout)
+                    
+                    # Preview the last record of the frame
+                    current_hue = round(records[-1]['hue'].item() / 65535 * 360, 2)
+                    current_brightness = round(records[-1]['bri'].item() / 254 * 100, 2)
+                    current_saturation = round(records[-1]['sat'].item() / 254 * 100, 2)
+                    current_color = hue_to_rgb(current_hue)
+                compute_done = time.perf_counter()
+                
+                # Timeline records are sent once, so they're never dropped for being late
+                commit_frame()
+                commit_done = time.perf_counter()
+                
+                # Send the fields that changed to connected clients, at most STATE_TICK_MAX_RATE times a second
+                emit_state(rate_limited=True)
+                
+                FRAME_COMPUTE_SECONDS.observe(compute_done - frame_start)
+                FRAME_BRIDGE_IO_SECONDS.observe(commit_done - compute_done)
+                FRAME_EMIT_SECONDS.observe(time.perf_counter() - commit_done)
+            
+            # Wait for the next frame's due time; if we're running late, skip ahead instead of slowing down
+            advanced = frame_clock.wait()
+            
+            if not light_show_paused and lights.selected:
+                position += advanced * TIMELINE_FRAME_TIME
+                if player.finished and position >= show.duration:
+                    position = max(0.0, position - show.duration)
+                    player.rewind()
+                    frame_clock.cycle_completed()
+    
+    except Exception as e:
+        logger.error(f"Error in timeline playback thread: {e}")
+        LIGHT_SHOW_ERRORS.inc()
+        light_show_running = False
+
+
+def build_lights_info(selection):
+    """Build the lights inventory sent to clients."""
+    selected = set(selection.selected)
     lights_info = {}
-    for light_id, light_data in available_lights.items():
+    for light_id, light_data in selection.available.items():
         lights_info[light_id] = {
             'id': light_id,
             'name': light_data['name'],
             'type': light_data['type'],
-            'selected': light_id in selected_lights
+            'model': light_data['productname'],
+            'selected': light_id in selected
         }
+    return lights_info
+
+
+def build_light_states():
+    """Build the on/off and reachability of every light, as last read or pushed by the bridges."""
+    light_states = {}
+    for light_id, (output, bridge_light_id) in lights.outputs.items():
+        state = output.shadow.states.get(bridge_light_id, {})
+        light_states[light_id] = {'on': state.get('on'), 'reachable': state.get('reachable', True)}
+    return light_states
+
+
+def build_light_health():
+    """Build the lights whose commands keep failing: {light ID: {'state', 'failures'}}.
     
+    A light with an open breaker is being skipped; a half-open one is being retried.
+    """
+    namespaced = len(bridge_outputs) > 1
+    light_health = {}
+    for output in bridge_outputs:
+        for bridge_light_id, health in output.health.report().items():
+            light_health[light_key(output.name, bridge_light_id, namespaced)] = health
+    return light_health
+
+
+def build_engine_info(params):
+    """Build the engine settings sent to clients: the step rate and transition time actually in use."""
+    engine = {
+        'adaptive': frame_rate.enabled if frame_rate is not None else ADAPTIVE_FRAME_RATE,
+        'keyframes': params.keyframes,
+        'keyframe_tolerance': params.keyframe_tolerance,
+        'scenes': params.scenes
+    }
+    table = frame_table
+    if table is not None:
+        engine['steps'] = table.steps
+        engine['step_rate'] = round(1 / table.step_time, 2)
+        engine['transition_time'] = table.transitiontime / 10
+        if table.keyframes is not None:
+            engine['keyframes_per_cycle'] = len(table.keyframes)
+        if table.scenes is not None:
+            engine['scenes_per_cycle'] = len(table.scenes)
+            engine['scenes_stored'] = sum(output.scenes.stats()['scenes'] for output in bridge_outputs)
+    return engine
+
+
+def build_state(include_lights=True):
+    """Build the full state sent to clients."""
+    params = show_params
+    selection = lights
     state = {
         'running': light_show_running,
         'paused': light_show_paused,
         'hue': current_hue,
         'brightness': current_brightness,
         'saturation': current_saturation,
-        'color': hue_to_rgb(current_hue),
-        'min_brightness': min_brightness,
-        'max_brightness': max_brightness,
-        'transition_time': transition_time,
-        'full_cycle_time': full_cycle_time,
-        'lights': lights_info,
-        'selected_lights': selected_lights,
-        'theme': current_theme,
-        'hue_start': hue_start,
-        'hue_end': hue_end
+        'color': current_color,
+        'min_brightness': params.min_brightness,
+        'max_brightness': params.max_brightness,
+        'transition_time': params.transition_time,
+        'full_cycle_time': params.full_cycle_time,
+        'selected_lights': list(selection.selected),
+        'light_states': build_light_states(),
+        'light_health': build_light_health(),
+        'theme': params.theme,
+        'hue_start': params.hue_start,
+        'hue_end': params.hue_end,
+        'effect': params.effect,
+        'timeline': timeline.info() if timeline is not None else None,
+        'audio': audio_analyzer.info() if audio_analyzer is not None else None,
+        'scheduler': combined_stats(bridge_outputs) if bridge_outputs else None,
+        'timing': frame_clock.stats() if frame_clock is not None else None,
+        'engine': build_engine_info(params)
     }
-    socketio.emit('state_update', state)
+    
+    # The inventory is the largest part of the state, so only build it when asked for
+    if include_lights:
+        state['lights'] = build_lights_info(selection)
+    
+    return state
+
+
+def _broadcast_changes():
+    """Broadcast the fields that changed since the last broadcast. Call with broadcast_lock held."""
+    global broadcast_lights_version, last_tick_time
+    
+    # The version is read before the state is built: a newer inventory meanwhile just goes out again next time
+    version = lights.version
+    state = build_state(include_lights=(version != broadcast_lights_version))
+    tick = {key: value for key, value in state.items()
+            if key not in broadcast_state or broadcast_state[key] != value}
+    
+    broadcast_state.update(tick)
+    broadcast_lights_version = version
+    last_tick_time = time.monotonic()
+    
+    if tick:
+        broadcaster.publish('state_tick', tick)
+
+
+def emit_state(rate_limited=False):
+    """Send the state fields that changed to all connected clients as a compact state_tick.
+    
+    The tick is only queued here; the broadcaster sends it from its own task. With rate_limited
+    set, the update is skipped if the last one went out less than 1/STATE_TICK_MAX_RATE seconds
+    ago; the skipped changes go out with the next one.
+    """
+    if rate_limited and time.monotonic() - last_tick_time < 1.0 / STATE_TICK_MAX_RATE:
+        return
+    
+    with broadcast_lock:
+        _broadcast_changes()
+
+
+def snapshot_state():
+    """Build the full state for a client that joins or has fallen behind."""
+    with broadcast_lock:
+        # Bring everyone up to date first, so later ticks apply cleanly on top of the snapshot
+        _broadcast_changes()
+        return build_state()
+
+
+def emit_snapshot(sid):
+    """Send the full state to one client, ahead of any further ticks."""
+    broadcaster.resync(sid)
 
 
 def start_light_show():
@@ -394,7 +1121,7 @@ def start_light_show():
     if light_show_thread is None or not light_show_thread.is_alive():
         light_show_running = True
         light_show_paused = False
-        light_show_thread = threading.Thread(target=run_light_show)
+        light_show_thread = threading.Thread(target=run_timeline_show if timeline is not None else run_light_show)
         light_show_thread.daemon = True
         light_show_thread.start()
         logger.info("Light show started")
@@ -427,12 +1154,13 @@ def pause_light_show():
 
 def set_manual_color(hue, brightness, saturation):
     """Set a manual color when the light show is paused."""
-    global current_hue, current_brightness, current_saturation
+    global current_hue, current_brightness, current_saturation, current_color
     
     if light_show_running and light_show_paused:
         current_hue = hue
         current_brightness = brightness
         current_saturation = saturation
+        current_color = hue_to_rgb(hue)
         
         # Convert values to Philips Hue format
         hue_value = int((hue / 360) * 65535)
@@ -440,15 +1168,17 @@ def set_manual_color(hue, brightness, saturation):
         saturation_value = int((saturation / 100) * 254)  # Convert percentage to 0-254
         
         # Set the light state for all selected lights
-        for light_id in selected_lights:
-            try:
-                light = available_lights[light_id]['object']
-                light.transitiontime = 1  # Quick transition
-                light.hue = hue_value
-                light.saturation = saturation_value
-                light.brightness = brightness_value
-            except Exception as e:
-                logger.error(f"Error setting manual color for light {light_id}: {e}")
+        selection = lights
+        for light_id in selection.selected:
+            output, bridge_light_id = selection.outputs[light_id]
+            output.frame_commit.stage(
+                bridge_light_id,
+                transitiontime=1,  # Quick transition
+                hue=hue_value,
+                sat=saturation_value,
+                bri=brightness_value
+            )
+        commit_frame()
         
         logger.info(f"Manual color set: Hue={hue}, Brightness={brightness}%, Saturation={saturation}%")
         emit_state()
@@ -456,33 +1186,117 @@ def set_manual_color(hue, brightness, saturation):
 
 def set_brightness_range(min_value, max_value):
     """Set the brightness range for the light show."""
-    global min_brightness, max_brightness
+    min_value = max(0, min(100, min_value))
+    max_value = max(min_value, min(100, max_value))
+    params = update_show_params(min_brightness=min_value, max_brightness=max_value)
     
-    min_brightness = max(0, min(100, min_value))
-    max_brightness = max(min_brightness, min(100, max_value))
-    
-    logger.info(f"Brightness range set: {min_brightness}% - {max_brightness}%")
+    logger.info(f"Brightness range set: {params.min_brightness}% - {params.max_brightness}%")
+    rebuild_frame_table()
     emit_state()
 
 
 def set_speed(transition_time_value, full_cycle_time_value):
     """Set the speed parameters for the light show."""
-    global transition_time, full_cycle_time
+    # Validate transition time (0.1 to 10 seconds) and full cycle time (5 to 300 seconds)
+    params = update_show_params(
+        transition_time=max(0.1, min(10, transition_time_value)),
+        full_cycle_time=max(5, min(300, full_cycle_time_value))
+    )
+    
+    logger.info(f"Speed set: Transition time = {params.transition_time}s, Full cycle time = {params.full_cycle_time}s")
+    rebuild_frame_table()
+    emit_state()
+
+
+def set_engine_options(adaptive=None, keyframes=None, tolerance=None, scenes=None):
+    """Set the light show engine options. Options left as None are unchanged."""
+    if adaptive is not None and frame_rate is not None:
+        frame_rate.set_enabled(bool(adaptive))
+        logger.info(f"Adaptive frame rate {'enabled' if adaptive else 'disabled'}")
+    
+    if keyframes is not None:
+        update_show_params(keyframes=bool(keyframes))
+        logger.info(f"Keyframe mode {'enabled' if keyframes else 'disabled'}")
+    
+    if tolerance is not None:
+        # Validate the tolerance (0.1 to 30 degrees of hue or percentage points of brightness)
+        params = update_show_params(keyframe_tolerance=max(0.1, min(30, float(tolerance))))
+        logger.info(f"Keyframe tolerance set: {params.keyframe_tolerance}")
+    
+    if scenes is not None:
+        update_show_params(scenes=bool(scenes))
+        logger.info(f"Scene mode {'enabled' if scenes else 'disabled'}")
+        if not scenes:
+            # Free the bridge's scene storage once the show has moved off the scenes
+            for output in bridge_outputs:
+                output.scheduler.submit_call('scene_clear', output.scenes.clear)
+    
+    rebuild_frame_table()
+    emit_state()
+
+
+def set_effect(effect_name):
+    """Set how the colors are spread across the selected lights."""
+    # Validate effect name
+    if effect_name not in EFFECTS:
+        logger.warning(f"Invalid effect name: {effect_name}. Using default '{DEFAULT_EFFECT}' effect.")
+        effect_name = DEFAULT_EFFECT
+    
+    update_show_params(effect=effect_name)
+    logger.info(f"Effect set: {effect_name}")
+    rebuild_frame_table()
+    emit_state()
+
+
+def compile_timeline(name, cycles):
+    """Compile the current show settings (theme, brightness, speed and effect) into a named timeline."""
+    # Validate cycles (1 to 10000)
+    cycles = max(1, min(10000, int(cycles)))
+    table = rebuild_frame_table()
+    compiled = compile_table_timeline(timeline_path(name), table, cycles)
+    logger.info(f"Compiled timeline {compiled.name}: {cycles} cycles, {len(compiled)} records")
+    return compiled
+
+
+def set_timeline(name):
+    """Play a named timeline instead of the live show, or go back to the live show if name is empty."""
+    global timeline
     
-    # Validate and set transition time (0.1 to 10 seconds)
-    transition_time = max(0.1, min(10, transition_time_value))
+    loaded = Timeline(timeline_path(name)) if name else None
+    
+    # Restart a running show so it picks up the new source
+    was_running = light_show_running
+    if was_running:
+        stop_light_show()
+        if light_show_thread is not None:
+            light_show_thread.join(timeout=5)
+    
+    timeline = loaded
+    logger.info(f"Playing timeline {timeline.name}" if timeline is not None else "Playing the live show")
+    
+    if was_running:
+        start_light_show()
+    emit_state()
+
+
+def set_audio_source(spec):
+    """Make the light show follow audio from a source spec (see open_audio_source), or stop if spec is empty."""
+    global audio_analyzer
     
-    # Validate and set full cycle time (5 to 300 seconds)
-    full_cycle_time = max(5, min(300, full_cycle_time_value))
+    analyzer = None
+    if spec:
+        analyzer = AudioAnalyzer(open_audio_source(spec))
+        analyzer.start()
     
-    logger.info(f"Speed set: Transition time = {transition_time}s, Full cycle time = {full_cycle_time}s")
+    previous, audio_analyzer = audio_analyzer, analyzer
+    if previous is not None:
+        previous.stop()
+    logger.info(f"Following audio from {spec}" if spec else "Audio input off")
     emit_state()
 
 
 def set_theme(theme_name, hue_start_value, hue_end_value):
     """Set the color theme for the light show."""
-    global current_theme, hue_start, hue_end
-    
     # Validate theme name
     valid_themes = ["rainbow", "warm", "cold", "forest", "sunset", "ocean", "funky"]
     if theme_name not in valid_themes:
@@ -497,12 +1311,11 @@ def set_theme(theme_name, hue_start_value, hue_end_value):
     if hue_start_value > hue_end_value:
         hue_start_value, hue_end_value = hue_end_value, hue_start_value
     
-    # Set the theme
-    current_theme = theme_name
-    hue_start = hue_start_value
-    hue_end = hue_end_value
+    # Set the theme and its hue range together, so the show never sees one without the other
+    params = update_show_params(theme=theme_name, hue_start=hue_start_value, hue_end=hue_end_value)
     
-    logger.info(f"Theme set: {current_theme} (Hue range: {hue_start}° - {hue_end}°)")
+    logger.info(f"Theme set: {params.theme} (Hue range: {params.hue_start}° - {params.hue_end}°)")
+    rebuild_frame_table()
     emit_state()
 
 
@@ -513,12 +1326,41 @@ def index():
     return render_template('index.html')
 
 
+@app.after_request
+def record_first_response(response):
+    """Measure how long the process took to answer its first web request."""
+    global first_response_time
+    
+    if first_response_time is None:
+        first_response_time = time.monotonic() - PROCESS_START
+        STARTUP_SECONDS.set(first_response_time)
+        if first_response_time > STARTUP_TARGET:
+            logger.warning(f"First response {first_response_time:.2f}s after start (target {STARTUP_TARGET}s)")
+        else:
+            logger.info(f"First response {first_response_time:.2f}s after start")
+    return response
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Serve metrics in the Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
 # SocketIO events
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection."""
     logger.info("Client connected")
-    emit_state()
+    CONNECTED_CLIENTS.inc()
+    emit_snapshot(request.sid)
+
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    """Handle client disconnection."""
+    logger.info("Client disconnected")
+    CONNECTED_CLIENTS.dec()
 
 
 @socketio.on('start')
@@ -600,28 +1442,28 @@ def handle_set_selected_lights(data):
         if success:
             return {
                 'status': 'success',
-                'message': f"Successfully updated light selection to {len(selected_lights)} lights",
-                'selected_count': len(selected_lights)
+                'message': f"Successfully updated light selection to {len(lights.selected)} lights",
+                'selected_count': len(lights.selected)
             }
         else:
             if not light_ids:
                 return {
                     'status': 'error',
                     'message': "No lights were selected",
-                    'selected_count': len(selected_lights)
+                    'selected_count': len(lights.selected)
                 }
             else:
                 return {
                     'status': 'error',
                     'message': "No valid lights were found in your selection",
-                    'selected_count': len(selected_lights)
+                    'selected_count': len(lights.selected)
                 }
     except Exception as e:
         logger.error(f"Error in handle_set_selected_lights: {e}")
         return {
             'status': 'error',
             'message': f"Server error: {str(e)}",
-            'selected_count': len(selected_lights)
+            'selected_count': len(lights.selected)
         }
 
 
@@ -650,19 +1492,128 @@ def handle_set_theme(data):
     return {'status': 'success', 'message': f"Theme set to {theme}"}
 
 
+@socketio.on('set_effect')
+def handle_set_effect(data):
+    """Handle set effect event."""
+    effect = data.get('effect', DEFAULT_EFFECT)
+    set_effect(effect)
+    return {'status': 'success', 'message': f"Effect set to {show_params.effect}"}
+
+
+@socketio.on('compile_timeline')
+def handle_compile_timeline(data):
+    """Handle compile timeline event."""
+    name = data.get('name')
+    if not name:
+        return {'status': 'error', 'message': "A timeline name is required"}
+    
+    try:
+        compiled = compile_timeline(name, data.get('cycles', 1))
+    except (OSError, TimelineError, ValueError) as e:
+        logger.error(f"Error compiling timeline {name}: {e}")
+        return {'status': 'error', 'message': str(e)}
+    return {'status': 'success', 'timeline': compiled.info()}
+
+
+@socketio.on('load_timeline')
+def handle_load_timeline(data):
+    """Handle load timeline event."""
+    name = data.get('name')
+    try:
+        set_timeline(name)
+    except (OSError, TimelineError) as e:
+        logger.error(f"Error loading timeline {name}: {e}")
+        return {'status': 'error', 'message': str(e)}
+    return {'status': 'success'}
+
+
+@socketio.on('set_audio_source')
+def handle_set_audio_source(data):
+    """Handle set audio source event."""
+    source = data.get('source')
+    try:
+        set_audio_source(source)
+    except AudioError as e:
+        logger.error(f"Error opening audio source {source}: {e}")
+        return {'status': 'error', 'message': str(e)}
+    return {'status': 'success'}
+
+
+@socketio.on('set_engine_options')
+def handle_set_engine_options(data):
+    """Handle set engine options event."""
+    adaptive = data.get('adaptive')
+    keyframes = data.get('keyframes')
+    tolerance = data.get('keyframe_tolerance')
+    scenes = data.get('scenes')
+    set_engine_options(adaptive, keyframes, tolerance, scenes)
+    return {'status': 'success'}
+
+
+def start_engine(bridge_connections, event_streams=None):
+    """Set up an output per bridge and load the lights, ready to run the light show.
+    
+    bridge_connections is a list of (name, bridge) pairs, as from get_bridge_connections().
+    Bridges named in event_streams ({name: secure}, as from get_event_streams()) are followed
+    through their event stream instead of polled.
+    """
+    global bridge_outputs, frame_rate
+    
+    bridge_outputs = [BridgeOutput(name, bridge) for name, bridge in bridge_connections]
+    for output in bridge_outputs:
+        if output.name in (event_streams or {}):
+            output.event_stream = EventStream(
+                output.bridge.ip, output.bridge.username,
+                lambda events, output=output: apply_bridge_events(output, events),
+                lambda reconnected, output=output: resync_bridge(output, reconnected),
+                secure=event_streams[output.name]
+            )
+    frame_rate = AdaptiveFrameRate([output.scheduler for output in bridge_outputs], enabled=ADAPTIVE_FRAME_RATE)
+    
+    # The lights are loaded first, so bridge events always find them in the inventory
+    from_cache = get_all_lights()
+    for output in bridge_outputs:
+        output.start()
+    sync_bridge_groups()
+    
+    # Serve from the cached inventory right away and check it against the bridges in the background
+    if from_cache:
+        thread = threading.Thread(target=refresh_inventory, name='inventory-refresh')
+        thread.daemon = True
+        thread.start()
+
+
+def stop_engine():
+    """Stop the light show and release the bridge outputs."""
+    # Make sure to stop the light show thread
+    if light_show_running:
+        stop_light_show()
+    
+    if audio_analyzer is not None:
+        set_audio_source(None)
+    
+    # Stop sending queued commands, then remove the temporary groups from the bridges
+    for output in bridge_outputs:
+        output.stop()
+
+
 def main():
     """Main function to run the Hue light show with web interface."""
-    global bridge
+    parser = argparse.ArgumentParser(description="Hue light show with web interface.")
+    parser.add_argument('--audio', help="Follow audio from wav:PATH, stdin or alsa:DEVICE")
+    parser.add_argument('--non-interactive', action='store_true',
+                        help="Never prompt on the terminal (the default when not run from one)")
+    args = parser.parse_args()
+    interactive = not args.non_interactive and sys.stdin.isatty()
     
     try:
-        # Step 1: Get bridge connection
-        bridge = get_bridge_connection()
-        
-        # Step 2: Get all available lights
-        get_all_lights(bridge)
+        # Step 1: Get bridge connection and all available lights
+        start_engine(get_bridge_connections(interactive), get_event_streams())
+        if args.audio:
+            set_audio_source(args.audio)
         
-        # Step 3: Start the web server
-        logger.info("Starting web server on http://localhost:3000")
+        # Step 2: Start the web server
+        logger.info(f"Starting web server on http://localhost:3000 ({SERVER_MODE} mode)")
         socketio.run(app, host='0.0.0.0', port=3000, debug=False)
         
     except KeyboardInterrupt:
@@ -670,9 +1621,7 @@ def main():
     except Exception as e:
         logger.error(f"Error: {e}")
     finally:
-        # Make sure to stop the light show thread
-        if light_show_running:
-            stop_light_show()
+        stop_engine()
 
 
 if __name__ == "__main__":
@@ -15,6 +15,7 @@ pip install flask==2.0.1
 pip install werkzeug==2.0.1
 pip install flask-socketio==5.1.1
 pip install phue==1.1
+pip install "numpy>=1.21"
 
 # Run the web controller
 python hue_web_controller.py
\ No newline at end of file
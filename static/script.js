@@ -7,6 +7,8 @@ const colorPreview = document.getElementById('colorPreview');
 const statusValue = document.getElementById('statusValue');
 const currentColor = document.getElementById('currentColor');
 const currentBrightness = document.getElementById('currentBrightness');
+const cycleTiming = document.getElementById('cycleTiming');
+const stepRate = document.getElementById('stepRate');
 
 const startBtn = document.getElementById('startBtn');
 const pauseBtn = document.getElementById('pauseBtn');
@@ -23,6 +25,9 @@ const fullCycleTime = document.getElementById('fullCycleTime');
 const transitionTimeValue = document.getElementById('transitionTimeValue');
 const fullCycleTimeValue = document.getElementById('fullCycleTimeValue');
 const applySpeedBtn = document.getElementById('applySpeedBtn');
+const adaptiveRate = document.getElementById('adaptiveRate');
+const keyframeMode = document.getElementById('keyframeMode');
+const sceneMode = document.getElementById('sceneMode');
 
 const hueSlider = document.getElementById('hueSlider');
 const brightnessSlider = document.getElementById('brightnessSlider');
@@ -38,6 +43,7 @@ const applyLightsBtn = document.getElementById('applyLightsBtn');
 
 const themeOptions = document.getElementById('themeOptions');
 const applyThemeBtn = document.getElementById('applyThemeBtn');
+const effectSelect = document.getElementById('effectSelect');
 
 // State variables
 let isRunning = false;
@@ -92,6 +98,24 @@ applySpeedBtn.addEventListener('click', () => {
     });
 });
 
+adaptiveRate.addEventListener('change', () => {
+    socket.emit('set_engine_options', {
+        adaptive: adaptiveRate.checked
+    });
+});
+
+keyframeMode.addEventListener('change', () => {
+    socket.emit('set_engine_options', {
+        keyframes: keyframeMode.checked
+    });
+});
+
+sceneMode.addEventListener('change', () => {
+    socket.emit('set_engine_options', {
+        scenes: sceneMode.checked
+    });
+});
+
 // Theme selection
 themeOptions.addEventListener('click', (event) => {
     // Find the clicked theme option or its parent
@@ -131,6 +155,12 @@ applyThemeBtn.addEventListener('click', () => {
     });
 });
 
+effectSelect.addEventListener('change', () => {
+    socket.emit('set_effect', {
+        effect: effectSelect.value
+    });
+});
+
 applyColorBtn.addEventListener('click', () => {
     if (isRunning && isPaused) {
         socket.emit('set_color', {
@@ -241,7 +271,20 @@ socket.on('connect', () => {
     console.log('Connected to server');
 });
 
+// Full state from the server; state_tick messages only carry the fields that changed
+let currentState = {};
+
 socket.on('state_update', (state) => {
+    currentState = state;
+    applyState(currentState, true, true);
+});
+
+socket.on('state_tick', (tick) => {
+    Object.assign(currentState, tick);
+    applyState(currentState, 'lights' in tick || 'selected_lights' in tick, 'light_states' in tick || 'light_health' in tick);
+});
+
+function applyState(state, lightsChanged, lightStatesChanged) {
     isRunning = state.running;
     isPaused = state.paused;
     
@@ -250,8 +293,8 @@ socket.on('state_update', (state) => {
     updateControlButtons();
     updateManualControls();
     
-    // Update lights information
-    if (state.lights) {
+    // Update lights information (only re-render when the inventory or selection changed)
+    if (lightsChanged && state.lights) {
         console.log("Received state update with lights:", state.lights);
         console.log("Selected lights from server:", state.selected_lights);
         
@@ -291,6 +334,11 @@ socket.on('state_update', (state) => {
         }
     }
     
+    // Mark lights that are off, unreachable (e.g. switched at the wall or from the Hue app) or not answering
+    if ((lightsChanged || lightStatesChanged) && state.light_states) {
+        updateLightStates(state.light_states, state.light_health || {});
+    }
+    
     // Update sliders with current values
     if (!isDragging) {
         minBrightness.value = state.min_brightness;
@@ -317,6 +365,11 @@ socket.on('state_update', (state) => {
         saturationValue.textContent = `${state.saturation}%`;
     }
     
+    // Update effect selection if available
+    if (state.effect) {
+        effectSelect.value = state.effect;
+    }
+    
     // Update theme selection if available
     if (state.theme) {
         // Find the theme option with the matching theme name
@@ -332,7 +385,7 @@ socket.on('state_update', (state) => {
             selectedTheme = state.theme;
         }
     }
-});
+}
 
 // Track if user is dragging sliders
 let isDragging = false;
@@ -373,6 +426,30 @@ function updateStatusUI(state) {
     // Update color and brightness text
     currentColor.textContent = state.color;
     currentBrightness.textContent = `${Math.round(state.brightness)}%`;
+    
+    // Update the actual cycle time and frame timing
+    if (state.timing) {
+        const actualCycle = state.timing.cycle_time !== null ? `${state.timing.cycle_time}s` : 'measuring...';
+        cycleTiming.textContent = `${actualCycle} of ${state.full_cycle_time}s ` +
+            `(late ${state.timing.lateness_avg_ms}ms avg, ${state.timing.skipped_frames} frames skipped)`;
+    }
+    
+    // Update the step rate and transition time the engine is actually using
+    if (state.engine) {
+        adaptiveRate.checked = state.engine.adaptive;
+        keyframeMode.checked = state.engine.keyframes;
+        sceneMode.checked = state.engine.scenes;
+        if (state.engine.scenes_per_cycle !== undefined) {
+            stepRate.textContent = `${state.engine.scenes_per_cycle} scenes per cycle ` +
+                `(${state.engine.scenes_stored} stored on the bridge)`;
+        } else if (state.engine.keyframes_per_cycle !== undefined) {
+            stepRate.textContent = `${state.engine.keyframes_per_cycle} keyframes per cycle ` +
+                `(within ${state.engine.keyframe_tolerance}° / ${state.engine.keyframe_tolerance}%)`;
+        } else if (state.engine.step_rate !== undefined) {
+            stepRate.textContent = `${state.engine.step_rate} steps/s (${state.engine.steps} per cycle, ` +
+                `${state.engine.transition_time}s transitions${state.engine.adaptive ? ', adaptive' : ''})`;
+        }
+    }
 }
 
 function updateControlButtons() {
@@ -441,6 +518,17 @@ function hslToHex(h, s, l) {
 }
 
 // Function to render the available lights
+function updateLightStates(lightStates, lightHealth) {
+    document.querySelectorAll('.light-item').forEach(lightItem => {
+        const lightState = lightStates[lightItem.dataset.lightId];
+        const unreachable = !!lightState && lightState.reachable === false;
+        lightItem.classList.toggle('light-off', !!lightState && lightState.on === false);
+        lightItem.classList.toggle('light-unreachable', unreachable);
+        // A light the show is skipping because its commands keep failing
+        lightItem.classList.toggle('light-failing', !unreachable && lightItem.dataset.lightId in lightHealth);
+    });
+}
+
 function renderLights() {
     // Clear the container
     lightsContainer.innerHTML = '';